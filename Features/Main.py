@@ -1,5 +1,13 @@
 import streamlit as st
 import pandas as pd
+import uuid
+import plotly.express as px
+
+from authormetrix import (PipelineCache, PIPELINE_CACHE_MAX_ENTRIES, PIPELINE_CACHE_MAX_MB, PIPELINE_WORKERS, content_hash, contents_hash, load_or_preprocess_corpus, build_credit_cube,
+                         compute_author_metrics_from_cube, compute_all_author_metrics, top_authors, record_stages, run_stage, stage_table,
+                         rank_displacement_table, summarize_rank_displacement, compare_populations, compute_author_year_metrics,
+                         build_coauthorship_graph, coauthorship_metrics, coauthor_pairs, VIEW_PAGE_SIZES, sorted_rows, number_of_pages, page_rows,
+                         table_csv, table_parquet, JobRunner)
 
 
 
@@ -12,328 +20,223 @@ st.write("""
          """)
 st.markdown("""<hr style="height:4px;border:none;color:#fe8100;background-color:#fe8100;" />""", unsafe_allow_html=True)
 
-#STEP 1 STARTS
-st.markdown ("### STEP 1")
-st.markdown ("**Upload the corpus to be analyzed (*Scopus download*), from which authors' metrics will be obtained.**")
-raw_corpus = st.file_uploader ("", type = [".csv"])
-
-
-
-#Function to preprocess the uploaded corpus file
-def corpus_preprocess (df):
-  first_corpus = pd.read_csv(df)
-  #1.1  Makes sure essential columns do not have empty cells, then renames essential author columns
-  corpus01 = first_corpus.dropna(subset = ['Author(s) ID', 'Document Type', 'Year'])
-  corpus02 = corpus01.drop_duplicates(subset = ['Author(s) ID', 'Title', 'Source title','Year'])
-  corpus03 = corpus02.rename (columns= {'Author(s) ID': 'Authors_ID', 'Document Type': 'Document_Type'})
-  corpus = corpus03[['EID', 'Authors', 'Author full names', 'Authors_ID', 'Title', 'Year','Source title', 'Document_Type']].copy()
-  #1.2  Converts "Author_ID" with ";" to standard list. Pay close attention to this as it may break the code if Scopus changes their format
-  corpus['Authors_ID_list'] = corpus['Authors_ID'].apply(lambda x: [int(ID.strip()) for ID in x.split(';')])
-  #1.3  Calculates number of authors
-  corpus['authorcount'] = corpus['Authors_ID_list'].apply(len)
-  #1.4  Creates a column for the first author ID
-  corpus['first_author'] = corpus['Authors_ID_list'].apply(lambda x: x[0])
-  #1.5  Creates a column for the last author ID, which applies only to non-single-author publications. Last author is last element of each list
-  corpus['last_author'] = corpus['Authors_ID_list'].apply(lambda x: x[-1] if len(x) !=1 else 0) #There was a an abnormal behavior with conversion to integer. 
- 
-
-  return corpus, first_corpus
-
-
-
-#CORPUS FUNCTION 2: FRACTIONAL CREDIT SCHEMAS
-#Adds the 3 types of fractional credit allocation schema to the corpus
-def calculate_3_fractional_credit_schemes (corpus):
-  #2.1  equal fractional credit
-  corpus['fractional_credit_EQ'] = 1/corpus['authorcount']
-
-  #2.2  Last author emphasis (LAE) then equal credits for all preceding authors
-  def calculate_fractional_LAE (n):
-    if n == 1:
-      return [1.0]
-    else:
-      last_LAE = 0.5
-      other_LAE = [(0.5)/(n-1) for _ in range(n-1)]
-      return other_LAE + [last_LAE]
-  corpus['fractional_credit_LAE'] = corpus['authorcount'].apply(calculate_fractional_LAE)
-
-  #2.3  First author emphasis (FAE) then equal credits thereafter
-  def calculate_fractional_FAE (n):
-    if n == 1:
-      return [1.0]
-    else:
-      first_FAE = 0.5
-      other_FAE = [(0.5)/(n-1) for _ in range(n-1)]
-      return [first_FAE] + other_FAE
-  corpus['fractional_credit_FAE'] = corpus['authorcount'].apply(calculate_fractional_FAE)
-
-  #2.3  First and last authors emphasis (FLAE) then equal credits thereafter; first and last author get at least 0.4 credits
-  #This is exactly consistent with Credit13_Abramo et al 2013 from Xu et al., 2016
-  def calculate_fractional_FLAE (n):
-    if n == 1:
-      return [1.0]
-    elif n == 2:
-      first_FLAE = 0.5
-      last_FLAE = 0.5
-      return [first_FLAE] + [last_FLAE]
-    elif n > 2:
-      first_FLAE = 0.4
-      last_FLAE = 0.4
-      other_FLAE = [(0.2)/(n-2) for _ in range(n-2)]
-      return [first_FLAE] + other_FLAE + [last_FLAE]
-
-  corpus['fractional_credit_FLAE'] = corpus['authorcount'].apply(calculate_fractional_FLAE)
-
-  return corpus
-
-#CORPUS FUNCTION 3 : HARMONIC CREDIT SCHEMAS
-#Adds the 3 types of harmonic credit allocation schema to the corpus
-def calculate_3_harmonic_credit_schemes (corpus):
-  # Function to calculate the harmonic credits according to the order of authors for a given number of authors of an article
-
-  #3.1  Harmonic credit alocation based on the standard schema
-  def calculate_harmonic_standard(n):
-    credits_std = [1 / (i + 1) for i in range(n)] #numerator in formula, i.e 1/r for each position
-    total_credits_std = sum(credits_std) # sum of all reciprocals of each position, i.e 1/1 + 1/2 + 1/3 +...1/N. The nature of this formula needs "normalization"
-    normalized_credits_std = [credit / total_credits_std for credit in credits_std]
-    return normalized_credits_std
-
-  corpus['harmonic_credit_STD'] = corpus['authorcount'].apply(calculate_harmonic_standard)
-
-  #3.2  TRUE Harmonic parabolic credit alocation based on the correct formula for the harmonic parabolic schema that I came up with since Sundlin 2023 is neither harmonic nor parabolic.
-  def calculate_harmonic_parabolic(n):
-    symetrical_harmonic_credits = [1 / min((i + 1), (n+1-(i+1))) for i in range(n)] #I intentionaly did not further simplify the formula 
-    #but kept the standard python i+1 in the second expression inside the min() method; it could have been (n-i)
-    total_symetrical_harmonic_credits = sum(symetrical_harmonic_credits) # sum of all credits; needed for normalization to 1
-    normalized_credits_par = [credit / total_symetrical_harmonic_credits for credit in symetrical_harmonic_credits]
-    return normalized_credits_par
-
-  corpus['harmonic_credit_PAR'] = corpus['authorcount'].apply(calculate_harmonic_parabolic)
-
-  #Called Arithmetic_V because this formular (originally from Aziz and Rozing, 2013) named harmonic parabolic by Sundling, 2023 turns out to be neither harmonic nor parabolic.
-  def calculate_arithmetic_V(n):
-    # Calculate the harmonic series for the middle authors
-    h_par_denominator_even = (0.5*(n**2)) + (n)
-    h_par_denominator_odd = (0.5*(n**2)) + (n*(1-(1/(2*n))))
-    if n % 2 == 0:
-      normalized_credits_par = [(1 + abs(n+1-(2*(i+1))))/h_par_denominator_even for i in range (n)]
-    else:
-      normalized_credits_par = [(1 + abs(n+1-(2*(i+1))))/h_par_denominator_odd for i in range (n)]
-    return normalized_credits_par
-  
-  corpus['arithmetic_credit_V'] = corpus['authorcount'].apply(calculate_arithmetic_V)
-
-  #3.3  Harmonic credit alocation with first and last author emphasis.
-  #This is different from parabolic which is symmetric around the middle; here, first and last authors get more credits than in harmonic_parabolic. Normalization necessary; makes the formula simpler
- 
-  def calculate_harmonic_FLAE(n):
-      if n == 1:
-          return [1.0]
-      FLAE_credits = [1 / (i + 1) for i in range(n)]
-      FLAE_denominator = sum(FLAE_credits)
-      first_FLAE = [1.5/(2*FLAE_denominator)]
-      last_FLAE = [1.5/(2*FLAE_denominator)]
-      middle_FLAE = [(1 / (i + 2))/FLAE_denominator for i in range(1, n - 1)]
-      all_normalized_credits_FLAE = first_FLAE + middle_FLAE + last_FLAE
-      return all_normalized_credits_FLAE
-
-  corpus['harmonic_credit_FLAE'] = corpus['authorcount'].apply(calculate_harmonic_FLAE)
-
-  return corpus
-
-
-#CORPUS FUNCTION 4 : ARITHMETIC AND GEOMETRIC CREDIT SCHEMAS
-def calculate_arithmetic_and_geometric_credit_schemes (corpus):
-  
+#Every pipeline stage that runs for this page is timed; see the "Performance" expander at the bottom (and AUTHORMETRIX_STAGE_LOG for the log lines)
+stage_records = record_stages ()
 
-  #3.1  Arithmetic credit alocation: Credit03_proportional schema in Xu et al., 2016
-  def calculate_arithmetic(n):
-    credits_arithmetic = [(2 * (1-((i + 1)/(n+1))))/n for i in range(n)]
-    return credits_arithmetic
+#The optional steps and table views keep their settings across the runs that stop early, while a background job above them runs (see
+#background_result): Streamlit forgets the state of the widgets a run does not reach, unless it is assigned again at the start of every run
+def kept_widget (key, default, options = None):
+  st.session_state.setdefault('kept_widget_keys', set()).add(key)
+  value = st.session_state.get(key, default)
+  values = value if isinstance(value, list) else [value]
+  if key not in st.session_state or (options is not None and not all(item in options for item in values)):
+    st.session_state[key] = default
+  return key
 
-  corpus['arithmetic_credit'] = corpus['authorcount'].apply(calculate_arithmetic)
+for kept_key in st.session_state.get('kept_widget_keys', set()):
+  if kept_key in st.session_state:
+    st.session_state[kept_key] = st.session_state[kept_key]
 
-  #3.2 Based on the golden number. It somewhat prioritizes the first author (never less than 0.62); Assimakis & Adam 2010 eq #28; 
-  # another simpler formula(which I initially used) is available in Xu et al., J. Infor Sci. 2022 eq#11)
-  def calculate_golden_share(n):
-    if n == 1:
-      return [1]
-    elif n > 1:
-      credits_gold = [0.618**(2*(i+1)-1) for i in range(n-1)]
-      credits_gold_last = [0.618**(2*(n)-2)]
-      return credits_gold + credits_gold_last
-
-  corpus['golden_share_credit'] = corpus['authorcount'].apply(calculate_golden_share)
-
-
-  #3.3  Geometric credit alocation: Credit05_Geometric schema in Xu et al., 2016
-  def calculate_geometric(n):
-    credits_geometric = [(2 ** (n-(i+1)))/((2**n) - 1) for i in range(n)] 
-    return credits_geometric
-  
-  corpus['geometric_credit'] = corpus['authorcount'].apply(calculate_geometric)
- 
-
-  #3.4 Geometric with i:i+1 ratio adaptivity (2 in standard geometric regardless of total author number)
-  def calculate_geometric_adaptive(n):
-    if n == 1:
-      return [1.0]
-    else:
-      adaptive_denominator = (n**(n/(n-1)))-1
-      credits_geometric_a = [(n**(1/(n-1))-1)*n**((n-(i+1))/(n-1))/adaptive_denominator for i in range(n)]
-      return credits_geometric_a
-
-  corpus['geometric_credit_adaptive'] = corpus['authorcount'].apply(calculate_geometric_adaptive)
-  
-  def calculate_harmonic_lab(n):
-    if n == 1:
-      return [1.0]
-    elif n == 2:
-      return [0.5659, 0.4341]
+#STEP 1 STARTS
+st.markdown ("### STEP 1")
+st.markdown ("**Upload the corpus to be analyzed (*Scopus download*), from which authors' metrics will be obtained.**  \nScopus exports at most 20,000 documents per file; upload all the files of a larger corpus together. They are merged, and duplicates across files are removed.")
+raw_corpus = st.file_uploader ("", type = [".csv"], accept_multiple_files = True)
+
+
+
+#The pipeline cache is shared by all reruns and sessions of the app
+@st.cache_resource
+def get_pipeline_cache ():
+  return PipelineCache(PIPELINE_CACHE_MAX_ENTRIES, PIPELINE_CACHE_MAX_MB * 1024**2)
+
+#The long computations run as background jobs (see authormetrix/jobs.py), shared by all sessions and keyed by their pipeline cache key: a widget
+#rerun, or another user asking for the same result, follows the running job instead of starting it again, and the page stays responsive. While a job
+#runs, the rest of the page waits for it, and its progress is polled every JOB_POLL_SECONDS with a Cancel button. Cancel only detaches this session
+#(kept in its 'detached_jobs'): the job goes on while other sessions follow it, and stops otherwise. A job that finishes within JOB_WAIT_SECONDS (e.g. the metrics summed from the credit cube) is shown in the same run, without a progress
+#bar. Once done, its result is in the pipeline cache, and its stages are shown in the "Performance" expander of the run that collects it
+JOB_POLL_SECONDS = 1
+JOB_WAIT_SECONDS = 1
+
+@st.cache_resource
+def get_job_runner ():
+  return JobRunner()
+
+#Identifies this session among the followers of a job
+def job_session_id ():
+  return st.session_state.setdefault('job_session_id', uuid.uuid4().hex)
+
+def background_result (pipeline_cache, key, compute, label, expected_stages = None):
+  found, value = pipeline_cache.lookup(key)
+  if found:
+    return value
+  job_runner = get_job_runner()
+  job = job_runner.submit(key, lambda: pipeline_cache.get_or_compute(key, compute), label, expected_stages)
+  detached_jobs = st.session_state.setdefault('detached_jobs', set())
+  if key not in detached_jobs:
+    job.follow(job_session_id())
+    job.wait(JOB_WAIT_SECONDS)
+  if job.status == 'done':
+    detached_jobs.discard(key)
+    job_runner.discard(key)
+    stage_records.extend(job.stage_records)
+    return job.result
+  if job.is_finished or key in detached_jobs:
+    if job.status == 'failed':
+      st.error (f"{label} failed: {job.error}")
     else:
-      # Calculate harmonic credits for middle authors
-      credits = [1 / i for i in range(1, n)]
-      penultimate = credits[-1]
-      # Compute the un-normalized credit for the last author using the formula
-      last_author_credit = penultimate * (((n-2)*0.5226)+0.5643)
-      credits.append(last_author_credit)
-      # Normalize middle author credits
-      total = sum(credits)
-      normalized_credits = [cred / total for cred in credits]
-
-      return normalized_credits
-
-  corpus['harmonic_lab_credit'] = corpus['authorcount'].apply(calculate_harmonic_lab)
-
-  return corpus
-
-
-
-
-#SCID FUNCTION 1
-def extract_whole_and_straight_counts(corpus, scids_df):
-  #S1.1
-  #Instruction would have the Scopus IDs to be in the first column; so I rename whatever the first column is to 'scids'
-  scids_df = scids_df.rename(columns={scids_df.columns[0]: 'scids'})
-  
-  #S1.2
-  #Extracts whole counts; the number of appearances (authorships) of each scid
-  #Flattens the Authors_ID_list, to a single list where scids can appear multiple times and from which we do the count of appearances
-  flattened_Authors_ID_list = [item for sublist in corpus['Authors_ID_list'] for item in sublist]
-  #The flattened column is converted to a series, value_counts done and index reset, to make it a dataframe that can be left_joined with the original scids_df dataframe
-  id_counts = pd.Series(flattened_Authors_ID_list).value_counts().reset_index()
-  #names the columns in the id_counts dataframe
-  id_counts.columns = ['scids', 'whole_fullcount']
-  #left-joins id_counts with scids_df, fill rows for scids that are not found with zeros, and then convert the 'whole_credit_fullcount' column to integers
-  scids_df = scids_df.merge(id_counts, on='scids', how='left').fillna(0)
-  scids_df['whole_fullcount'] = scids_df['whole_fullcount'].astype(int)
-
-  #S1.3
-  #Extract straight credits for first and last authors
-  #Initialize counts
-  scids_df['straight_firstauthor'] = 0
-  scids_df['straight_lastauthor'] = 0
-  # Loop through scids
-  for scid in scids_df['scids']:
-    # Count matches in authorsid.
-    first_pubs = (corpus['first_author']== scid).sum()
-    last_pubs = (corpus['last_author']== scid).sum()
-    # Update columns
-    scids_df.loc[scids_df['scids']==scid, 'straight_firstauthor'] += first_pubs
-    scids_df.loc[scids_df['scids']==scid, 'straight_lastauthor'] += last_pubs
-  return scids_df
-
-def extract_fractional_standard(corpus, scids_df):
-    # Explode the author_list column in corpus
-    corpus = corpus [['Authors_ID_list', 'fractional_credit_EQ']]
-    corpus_exploded = corpus.explode('Authors_ID_list').reset_index(drop=True)
-
-    # Create a dictionary to store the sum of scores for each scid
-    score_dict = corpus_exploded.groupby('Authors_ID_list')['fractional_credit_EQ'].sum().to_dict()
-
-    # Create the scid_score column in df2
-    scids_df['fractional_equal'] =  scids_df['scids'].apply(lambda x: score_dict.get(x, 0))
-
-    return scids_df
-
-
-
-def extract_allocation_sum(corpus, scids_df, allocation_col, sum_col):
-    # Create a dictionary in 'corpus' where each author in 'Authors_ID_list' is paired with corresponding value in 'allocation_type1'
-    corpus['author_allocation_dict'] = corpus.apply(
-        lambda row: dict(zip(row['Authors_ID_list'], row[allocation_col])) if isinstance(row[allocation_col], list) else {}, axis=1
-    )
-
-    # Expand the author_allocation_dict to a new DataFrame for easy summation
-    author_allocations = pd.DataFrame(
-        [(author, alloc) for d in corpus['author_allocation_dict'] for author, alloc in d.items()],
-        columns=['scids', sum_col]
-    )
-
-    # Group by 'scids' and sum the allocations for each author ID
-    allocation_sum = author_allocations.groupby('scids')[sum_col].sum().reset_index()
-
-    # Merge the summed allocations with the original scids_df, filling missing values with 0
-    scids_df = scids_df.merge(allocation_sum, on='scids', how='left').fillna({sum_col: 0})
-
-    return scids_df
-
-def Multiplex_extract_allocation_sum(corpus, scids_df, column_pairs):
-    for original_col, new_col in column_pairs:
-        scids_df = extract_allocation_sum(corpus, scids_df, original_col, new_col)
-    return scids_df
-
-
-#Collaboration Functions
-def count_one_author_publications (corpus, scids_df):
-  #Filter the corpus to only single-author documents, i.e when authorcount ==1
-  corpus_single_author = corpus.query ('authorcount == 1').copy() #the copy was necessary to avoid the 'SettingWithCopyWarning'
-  #This step was necessary to avoid using "isin", so each single author was first pulled out as an integer to get a perfect matches
-  corpus_single_author['one_author'] = corpus_single_author['Authors_ID_list'].apply(lambda x: x[0])
-  #Initialize counts
-  scids_df['single_author_publications'] = 0
-  # Loop through scids
-  for scid in scids_df['scids']:
-    one_author_pubs = len(corpus_single_author.query ("one_author == @scid"))
-    # Update columns
-    scids_df.loc[scids_df['scids']==scid, 'single_author_publications'] += one_author_pubs
-  return scids_df
-
-
-
-def calculate_collaborations_DC_CI_CC (corpus, scids_df):
-  #DC - from scids_df only
-  scids_df['degree_of_collaboration'] = ((scids_df['whole_fullcount'] - scids_df['single_author_publications'])/scids_df['whole_fullcount'])#.fillna(0)
-  #CI - i.e average NAPD of multi_author publications only (from both dataframes)
-  corpus['Authors_ID_list'] = corpus['Authors_ID_list'].apply(lambda x: [int(i) for i in x])
-  #scids_df['scids'] = scids_df['scids'].astype(int) scids are already integer froms
-  scids_df['collaboration_index'] = [corpus[(corpus['Authors_ID_list']
-                                             .apply(lambda x: person in x)) & (corpus['authorcount'] > 1)]['authorcount'].mean() for person in scids_df['scids']]
-  scids_df['collaboration_coefficient'] = (1 - (scids_df['fractional_equal']/scids_df['whole_fullcount']))#.fillna(0)
-  #Is it better for these metrics to be just NaN rather than 0, for individuals who have zero publications? NaN seems reasonable as there is no collaboration when there is no publication.
-  return scids_df
-
-
-def find_unique_coauthors (corpus, scids_df):
-  corpus['Authors_ID_list'] = corpus['Authors_ID_list'].apply(lambda x: [int(i) for i in x])
-  #scids_df['scids'] = scids_df['scids'].astype(int)
-  scids_df['all_coauthors_(list)'] = [[coauthor for sublist in corpus[corpus['Authors_ID_list'].apply(lambda x: person in x)]['Authors_ID_list'] for coauthor in sublist] for person in scids_df['scids']]
-  scids_df['unique_coauthors_(set)'] = scids_df['all_coauthors_(list)'].apply(lambda x: set(x))
-  scids_df['number_of_unique_COauthors_temp'] = scids_df['unique_coauthors_(set)'].apply(lambda x: len(x)-1)
-  #To avoid negative values for authors with no coauthors (i.e all papers are sigle-authored)
-  scids_df['number_of_unique_COauthors'] = scids_df['number_of_unique_COauthors_temp'].apply(lambda x: 0 if x < 0 else x)
-  scids_df = scids_df.drop (columns = ['all_coauthors_(list)', 'unique_coauthors_(set)', 'number_of_unique_COauthors_temp'], axis = 1)
-  return scids_df
-
-
-
-if raw_corpus is not None:
+      st.warning (f"{label} was cancelled." + ("" if job.is_finished or job.cancel_requested.is_set() else " It goes on for the other users following it."))
+    if st.button (f"Run again: {label}", key = f"job_restart_{label}"):
+      detached_jobs.discard(key)
+      job_runner.submit(key, lambda: pipeline_cache.get_or_compute(key, compute), label, expected_stages, restart = True)
+      st.rerun()
+  else:
+    show_job_progress (job)
+  st.stop()
+
+@st.fragment(run_every = JOB_POLL_SECONDS)
+def show_job_progress (job):
+  #The whole page reruns once the job is over, to show its result
+  if job.is_finished:
+    st.rerun()
+  job.follow(job_session_id())
+  st.progress (job.progress(), text = job.describe())
+  if st.button ("Cancel", key = f"job_cancel_{job.label}", disabled = job.cancel_requested.is_set()):
+    job.cancel(job_session_id())
+    st.session_state.setdefault('detached_jobs', set()).add(job.key)
+    st.rerun()
+  if job.cancel_requested.is_set():
+    st.caption ("Cancelling: the job stops at its next stage or progress report.")
+
+
+
+#Tables are shown one page at a time, sorted on the server, so the browser only receives one page of rows whatever the size of the table. table_key
+#identifies the table in the pipeline cache, where its sort orders and download files are kept (computed once per table); view names the widgets.
+#page_of (optional) builds the displayed rows from their positions in the table, e.g. the corpus preview with its list-valued columns
+ORIGINAL_ORDER = "(original order)"
+
+def show_table (pipeline_cache, table_key, table, view, file_name = None, page_of = None):
+  col1, col2, col3, col4 = st.columns([3,1,1,1], gap="small")
+  sort_columns = [ORIGINAL_ORDER] + list(table.columns)
+  sort_by = col1.selectbox ("Sort by", sort_columns, key = kept_widget (f'{view}_sort', ORIGINAL_ORDER, sort_columns))
+  ascending = col2.selectbox ("Order", ["Descending", "Ascending"], key = kept_widget (f'{view}_order', "Descending"), disabled = sort_by == ORIGINAL_ORDER) == "Ascending"
+  page_size = col3.selectbox ("Rows per page", VIEW_PAGE_SIZES, key = kept_widget (f'{view}_page_size', VIEW_PAGE_SIZES[0], VIEW_PAGE_SIZES))
+  pages = number_of_pages (len(table), page_size)
+  #The page number starts again from 1 when the number of pages changes
+  page = col4.number_input (f"Page (of {pages})", min_value = 1, max_value = pages, key = kept_widget (f'{view}_page_{pages}', 1, range(1, pages + 1)))
+  if sort_by == ORIGINAL_ORDER:
+    rows = sorted_rows (table)
+  else:
+    rows = pipeline_cache.get_or_compute(('sorted_rows',) + table_key + (sort_by, ascending), lambda: sorted_rows (table, sort_by, ascending))
+  rows = page_rows (rows, page, page_size)
+  st.dataframe (table.iloc[rows] if page_of is None else page_of (rows))
+  st.caption (f"Rows {(page - 1) * page_size + 1 if len(rows) else 0}–{(page - 1) * page_size + len(rows)} of {len(table)}")
+  if file_name is not None:
+    download_buttons (pipeline_cache, table_key, table, view, file_name)
+
+#CSV and Parquet files of a whole table, serialized once and served through download buttons (not as part of the page)
+def download_buttons (pipeline_cache, table_key, table, view, file_name):
+  col1, col2 = st.columns(2, gap="small")
+  col1.download_button ("Download the full table (CSV)", pipeline_cache.get_or_compute(('csv',) + table_key, lambda: table_csv (table)),
+                        file_name = f'{file_name}.csv', mime = 'text/csv', key = f'{view}_csv')
+  col2.download_button ("Download the full table (Parquet)", pipeline_cache.get_or_compute(('parquet',) + table_key, lambda: table_parquet (table)),
+                        file_name = f'{file_name}.parquet', mime = 'application/vnd.apache.parquet', key = f'{view}_parquet')
+
+
+
+#STEP 4: rank displacement (ARD) and actual contribution proportions (ACP) of the analysed population under every schema, optionally side by side with
+#a second uploaded list of IDs (each population is ranked within itself). Only the per-schema summaries and one page of the per-author table are
+#sent to the browser, so this stays interactive for populations of 100k+ authors
+
+def show_rank_displacement (pipeline_cache, cube, scids_df, population_key, population_label, doctype, years):
+  st.markdown("""<hr style="height:4px;border:none;color:#fe8100;background-color:#fe8100;" />""", unsafe_allow_html=True)
+  st.markdown ("### STEP 4")
+  if not st.checkbox ("**OPTIONAL: Rank displacement (ARD) and actual contribution proportions (ACP) under every schema**", key = kept_widget ('rank_displacement_shown', False)):
+    return
+  analysis = pipeline_cache.get_or_compute(('rank_displacement',) + population_key, lambda: rank_displacement_table (scids_df))
+  st.write (summarize_rank_displacement (analysis))
+  st.markdown ('*Authors are ranked by whole count and by every schema (rank 1 is the highest; tied authors share the best rank). ARD is the absolute difference between an author\'s schema rank and whole count rank; ACP is the schema credit divided by the whole count. Authors without documents in the specified corpus are left out.*')
+  with st.expander (f"Per-author ranks, ARD and ACP ({len(analysis)} authors)"):
+    show_table (pipeline_cache, ('rank_displacement',) + population_key, analysis, 'rank_displacement', 'authormetrix_rank_displacement')
+  comparison_file = st.file_uploader ("Optional: upload a second list of Scopus IDs (first column) to compare the two populations side by side", type = [".csv"])
+  if comparison_file is not None:
+    comparison_key = population_key[:4] + (content_hash(comparison_file),)
+    comparison_df = pipeline_cache.get_or_compute(('metrics',) + comparison_key, lambda: compute_author_metrics_from_cube (cube, pd.read_csv (comparison_file), doctype, years))
+    comparison = pipeline_cache.get_or_compute(('rank_displacement',) + comparison_key, lambda: rank_displacement_table (comparison_df))
+    st.write (compare_populations (analysis, comparison, (population_label, comparison_file.name)))
+    st.markdown ('*p25/p50 are the quartiles (p50 = median); the differences are second population minus first.*')
+
+
+
+#STEP 5: the STEP 3 metrics of the uploaded authors for every year of the selection (or every trailing window of years), from one grouped pass over the
+#selected documents, with the trajectory of one metric plotted for a few authors
+def show_yearly_metrics (pipeline_cache, corpus01, selection_mask, selection_key, scids_df, population_key):
+  st.markdown("""<hr style="height:4px;border:none;color:#fe8100;background-color:#fe8100;" />""", unsafe_allow_html=True)
+  st.markdown ("### STEP 5")
+  if not st.checkbox ("**OPTIONAL: Yearly metrics of every author (time series)**", key = kept_widget ('yearly_shown', False)):
+    return
+  window = st.number_input ("Rolling window (years); 1 gives the metrics of each year on its own", min_value = 1, max_value = 50, key = kept_widget ('yearly_window', 1, range(1, 51)))
+  corpus = pipeline_cache.get_or_compute(('schemas',) + selection_key, lambda: corpus01.select(selection_mask))
+  yearly_df = background_result(pipeline_cache, ('yearly',) + population_key + (int(window),),
+                                lambda: run_stage (compute_author_year_metrics, corpus, scids_df[['scids']], int(window), True, PIPELINE_WORKERS), "Yearly metrics", 1)
+  show_table (pipeline_cache, ('yearly',) + population_key + (int(window),), yearly_df, 'yearly', 'authormetrix_yearly_metrics')
+  st.markdown('*One row per author and year, years without documents included.' + (f' Each row covers the {int(window)} years up to and including its Year (from window_start at the start of the corpus).' if window > 1 else '') + '*')
+  metric_columns = list(yearly_df.columns[yearly_df.columns.get_loc('whole_fullcount'):])
+  col1, col2 = st.columns([1,2], gap="small")
+  metric = col1.selectbox ("Metric to plot", metric_columns, key = kept_widget ('yearly_metric', 'fractional_equal', metric_columns))
+  authors = col2.multiselect ("Authors to plot", scids_df['scids'].tolist(), key = kept_widget ('yearly_authors', scids_df['scids'].head(5).tolist(), set(scids_df['scids'])))
+  fig = px.line(yearly_df[yearly_df['scids'].isin(authors)], x='Year', y=metric, color='scids', markers = True)
+  st.plotly_chart(fig, use_container_width=True)
+
+
+
+#STEP 6: co-authorship network of the uploaded authors, from the graph of the selected documents (built once per selection): co-authors and joint
+#papers, collaboration within the list (internal) and outside it (external), and ego-network sizes
+def show_coauthorship_network (pipeline_cache, corpus01, selection_mask, selection_key, scids_df, population_key):
+  st.markdown("""<hr style="height:4px;border:none;color:#fe8100;background-color:#fe8100;" />""", unsafe_allow_html=True)
+  st.markdown ("### STEP 6")
+  if not st.checkbox ("**OPTIONAL: Co-authorship network metrics**", key = kept_widget ('network_shown', False)):
+    return
+  graph = background_result(pipeline_cache, ('graph',) + selection_key, lambda: run_stage (build_coauthorship_graph, corpus01, selection_mask.to_numpy()),
+                            "Building the co-authorship graph", 1)
+  network_df = background_result(pipeline_cache, ('network',) + population_key, lambda: coauthorship_metrics (graph, scids_df[['scids']]), "Network metrics")
+  show_table (pipeline_cache, ('network',) + population_key, network_df, 'network', 'authormetrix_network_metrics')
+  st.markdown ('*degree: unique co-authors; joint_papers: papers shared with each co-author, summed over the co-authors; max_joint_papers: papers shared with the most frequent co-author; repeat_coauthors: co-authors with 2 or more joint papers; internal/external: co-authors in / not in the uploaded list; ego_network_size: authors within two co-authorship steps (co-authors and their co-authors).*')
+  with st.expander ("Co-authorship ties within the uploaded list"):
+    internal_ties = pipeline_cache.get_or_compute(('internal_ties',) + population_key, lambda: coauthor_pairs (graph, scids_df[['scids']], internal_only = True))
+    show_table (pipeline_cache, ('internal_ties',) + population_key, internal_ties, 'internal_ties', 'authormetrix_internal_ties')
+    st.markdown ('*Every tie is listed once for each of its two authors.*')
+  author = st.selectbox ("Co-authors of one author", scids_df['scids'].tolist(), key = kept_widget ('network_author', scids_df['scids'].iloc[0], set(scids_df['scids'])))
+  #'internal' is whether the co-author is in the uploaded list
+  author_ties = pipeline_cache.get_or_compute(('author_ties',) + population_key + (author,),
+                                              lambda: coauthor_pairs (graph, pd.DataFrame({'scids': [author]})).assign(internal = lambda ties: ties['coauthor_scids'].isin(scids_df['scids'])))
+  show_table (pipeline_cache, ('author_ties',) + population_key + (author,), author_ties, 'author_ties', f'authormetrix_coauthors_{author}')
+
+
+
+if raw_corpus:
   
-  st.write ("File uploaded successfully!")
-  corpus01, first_corpus = corpus_preprocess (raw_corpus)
+  st.write ("File uploaded successfully!" if len(raw_corpus) == 1 else f"{len(raw_corpus)} files uploaded successfully!")
+  pipeline_cache = get_pipeline_cache()
+  corpus_key = contents_hash(raw_corpus)
+  #The credit schemas are expanded once for the whole corpus (and kept on disk); STEP 2 then only selects documents with their credits
+  corpus01, number_of_raw_docs = background_result(pipeline_cache, ('preprocess', corpus_key), lambda: load_or_preprocess_corpus (raw_corpus, corpus_key),
+                                                   "Preprocessing the corpus", 6)
+  #Per-author sums for every (year, document type) cell, so that STEP 2 filter changes do not re-run the pipeline
+  cube = background_result(pipeline_cache, ('cube', corpus_key), lambda: run_stage (build_credit_cube, corpus01), "Building the credit cube", 2)
   numberofdocs = len(corpus01)
-  number_of_docs_removed = len(corpus01) - len(first_corpus)
+  number_of_docs_removed = number_of_raw_docs - numberofdocs
   st.markdown (f"**UPDATE**: After removing duplicates and rows with missing information in essential columns, there are **<u>{numberofdocs}</u>** documents in the corpus. \n **<u>{number_of_docs_removed}</u>** document(s) were excluded (for missing data in essential columns: Author(s) ID, Document Type, or Year).", unsafe_allow_html=True)
+  #Rows whose Author(s) ID could not be read are left out rather than stopping the upload; they can be downloaded with the reason for each
+  #Rows, exclusions and parsing time of every uploaded file (the files are parsed concurrently)
+  with st.expander ("Row counts and parsing times per file"):
+    st.write (corpus01.sources)
+  if len(corpus01.rejects) > 0:
+    st.warning (f"{len(corpus01.rejects)} of the excluded document(s) had a malformed Author(s) ID (non-numeric or empty IDs, a trailing ';', or a number of IDs that does not match the number of author names).")
+    st.download_button ("Download the excluded rows (CSV)", corpus01.rejects.to_csv(index=False).encode('utf-8'), file_name='authormetrix_rejected_rows.csv', mime='text/csv')
+  #An upload without any usable document (only a header, or every row excluded) cannot be analysed
+  if numberofdocs == 0:
+    st.error ("None of the uploaded rows could be used, so there is nothing to analyse. Check that the file(s) are Scopus csv exports with the Author(s) ID, Document Type and Year columns filled in.")
+    st.stop()
   
 
   
@@ -342,17 +245,17 @@ if raw_corpus is not None:
   #STEP 2 STARTS: Optional user input to select document type and/or publication years to analyze
   st.markdown ("### STEP 2")
   st.markdown ("**OPTIONAL: Select <u>document type</u> and/or <u>publication year(s)</u> to include in the analysis.  \n The document types most commonly included in analysis are **<u>Articles & Reviews**.</u>", unsafe_allow_html=True)
-  document_types = corpus01['Document_Type'].unique()
+  document_types = corpus01.docs['Document_Type'].unique()
   doctype = st.multiselect('', document_types, default=document_types)
-  corpus01_doctype = corpus01.query('`Document_Type`.isin(@doctype)')
+  doctype_mask = corpus01.docs['Document_Type'].isin(doctype)
 
 
-  Years = corpus01_doctype['Year'].unique()
+  Years = corpus01.docs.loc[doctype_mask, 'Year'].unique()
 
   Years_selected = st.slider (label = "Drag the lower and upper end of the slider to set the range of publication years to include in the analysis.", min_value = min (Years), max_value = max (Years), value = (min (Years), max (Years)), step = 1)
   Years_selected = list(Years_selected)
-  corpus01_doctype = corpus01_doctype [corpus01_doctype ['Year'].between(Years_selected[0], Years_selected[1])]
-  doctype_Year_selection_lenght = len(corpus01_doctype)
+  selection_mask = doctype_mask & corpus01.docs['Year'].between(Years_selected[0], Years_selected[1])
+  doctype_Year_selection_lenght = int(selection_mask.sum())
 
   start_year = min(Years_selected)
   end_year = max(Years_selected)
@@ -361,81 +264,77 @@ if raw_corpus is not None:
   #STEP 2 ENDS
   
   st.markdown("""<hr style="height:4px;border:none;color:#fe8100;background-color:#fe8100;" />""", unsafe_allow_html=True)
-  # Final processing of the corpus with the 3 compound functions
-  
-  corpus = calculate_arithmetic_and_geometric_credit_schemes (corpus01_doctype)
-  corpus = calculate_3_fractional_credit_schemes (corpus)
-  corpus = calculate_3_harmonic_credit_schemes (corpus)
+  # The selected document types and years are part of the cache keys
+  selection_key = (corpus_key, tuple(sorted(str(doc_type) for doc_type in doctype)), int(start_year), int(end_year))
 
   
   
   
   #THIS WAS JUST FOR DEBUGGING, BUT EVERYTHING WORKS FINE; perhaps I'll just keep this feature in the code for now
-  if st.button ("Preview pre-processed corpus"):
-    st.write(corpus)
+  #The selected documents, with the credits of the 3 compound functions already expanded, are only needed for the preview. It is sorted on the
+  #documents' own columns, and only the documents of the page shown get their list-valued author ID and credit columns
+  if st.checkbox ("Preview pre-processed corpus", key = kept_widget ('corpus_preview_shown', False)):
+    corpus = pipeline_cache.get_or_compute(('schemas',) + selection_key, lambda: corpus01.select(selection_mask))
+    show_table (pipeline_cache, ('schemas',) + selection_key, corpus.docs, 'corpus', page_of = corpus.to_dataframe)
 
   st.markdown("""<hr style="height:4px;border:none;color:#fe8100;background-color:#fe8100;" />""", unsafe_allow_html=True)
   
   
   #STEP 3 STARTS
   st.markdown ("### STEP 3")
-  st.markdown ("**Upload the csv file with the list of author Scopus IDs to be analysed. <u>IDs must be in the first column of the worksheet; only one ID per row.**</u>" ,unsafe_allow_html=True)
-  scids_df = st.file_uploader (".", type = [".csv"])
-  
-  
-  
-  if scids_df is not None:
-
-    st.write ("File uploaded successfully!")
-    scids_df = pd.read_csv (scids_df)
-    #We need to rename the first column to 'ID' from whatever the user labelled it
-    first_column = scids_df.columns[0]
-    scids_df = scids_df.rename(columns={first_column: 'ID'})
-    #we also need to remove duplicates as I have found that this messes with results if an ID shows up more than once.
-    scids_df = scids_df.drop_duplicates(subset =['ID'], keep='first')
-
-    
-    
-    scids_df = extract_whole_and_straight_counts(corpus, scids_df)
-    scids_df = extract_fractional_standard (corpus, scids_df)
-
-
-    column_pairs = [
-    ('fractional_credit_LAE', 'fractional_LAE'), 
-    ('fractional_credit_FAE', 'fractional_FAE'),
-    ('fractional_credit_FLAE', 'fractional_FLAE'),
-    ('arithmetic_credit', 'arithmetic_standard'),
-    ('arithmetic_credit_V', 'arithmetic_V'),
-    ('golden_share_credit', 'golden_share'),
-    ('geometric_credit', 'geometric_standard'),
-    ('geometric_credit_adaptive', 'geometric_adaptive'),
-    ('harmonic_credit_STD', 'harmonic_standard'),
-    ('harmonic_credit_FLAE', 'harmonic_FLAE'),
-    ('harmonic_credit_PAR', 'harmonic_parabolic'),
-    ('harmonic_lab_credit', 'harmonic_LAB')
-    ]
-
-    scids_df = Multiplex_extract_allocation_sum (corpus, scids_df, column_pairs)
-
-    #Calculate first and last author proportion. This is the percentage of publications where the author is the first author or last author relative to the total number of publications
-    scids_df['first_last_author_proportion'] = (scids_df['straight_firstauthor'] + scids_df['straight_lastauthor'])/scids_df['whole_fullcount']
-
-
-    #COLLABORATION STUFF
-    count_one_author_publications (corpus, scids_df)
-    scids_df = calculate_collaborations_DC_CI_CC (corpus, scids_df)
-    find_unique_coauthors (corpus, scids_df)
-    scids_df = scids_df.drop (columns = ['number_of_unique_COauthors_temp', 'all_coauthors_(list)', 'unique_coauthors_(set)'], axis = 1)
-    
-    
-    st.write (scids_df)
-    st.markdown('*To download the results, hover on the table and click the download button at the top right corner of the table.*')
+  analysis_mode = st.radio ("**Authors to analyse**", ["Uploaded list of Scopus IDs", "All authors in corpus"], horizontal = True, key = kept_widget ('analysis_mode', "Uploaded list of Scopus IDs"))
+
+
+
+  if analysis_mode == "All authors in corpus":
+    #Metrics of every author with at least one selected document, from one pass over the corpus; only a ranked top-K view is sent to the browser.
+    #The unique co-authors are counted in PIPELINE_WORKERS processes (AUTHORMETRIX_PIPELINE_WORKERS) when it is more than 1
+    all_authors_df = background_result(pipeline_cache, ('all_authors',) + selection_key, lambda: compute_all_author_metrics (cube, doctype, (start_year, end_year), PIPELINE_WORKERS),
+                                       "Metrics of all authors", 2)
+    st.markdown (f"**UPDATE**: **<u>{len(all_authors_df)}</u>** authors have at least one document in the specified corpus.", unsafe_allow_html=True)
+    metric_columns = list(all_authors_df.columns[1:])
+    col1, col2, col3 = st.columns([3,1,1], gap="small")
+    sort_by = col1.selectbox ("Rank authors by", metric_columns, key = kept_widget ('all_authors_sort', 'fractional_equal', metric_columns))
+    top_k = col2.number_input ("Top K authors", min_value = 1, max_value = 10000, key = kept_widget ('all_authors_top_k', 100, range(1, 10001)))
+    min_documents = col3.number_input ("Minimum whole count", min_value = 1, key = kept_widget ('all_authors_min_documents', 1))
+    st.write (top_authors (all_authors_df, sort_by, top_k, min_documents))
+    st.markdown('*Rank 1 is the highest value; the percentile is among the authors with at least the minimum whole count. The full table of all authors can be downloaded below, or written with the batch command line (python -m authormetrix --all-authors).*')
+    download_buttons (pipeline_cache, ('all_authors',) + selection_key, all_authors_df, 'all_authors', 'authormetrix_all_authors')
+    show_rank_displacement (pipeline_cache, cube, all_authors_df, selection_key + ('all_authors',), 'all authors', doctype, (start_year, end_year))
+    st.markdown("""<hr style="height:4px;border:none;color:#fe8100;background-color:#fe8100;" />""", unsafe_allow_html=True)
+    st.markdown ("*Thank you for using ***AuthormetriX***.    Kindly remember to cite the publication (full citation above).*",unsafe_allow_html=True)
 
+  else:
+    st.markdown ("**Upload the csv file with the list of author Scopus IDs to be analysed. <u>IDs must be in the first column of the worksheet; only one ID per row.**</u>" ,unsafe_allow_html=True)
+    scids_file = st.file_uploader (".", type = [".csv"])
 
-    st.markdown("""<hr style="height:4px;border:none;color:#fe8100;background-color:#fe8100;" />""", unsafe_allow_html=True)
 
-    st.markdown ("*Thank you for using ***AuthormetriX***.    Kindly remember to cite the publication (full citation above).*",unsafe_allow_html=True)
+
+    if scids_file is not None:
+
+      st.write ("File uploaded successfully!")
+      #Answered from the cube: moving the slider or changing the document types only sums the selected cells
+      scids_df = background_result(pipeline_cache, ('metrics',) + selection_key + (content_hash(scids_file),),
+                                   lambda: compute_author_metrics_from_cube (cube, pd.read_csv (scids_file), doctype, (start_year, end_year)), "Metrics of the uploaded authors", 2)
+
+
+      show_table (pipeline_cache, ('metrics',) + selection_key + (content_hash(scids_file),), scids_df, 'metrics', 'authormetrix_metrics')
+      show_rank_displacement (pipeline_cache, cube, scids_df, selection_key + (content_hash(scids_file),), scids_file.name, doctype, (start_year, end_year))
+      show_yearly_metrics (pipeline_cache, corpus01, selection_mask, selection_key, scids_df, selection_key + (content_hash(scids_file),))
+      show_coauthorship_network (pipeline_cache, corpus01, selection_mask, selection_key, scids_df, selection_key + (content_hash(scids_file),))
+
+
+      st.markdown("""<hr style="height:4px;border:none;color:#fe8100;background-color:#fe8100;" />""", unsafe_allow_html=True)
+
+      st.markdown ("*Thank you for using ***AuthormetriX***.    Kindly remember to cite the publication (full citation above).*",unsafe_allow_html=True)
 
 
 
-  
\ No newline at end of file
+#Wall time, peak memory and input/output rows of the pipeline stages run for this page. Results served from the pipeline cache are not recomputed, so
+#their stages only show up on the run that computed them
+with st.expander ("Performance"):
+  if stage_records:
+    st.write (stage_table (stage_records))
+    st.markdown ('*Peak memory is the peak of the whole app process during the stage (an upper bound when other stages ran at the same time, in other sessions or background jobs); input rows are documents of the corpus, output rows those of the result (documents, authors or cube cells).*')
+  else:
+    st.write ("No pipeline stage ran on this page update; all results came from the cache.")
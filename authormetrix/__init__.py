@@ -0,0 +1,28 @@
+#AuthormetriX pipeline, importable outside the Streamlit app (see Features/Main.py for the app, and cli.py for batch runs). The modules with a command
+#line of their own (cli, run by __main__.py, and incremental) are not imported here, so that `python -m` does not find them already imported; import
+#them directly, e.g. from authormetrix.incremental import apply_corpus_update
+from .instrumentation import (STAGE_COLUMNS, STAGE_LOG, configure_stage_logging, record_stages, stage_table, pipeline_stage, run_stage,
+                              ROWS_PER_REPORT, current_job, report_rows)
+from .corpus import (Corpus, UNKNOWN_AUTHOR, CORPUS_COLUMNS, CORPUS_CHUNK_ROWS, CORPUS_PARSE_WORKERS, REJECT_COLUMNS, parse_author_ids, read_corpus_file,
+                     corpus_preprocess, document_mask, select_documents)
+from .registry import (SCHEMA_REGISTRY, SCHEMA_NAMES, SCHEMA_KERNELS, CREDIT_COLUMN_PAIRS, CREDIT_TABLE_MAX_MB, CALCULATOR_MAX_AUTHORS, CreditTable,
+                       get_credit_table)
+from .schemas import (schema_weight_table, map_schema_weights, calculate_3_fractional_credit_schemes, calculate_3_harmonic_credit_schemes,
+                      calculate_arithmetic_and_geometric_credit_schemes, SCHEMAS_COUNTING_REPEATED_IDS,
+                      drop_repeated_author_credits, expand_credit_schemes)
+from .metrics import (AuthorIndex, build_author_index, aggregate_author_credits, values_of_codes, extract_whole_and_straight_counts, extract_fractional_standard,
+                      extract_allocation_sum, Multiplex_extract_allocation_sum, count_one_author_publications, calculate_collaborations_DC_CI_CC,
+                      find_unique_coauthors, count_all_unique_coauthors, concatenated_ranges, coauthor_pair_keys, long_byline_masks, long_byline_union_sizes,
+                      count_short_byline_coauthors, ADDITIVE_METRICS, unique_scids_table, metric_table_from_sums, compute_author_metrics)
+from .shards import (PIPELINE_WORKERS, ShardInputs, build_shard_inputs, author_shards, run_author_shards, compute_author_metrics_sharded,
+                     count_all_unique_coauthors_sharded)
+from .cube import (CreditCube, build_credit_cube, cube_metric_table, compute_author_metrics_from_cube, compute_all_author_metrics,
+                   top_authors)
+from .analysis import (RANK_BASELINE, ANALYSIS_SCHEMAS, rank_descending, rank_displacement_table, summarize_rank_displacement, compare_populations)
+from .timeseries import (windowed_corpus, author_year_corpus, compute_author_year_metrics)
+from .network import (CoauthorshipGraph, build_coauthorship_graph, NETWORK_COLUMNS, coauthorship_metrics, coauthor_pairs)
+from .jobs import (JOB_WORKERS, JOB_HISTORY, JOB_STATUSES, JobCancelled, PipelineJob, JobRunner)
+from .views import (VIEW_PAGE_SIZES, sorted_rows, number_of_pages, page_rows, table_csv, table_parquet)
+from .cache import (PipelineCache, PIPELINE_CACHE_MAX_ENTRIES, PIPELINE_CACHE_MAX_MB, CORPUS_CACHE_DIR, CORPUS_CACHE_MAX_ENTRIES,
+                    CORPUS_CACHE_MAX_MB, prune_corpus_cache, content_hash, contents_hash, file_hash,
+                    load_or_preprocess_corpus)
@@ -0,0 +1,73 @@
+#Rank displacement (ARD) and actual contribution proportions (ACP) of a population of authors, from the STEP 3 metric table, as in the use case of the
+#accompanying publication
+import pandas as pd
+import numpy as np
+
+from .registry import CREDIT_COLUMN_PAIRS
+
+
+
+#Every counting schema of the STEP 3 table is compared with the whole count: the two straight counts and the 13 credit-allocation schemas
+RANK_BASELINE = 'whole_fullcount'
+ANALYSIS_SCHEMAS = ['straight_firstauthor', 'straight_lastauthor'] + [sum_col for _, sum_col in CREDIT_COLUMN_PAIRS]
+SUMMARY_QUANTILES = [0.25, 0.5, 0.75]
+
+#Ranks of every column of a (authors x metrics) array at once, highest value first, with ties sharing the best rank (1, 2, 2, 4, ...; 'min' ranking as in
+#top_authors). One sort of the whole array, laid out as one contiguous row per metric; within each sorted row, a value's rank is the position where its
+#run of equal values starts (so the sort need not be stable)
+def rank_descending (values):
+  rows = np.ascontiguousarray(-values.T)
+  order = np.argsort(rows, axis=1)
+  sorted_rows = np.take_along_axis(rows, order, axis=1)
+  run_starts = np.ones(rows.shape, dtype=bool)
+  run_starts[:, 1:] = sorted_rows[:, 1:] != sorted_rows[:, :-1]
+  sorted_ranks = np.maximum.accumulate(np.where(run_starts, np.arange(rows.shape[1]), 0), axis=1) + 1
+  ranks = np.empty(rows.shape, dtype=np.int64)
+  np.put_along_axis(ranks, order, sorted_ranks, axis=1)
+  return ranks.T
+
+#Per-author analysis of the authors of scids_df (a STEP 3 table) with at least one document: the rank under the whole count and, for every schema, the
+#rank under that schema, the absolute rank displacement ARD = |schema rank - whole count rank|, and ACP = schema credit / whole count.
+#Ranks are within this population
+def rank_displacement_table (scids_df, schemas = ANALYSIS_SCHEMAS):
+  scids_df = scids_df[scids_df[RANK_BASELINE] > 0]
+  values = scids_df[[RANK_BASELINE] + schemas].to_numpy(dtype=np.float64)
+  ranks = rank_descending(values)
+  whole_counts = values[:, :1]
+  columns = {'scids': scids_df['scids'].to_numpy(), RANK_BASELINE: scids_df[RANK_BASELINE].to_numpy(), f'rank_{RANK_BASELINE}': ranks[:, 0]}
+  ard = np.abs(ranks[:, 1:] - ranks[:, :1])
+  acp = values[:, 1:] / whole_counts
+  for k, schema in enumerate(schemas):
+    columns[f'rank_{schema}'] = ranks[:, k + 1]
+    columns[f'ARD_{schema}'] = ard[:, k]
+    columns[f'ACP_{schema}'] = acp[:, k]
+  return pd.DataFrame(columns)
+
+#Mean, quartiles and maximum of ARD, and mean and quartiles of ACP, of every schema (one row per schema)
+def summarize_rank_displacement (analysis_df, schemas = ANALYSIS_SCHEMAS):
+  summary = pd.DataFrame({'schema': schemas, 'authors': len(analysis_df)})
+  for name in ['ARD', 'ACP']:
+    #One contiguous row per schema
+    values = np.ascontiguousarray(analysis_df[[f'{name}_{schema}' for schema in schemas]].to_numpy(dtype=np.float64).T)
+    if values.shape[1] == 0:
+      values = np.full((len(schemas), 1), np.nan)
+    summary[f'mean_{name}'] = values.mean(axis=1)
+    for quantile, row in zip(SUMMARY_QUANTILES, np.quantile(values, SUMMARY_QUANTILES, axis=1)):
+      summary[f'{name}_p{int(quantile * 100)}'] = row
+    if name == 'ARD':
+      summary['max_ARD'] = values.max(axis=1)
+  return summary
+
+#Side-by-side summaries of two populations (each ranked within itself): mean and median ARD and ACP of every schema in each population, and the
+#difference of the medians (second population - first)
+def compare_populations (analysis_a, analysis_b, labels = ('A', 'B'), schemas = ANALYSIS_SCHEMAS):
+  summaries = [summarize_rank_displacement(analysis, schemas) for analysis in (analysis_a, analysis_b)]
+  if labels[0] == labels[1]:
+    labels = (f'{labels[0]} 1', f'{labels[1]} 2')
+  comparison = pd.DataFrame({'schema': schemas})
+  for statistic in ['authors', 'mean_ARD', 'ARD_p50', 'mean_ACP', 'ACP_p50']:
+    for label, summary in zip(labels, summaries):
+      comparison[f'{statistic} ({label})'] = summary[statistic]
+  for statistic in ['ARD_p50', 'ACP_p50']:
+    comparison[f'{statistic} difference'] = summaries[1][statistic] - summaries[0][statistic]
+  return comparison
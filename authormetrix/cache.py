@@ -0,0 +1,242 @@
+#In-memory and on-disk caches of the pipeline stages
+import pandas as pd
+import numpy as np
+import pyarrow as pa
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import types
+from collections import OrderedDict
+
+from .corpus import Corpus, corpus_preprocess
+from . import corpus as corpus_module
+from .cube import CreditCube
+from .network import CoauthorshipGraph
+from . import registry, schemas
+from .schemas import expand_credit_schemes
+from .instrumentation import pipeline_stage
+
+
+
+#PIPELINE CACHE
+#Every widget interaction reruns the whole Main page script. The expensive stages (preprocessing, schema expansion and the per-ID metric table) are cached across reruns,
+#keyed by a hash of the uploaded file(s) and the filter parameters. Least recently used entries are evicted beyond a number of entries or a memory cap,
+#both configurable through environment variables
+PIPELINE_CACHE_MAX_ENTRIES = int(os.environ.get('AUTHORMETRIX_CACHE_MAX_ENTRIES', 32))
+PIPELINE_CACHE_MAX_MB = float(os.environ.get('AUTHORMETRIX_CACHE_MAX_MB', 2048))
+
+#Approximate memory held by a cached value
+def estimate_nbytes (value):
+  if isinstance(value, Corpus):
+    arrays = [value.doc_offsets, value.scids, value.author_codes, value.position] + list(value.credits.values())
+    return estimate_nbytes(value.docs) + estimate_nbytes(value.rejects) + estimate_nbytes(value.sources) + sum(array.nbytes for array in arrays)
+  if isinstance(value, CreditCube):
+    #The cube's corpus (and its ID dictionary) is the cached preprocessed corpus, so only the cube's own arrays count
+    arrays = [value.author_index.offsets, value.author_index.doc_rows, value.cell_keys] + list(value.prefix_sums.values())
+    return sum(array.nbytes for array in arrays)
+  if isinstance(value, CoauthorshipGraph):
+    #The graph's ID dictionary is the corpus' one
+    arrays = [value.indptr, value.indices, value.joint_papers, value.author_doc_offsets, value.author_docs, value.byline_offsets, value.byline_codes]
+    return sum(array.nbytes for array in arrays)
+  if isinstance(value, pd.DataFrame):
+    return int(value.memory_usage(deep=True).sum())
+  if isinstance(value, np.ndarray):
+    return value.nbytes
+  if isinstance(value, (tuple, list)):
+    return sum(estimate_nbytes(item) for item in value)
+  return sys.getsizeof(value)
+
+class PipelineCache:
+  def __init__ (self, max_entries, max_bytes):
+    self.max_entries = max_entries
+    self.max_bytes = max_bytes
+    self.entries = OrderedDict() #key -> (value, nbytes), least recently used first
+    self.total_bytes = 0
+    self.lock = threading.Lock() #the cache is shared by all sessions of the app
+
+  #Returns the cached value for key, or computes and caches it. Values are shared between reruns, so callers must not modify them
+  def get_or_compute (self, key, compute):
+    with self.lock:
+      if key in self.entries:
+        self.entries.move_to_end(key)
+        return self.entries[key][0]
+    value = compute()
+    nbytes = estimate_nbytes(value)
+    with self.lock:
+      #A value larger than the whole memory cap is returned without being cached
+      if key not in self.entries and nbytes <= self.max_bytes:
+        self.entries[key] = (value, nbytes)
+        self.total_bytes += nbytes
+        while len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes:
+          _, (_, evicted_nbytes) = self.entries.popitem(last=False)
+          self.total_bytes -= evicted_nbytes
+    return value
+
+  #(True, value) if key is cached, else (False, None), without computing anything
+  def lookup (self, key):
+    with self.lock:
+      if key in self.entries:
+        self.entries.move_to_end(key)
+        return True, self.entries[key][0]
+    return False, None
+
+def content_hash (uploaded_file):
+  return hashlib.sha256(uploaded_file.getvalue()).hexdigest()
+
+#Hash of an upload of several files; their order matters, as it decides which copy of a duplicate document is kept
+def contents_hash (uploaded_files):
+  if len(uploaded_files) == 1:
+    return content_hash(uploaded_files[0])
+  return hashlib.sha256(':'.join(content_hash(uploaded_file) for uploaded_file in uploaded_files).encode()).hexdigest()
+
+#Same hash as content_hash, for a file on disk, read in blocks
+def file_hash (path, block_size = 1 << 20):
+  digest = hashlib.sha256()
+  with open(path, 'rb') as f:
+    for block in iter(lambda: f.read(block_size), b''):
+      digest.update(block)
+  return digest.hexdigest()
+
+
+
+#CORPUS DISK CACHE
+#The same Scopus corpus is often re-analysed with different lists of IDs. The cleaned corpus (docs table, rejects report and per-file counts as Parquet), its ID dictionary and its per-authorship
+#code and credit arrays (Arrow files, memory-mapped on reload) are therefore kept on disk, keyed by the hash of the uploaded file and a fingerprint of the preprocessing and schema code.
+#Editing any of that code or of its constants (or bumping CORPUS_CACHE_VERSION) changes the key, so stale entries are never read again. Set the directory to '' to disable.
+#The least recently used entries (stale ones included) are removed beyond a number of entries or a size cap, both configurable through environment variables
+CORPUS_CACHE_DIR = os.environ.get('AUTHORMETRIX_CORPUS_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'authormetrix'))
+CORPUS_CACHE_VERSION = 4
+CORPUS_CACHE_MAX_ENTRIES = int(os.environ.get('AUTHORMETRIX_CORPUS_CACHE_MAX_ENTRIES', 64))
+CORPUS_CACHE_MAX_MB = float(os.environ.get('AUTHORMETRIX_CORPUS_CACHE_MAX_MB', 10240))
+#Temporary directories of writes that were interrupted (e.g. a killed process) are removed once they are this old
+CORPUS_CACHE_TEMP_SECONDS = 24 * 3600
+#Settings of those modules that do not change the preprocessed corpus (chunk size, number of threads, cache sizes), and are left out of the key
+CORPUS_CACHE_KEY_SETTINGS = {'CORPUS_CHUNK_ROWS', 'CORPUS_PARSE_WORKERS', 'CREDIT_TABLE_MAX_MB', 'CALCULATOR_MAX_AUTHORS'}
+
+#Hash of a function's bytecode, constants (including nested schema functions) and referenced names, but not of its line numbers
+def code_fingerprint (code):
+  parts = [code.co_code, repr(code.co_names).encode()]
+  for const in code.co_consts:
+    parts.append(code_fingerprint(const) if isinstance(const, types.CodeType) else repr(const).encode())
+  return hashlib.sha256(b''.join(parts)).digest()
+
+#Bytes of a module constant that are the same in every process: functions (e.g. the kernels of SCHEMA_REGISTRY) by their name and code, as their repr
+#holds a memory address, and containers item by item
+def value_fingerprint (value):
+  if isinstance(value, types.FunctionType):
+    return value.__qualname__.encode() + code_fingerprint(value.__code__)
+  if isinstance(value, (list, tuple)):
+    return b'[' + b','.join(value_fingerprint(item) for item in value) + b']'
+  if isinstance(value, dict):
+    return b'{' + b','.join(value_fingerprint(name) + b':' + value_fingerprint(item) for name, item in value.items()) + b'}'
+  return repr(value).encode()
+
+#Every function of the corpus (preprocessing and ID parsing), registry (kernels included) and schemas modules is part of the key, and so is every
+#constant (UPPER_CASE name) of those modules, e.g. the column lists, MAX_ID_DIGITS and SCHEMA_REGISTRY, except the settings above
+def corpus_cache_key (corpus_key):
+  key = hashlib.sha256(f'{corpus_key}:{CORPUS_CACHE_VERSION}'.encode())
+  for module in [corpus_module, registry, schemas]:
+    for name, value in sorted(vars(module).items()):
+      if isinstance(value, types.FunctionType) and value.__module__ == module.__name__:
+        key.update(code_fingerprint(value.__code__))
+      elif name.isupper() and name not in CORPUS_CACHE_KEY_SETTINGS and not isinstance(value, (types.ModuleType, type)):
+        key.update(f'{module.__name__}.{name}='.encode() + value_fingerprint(value))
+  return key.hexdigest()
+
+#Uncompressed Arrow IPC file, so that it can be memory-mapped on reload
+def write_arrow_file (path, table):
+  with pa.OSFile(path, 'wb') as sink:
+    with pa.ipc.new_file(sink, table.schema) as writer:
+      writer.write_table(table)
+
+def save_corpus_cache (cache_path, corpus, number_of_raw_docs):
+  #Written to a temporary directory first, so that an interrupted write never leaves a half-written entry behind
+  os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+  temp_path = tempfile.mkdtemp(dir=os.path.dirname(cache_path))
+  try:
+    corpus.docs.to_parquet(os.path.join(temp_path, 'docs.parquet'))
+    corpus.rejects.to_parquet(os.path.join(temp_path, 'rejects.parquet'))
+    corpus.sources.to_parquet(os.path.join(temp_path, 'sources.parquet'))
+    write_arrow_file(os.path.join(temp_path, 'scids.arrow'), pa.table({'scids': corpus.scids}))
+    write_arrow_file(os.path.join(temp_path, 'authorships.arrow'),
+                     pa.table({'author_codes': corpus.author_codes, 'position': corpus.position, **corpus.credits},
+                              metadata={'number_of_raw_docs': str(number_of_raw_docs)}))
+    os.replace(temp_path, cache_path)
+  except OSError:
+    shutil.rmtree(temp_path, ignore_errors=True)
+  prune_corpus_cache(os.path.dirname(cache_path), cache_path)
+
+#Entries of the disk cache (directories named by their 64-character key) as (last use, path, bytes), least recently used first; loading an entry
+#touches its directory. Interrupted writes older than CORPUS_CACHE_TEMP_SECONDS are removed on the way
+def corpus_cache_entries (cache_dir):
+  entries = []
+  for entry in os.scandir(cache_dir):
+    try:
+      if not entry.is_dir():
+        continue
+      if len(entry.name) != 64:
+        if entry.name.startswith('tmp') and time.time() - entry.stat().st_mtime > CORPUS_CACHE_TEMP_SECONDS:
+          shutil.rmtree(entry.path, ignore_errors=True)
+        continue
+      entries.append((entry.stat().st_mtime, entry.path, sum(f.stat().st_size for f in os.scandir(entry.path) if f.is_file())))
+    except OSError:
+      pass #removed meanwhile by another process
+  return sorted(entries)
+
+#Removes the least recently used entries beyond CORPUS_CACHE_MAX_ENTRIES or CORPUS_CACHE_MAX_MB, but never keep_path (the entry just written). An entry
+#that another process has memory-mapped stays readable by that process until it is closed
+def prune_corpus_cache (cache_dir, keep_path = None, max_entries = CORPUS_CACHE_MAX_ENTRIES, max_bytes = CORPUS_CACHE_MAX_MB * 1024**2):
+  try:
+    entries = corpus_cache_entries(cache_dir)
+  except OSError:
+    return
+  number_of_entries, total_bytes = len(entries), sum(nbytes for _, _, nbytes in entries)
+  for _, path, nbytes in entries:
+    if number_of_entries <= max_entries and total_bytes <= max_bytes:
+      break
+    if path == keep_path:
+      continue
+    shutil.rmtree(path, ignore_errors=True)
+    number_of_entries, total_bytes = number_of_entries - 1, total_bytes - nbytes
+
+def load_corpus_cache (cache_path):
+  docs = pd.read_parquet(os.path.join(cache_path, 'docs.parquet'))
+  scids = pa.ipc.open_file(pa.memory_map(os.path.join(cache_path, 'scids.arrow'))).read_all()
+  authorships = pa.ipc.open_file(pa.memory_map(os.path.join(cache_path, 'authorships.arrow'))).read_all()
+  #Read-only numpy views on the memory-mapped file; nothing is copied until a selection is made
+  columns = {name: authorships.column(name).combine_chunks().to_numpy(zero_copy_only=True) for name in authorships.column_names}
+  authorcounts = docs['authorcount'].to_numpy()
+  corpus = Corpus(docs = docs,
+                  doc_offsets = np.concatenate(([0], np.cumsum(authorcounts))).astype(np.int64),
+                  scids = scids.column('scids').combine_chunks().to_numpy(zero_copy_only=True),
+                  author_codes = columns.pop('author_codes'),
+                  position = columns.pop('position'),
+                  credits = columns,
+                  rejects = pd.read_parquet(os.path.join(cache_path, 'rejects.parquet')),
+                  sources = pd.read_parquet(os.path.join(cache_path, 'sources.parquet')))
+  return corpus, int(authorships.schema.metadata[b'number_of_raw_docs'])
+
+#Cleaned corpus with all credit schemas expanded, from the disk cache when this upload (an uploaded file or a path, or a list of them) has been seen before
+def load_or_preprocess_corpus (uploaded_file, corpus_key):
+  cache_path = os.path.join(CORPUS_CACHE_DIR, corpus_cache_key(corpus_key)) if CORPUS_CACHE_DIR else None
+  if cache_path and os.path.isdir(cache_path):
+    try:
+      os.utime(cache_path) #most recently used, for prune_corpus_cache
+    except OSError:
+      pass
+    with pipeline_stage('load_corpus_cache') as stage:
+      corpus, number_of_raw_docs = load_corpus_cache(cache_path)
+      stage['input_rows'], stage['output_rows'] = number_of_raw_docs, len(corpus)
+    return corpus, number_of_raw_docs
+  with pipeline_stage('corpus_preprocess') as stage:
+    corpus, number_of_raw_docs = corpus_preprocess(uploaded_file)
+    stage['input_rows'], stage['output_rows'] = number_of_raw_docs, len(corpus)
+  corpus = expand_credit_schemes(corpus)
+  if cache_path:
+    with pipeline_stage('save_corpus_cache', len(corpus)):
+      save_corpus_cache(cache_path, corpus, number_of_raw_docs)
+  return corpus, number_of_raw_docs
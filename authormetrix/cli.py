@@ -0,0 +1,170 @@
+#Headless batch runs of the Main page pipeline: every corpus file against every list of Scopus IDs, in parallel worker processes
+#Usage: python -m authormetrix --corpus dept1.csv dept2.csv --ids faculty1.csv faculty2.csv --output-dir results --workers 8
+#       python -m authormetrix --corpus dept1.csv --all-authors --format parquet
+#       python -m authormetrix --corpus big.csv --ids faculty.csv --workers 1 --shard-workers 32
+#       python -m authormetrix --corpus dept1.csv --ids faculty1.csv --yearly --rolling-window 3
+#       python -m authormetrix --corpus dept1.csv --ids faculty1.csv --network
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from .cache import CORPUS_CACHE_DIR, file_hash, load_or_preprocess_corpus
+from .corpus import select_documents
+from .metrics import compute_author_metrics
+from .cube import build_credit_cube, compute_all_author_metrics
+from .shards import PIPELINE_WORKERS, compute_author_metrics_sharded
+from .timeseries import compute_author_year_metrics
+from .network import build_coauthorship_graph, coauthorship_metrics
+from .instrumentation import STAGE_LOG, configure_stage_logging, record_stages, run_stage
+
+
+
+#Corpora already loaded by this (worker) process, so that consecutive jobs on the same corpus do not reload it
+worker_corpora = {}
+
+def load_corpus (corpus_path, corpus_key):
+  if corpus_key not in worker_corpora:
+    worker_corpora.clear()
+    worker_corpora[corpus_key] = load_or_preprocess_corpus(corpus_path, corpus_key)
+  return worker_corpora[corpus_key]
+
+#Preprocesses one corpus into the disk cache, so the metric jobs only have to memory-map it
+def prepare_corpus (corpus_path):
+  record_stages(run=os.path.basename(corpus_path))
+  start = time.perf_counter()
+  corpus_key = file_hash(corpus_path)
+  load_or_preprocess_corpus(corpus_path, corpus_key)
+  return corpus_key, time.perf_counter() - start
+
+#ids_path None computes the table for every author of the (selected) corpus. The first job of each corpus also writes its rejects report (rejects_path),
+#when rows had to be left out for a malformed Author(s) ID. With shard_workers > 1, the job's metrics are computed shard by shard in that many processes.
+#With yearly_window, the job writes the author x year table instead (over trailing windows of that many years); for a list of IDs it has every year
+#of every author, for all authors only the (author, year) rows with documents. With network, it writes the co-authorship network metrics of the IDs
+def run_job (corpus_path, corpus_key, ids_path, output_path, doc_types, years, rejects_path = None, shard_workers = 1, yearly_window = None,
+             network = False):
+  #The job's pipeline stages are logged under the name of its result file
+  record_stages(run=os.path.basename(output_path))
+  start = time.perf_counter()
+  corpus, _ = load_corpus(corpus_path, corpus_key)
+  if rejects_path and len(corpus.rejects) > 0:
+    corpus.rejects.to_csv(rejects_path, index=False)
+  corpus = select_documents(corpus, doc_types, years)
+  if network:
+    scids_df = coauthorship_metrics(run_stage(build_coauthorship_graph, corpus), pd.read_csv(ids_path))
+  elif yearly_window is not None:
+    scids_df = run_stage(compute_author_year_metrics, corpus, None if ids_path is None else pd.read_csv(ids_path), yearly_window, ids_path is not None,
+                         shard_workers)
+  elif ids_path is None:
+    scids_df = compute_all_author_metrics(run_stage(build_credit_cube, corpus), workers=shard_workers)
+  elif shard_workers > 1:
+    scids_df = compute_author_metrics_sharded(corpus, pd.read_csv(ids_path), shard_workers)
+  else:
+    scids_df = compute_author_metrics(corpus, pd.read_csv(ids_path))
+  if output_path.endswith('.parquet'):
+    scids_df.to_parquet(output_path, index=False)
+  else:
+    scids_df.to_csv(output_path, index=False)
+  return {'documents': len(corpus), 'rejected_rows': len(corpus.rejects), 'scopus_ids': len(scids_df), 'seconds': round(time.perf_counter() - start, 3)}
+
+def output_name (corpus_path, ids_path, output_format, suffix = ''):
+  corpus_stem = os.path.splitext(os.path.basename(corpus_path))[0]
+  ids_stem = 'all_authors' if ids_path is None else os.path.splitext(os.path.basename(ids_path))[0]
+  return f'{corpus_stem}__{ids_stem}{suffix}.{output_format}'
+
+def rejects_name (corpus_path):
+  return f'{os.path.splitext(os.path.basename(corpus_path))[0]}__rejected_rows.csv'
+
+def parse_args (argv = None):
+  parser = argparse.ArgumentParser(prog='python -m authormetrix', description="Calculates authors' credit-allocation and collaboration metrics for every (corpus, Scopus ID list) pair.")
+  parser.add_argument('--corpus', nargs='+', required=True, help='Scopus export(s) (.csv) to analyse')
+  parser.add_argument('--ids', nargs='+', default=[], help='csv file(s) with the Scopus IDs in the first column')
+  parser.add_argument('--all-authors', action='store_true', help='also write the table for every author of each corpus (e.g. for percentiles and ranks)')
+  parser.add_argument('--output-dir', default='authormetrix_results', help='directory for the result files, one per (corpus, ID list) job')
+  parser.add_argument('--format', choices=['csv', 'parquet'], default='csv', help='format of the result files')
+  parser.add_argument('--doc-types', nargs='+', help='document types to include (default: all)')
+  parser.add_argument('--years', nargs=2, type=int, metavar=('START', 'END'), help='range of publication years to include (default: all)')
+  parser.add_argument('--yearly', action='store_true', help='also write the author x year table of every job (file name ending in __yearly)')
+  parser.add_argument('--rolling-window', type=int, default=1, metavar='YEARS',
+                      help='with --yearly, every row covers its year and the YEARS - 1 years before it (default 1: each year on its own)')
+  parser.add_argument('--network', action='store_true',
+                      help='also write the co-authorship network metrics of every ID list (file name ending in __network): co-authors, joint papers, internal vs external collaboration, ego-network size')
+  parser.add_argument('--workers', type=int, default=os.cpu_count(), help='number of worker processes; 1 runs every job in this process')
+  parser.add_argument('--shard-workers', type=int, default=PIPELINE_WORKERS,
+                      help='number of processes computing each job, with its authors split into shards (default 1: serial; set AUTHORMETRIX_PIPELINE_WORKERS to change it)')
+  parser.add_argument('--stage-log', default=STAGE_LOG, help="file to append one JSON line per pipeline stage to (wall time, peak memory, rows), '-' for standard error")
+  args = parser.parse_args(argv)
+  if not args.ids and not args.all_authors:
+    parser.error('one of --ids or --all-authors is required')
+  if args.rolling_window < 1:
+    parser.error('--rolling-window must be at least 1')
+  for path in args.corpus + args.ids:
+    if not os.path.isfile(path):
+      parser.error(f'file not found: {path}')
+  return args
+
+def main (argv = None):
+  args = parse_args(argv)
+  os.makedirs(args.output_dir, exist_ok=True)
+  configure_stage_logging(args.stage_log)
+  start = time.perf_counter()
+  summary = []
+
+  executor = ProcessPoolExecutor(max_workers=args.workers, initializer=configure_stage_logging, initargs=(args.stage_log,)) if args.workers > 1 else None
+  submit = executor.submit if executor else (lambda function, *function_args: SerialResult(function, *function_args))
+  try:
+    #Each corpus is preprocessed once, in parallel, before the N x M metric jobs; without a disk cache the jobs preprocess it themselves
+    corpus_keys = {}
+    if CORPUS_CACHE_DIR:
+      prepared = {corpus_path: submit(prepare_corpus, corpus_path) for corpus_path in args.corpus}
+      for corpus_path, future in prepared.items():
+        try:
+          corpus_keys[corpus_path] = future.result()[0]
+        except Exception:
+          pass #the corpus' jobs run into (and report) the same error
+    for corpus_path in args.corpus:
+      if corpus_path not in corpus_keys:
+        corpus_keys[corpus_path] = file_hash(corpus_path)
+
+    jobs = {}
+    for corpus_path in args.corpus:
+      rejects_path = os.path.join(args.output_dir, rejects_name(corpus_path))
+      for ids_path in args.ids + ([None] if args.all_authors else []):
+        #The metric table, and the optional author x year and network tables (the network is only computed for lists of IDs)
+        tables = [('', None, False)] + ([('__yearly', args.rolling_window, False)] if args.yearly else []) + \
+                 ([('__network', None, True)] if args.network and ids_path is not None else [])
+        for suffix, yearly_window, network in tables:
+          output_path = os.path.join(args.output_dir, output_name(corpus_path, ids_path, args.format, suffix))
+          jobs[(corpus_path, ids_path, output_path)] = submit(run_job, corpus_path, corpus_keys[corpus_path], ids_path, output_path, args.doc_types,
+                                                              args.years, rejects_path, args.shard_workers, yearly_window, network)
+          rejects_path = None
+
+    for (corpus_path, ids_path, output_path), future in jobs.items():
+      try:
+        summary.append({'corpus': corpus_path, 'ids': ids_path or 'all authors', 'status': 'ok', **future.result(), 'output': output_path})
+      except Exception as error:
+        summary.append({'corpus': corpus_path, 'ids': ids_path or 'all authors', 'status': f'failed: {error}', 'output': ''})
+  finally:
+    if executor:
+      executor.shutdown()
+
+  print(pd.DataFrame(summary).to_string(index=False))
+  print(f'{len(summary)} job(s) in {time.perf_counter() - start:.2f} s with {args.workers} worker(s) and {args.shard_workers} shard worker(s) per job')
+  return 0 if all(job['status'] == 'ok' for job in summary) else 1
+
+
+
+#Runs a job immediately in this process, behind the same .result() interface as a pool future
+class SerialResult:
+  def __init__ (self, function, *args):
+    try:
+      self.value, self.error = function(*args), None
+    except Exception as error:
+      self.value, self.error = None, error
+
+  def result (self):
+    if self.error is not None:
+      raise self.error
+    return self.value
@@ -0,0 +1,265 @@
+#Reading a Scopus export into the compact, pre-processed corpus
+import pandas as pd
+import numpy as np
+import os
+import time
+import pyarrow as pa
+import pyarrow.compute as pc
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+
+
+#Code of an author ID that does not occur in the corpus
+UNKNOWN_AUTHOR = -1
+
+#The pre-processed corpus: one row per document in 'docs', and the authorships of all documents as flat (CSR-style) arrays instead of a column of Python lists.
+#Author IDs are dictionary-encoded: 'scids' holds the distinct IDs of the corpus, sorted, and each authorship stores the dense int32 code of its author
+#(its position in scids), so per-author sums are plain arrays indexed by code. The authors of document d are author_codes[doc_offsets[d]:doc_offsets[d+1]],
+#in byline order, and 'position' is each author's rank on the byline (1 = first author).
+#The credits of each allocation schema are float64 arrays parallel to author_codes, stored in 'credits' under the old corpus column names
+@dataclass
+class Corpus:
+  docs: pd.DataFrame
+  doc_offsets: np.ndarray
+  scids: np.ndarray
+  author_codes: np.ndarray
+  position: np.ndarray
+  credits: dict = field(default_factory=dict)
+  rejects: pd.DataFrame = field(default_factory=pd.DataFrame) #rows of the upload left out for a malformed 'Author(s) ID' (see corpus_preprocess)
+  sources: pd.DataFrame = field(default_factory=pd.DataFrame) #row counts and parsing time of every uploaded file
+
+  def __len__ (self):
+    return len(self.docs)
+
+  #Author ID of every authorship (decoded; a new int64 array)
+  @property
+  def author_ids (self):
+    return self.scids[self.author_codes]
+
+  #Codes of the given author IDs, translated once per list of IDs; IDs that are not in the corpus get UNKNOWN_AUTHOR
+  def encode_author_ids (self, ids):
+    ids = np.asarray(ids)
+    codes = np.searchsorted(self.scids, ids).astype(np.int32)
+    known = codes < len(self.scids)
+    known[known] = self.scids[codes[known]] == ids[known]
+    codes[~known] = UNKNOWN_AUTHOR
+    return codes
+
+  #Codes of the first author of every document, and of the last author of every multi-author document
+  def first_author_codes (self):
+    return self.author_codes[self.doc_offsets[:-1]]
+
+  def last_author_codes (self):
+    has_last_author = np.diff(self.doc_offsets) != 1
+    return self.author_codes[self.doc_offsets[1:][has_last_author] - 1]
+
+  #Row number (in 'docs') of the document each authorship belongs to
+  def doc_index (self):
+    return np.repeat(np.arange(len(self.docs)), np.diff(self.doc_offsets))
+
+  #Positions in the flat authorship arrays of the authors of the given documents (row numbers in 'docs'), without a Python loop over the documents
+  def authorships_of (self, doc_rows):
+    starts = self.doc_offsets[doc_rows]
+    lengths = self.doc_offsets[np.asarray(doc_rows) + 1] - starts
+    within_doc = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return np.repeat(starts, lengths) + within_doc
+
+  #Concatenated author IDs of the given documents
+  def authors_of (self, doc_rows):
+    return self.scids[self.author_codes[self.authorships_of(doc_rows)]]
+
+  #Keeps only the documents where doc_mask is True, together with their authorships and credits. The ID dictionary is kept whole, so codes (and arrays
+  #indexed by code) stay valid between a corpus and its selections
+  def select (self, doc_mask):
+    doc_mask = np.asarray(doc_mask, dtype=bool)
+    authorcounts = np.diff(self.doc_offsets)
+    authorship_mask = np.repeat(doc_mask, authorcounts)
+    return Corpus(docs = self.docs[doc_mask],
+                  doc_offsets = np.concatenate(([0], np.cumsum(authorcounts[doc_mask]))).astype(np.int64),
+                  scids = self.scids,
+                  author_codes = self.author_codes[authorship_mask],
+                  position = self.position[authorship_mask],
+                  credits = {column: credit[authorship_mask] for column, credit in self.credits.items()},
+                  rejects = self.rejects,
+                  sources = self.sources)
+
+  #Builds the old DataFrame view, with 'Authors_ID_list' and one list-valued column per schema. Only meant for previews, as it creates one Python list per document and column
+  #doc_rows (optional) limits the view to those documents, in that order, e.g. one page of the app's corpus preview
+  def to_dataframe (self, doc_rows = None):
+    if doc_rows is None:
+      doc_rows = np.arange(len(self.docs))
+    doc_rows = np.asarray(doc_rows)
+    view = self.docs.iloc[doc_rows].copy()
+    authorships = self.authorships_of(doc_rows)
+    split_points = np.cumsum(self.doc_offsets[doc_rows + 1] - self.doc_offsets[doc_rows])[:-1]
+    view.insert(view.columns.get_loc('authorcount'), 'Authors_ID_list', [ids.tolist() for ids in np.split(self.scids[self.author_codes[authorships]], split_points)])
+    for column, credit in self.credits.items():
+      view[column] = [credits.tolist() for credits in np.split(credit[authorships], split_points)]
+    return view
+
+
+
+#Only these columns of a Scopus export are used; everything else (abstracts, references, ...) is never read
+CORPUS_COLUMNS = ['EID', 'Authors', 'Author full names', 'Author(s) ID', 'Title', 'Year', 'Source title', 'Document Type']
+CORPUS_DTYPES = {'EID': str, 'Authors': str, 'Author full names': str, 'Author(s) ID': str, 'Title': str, 'Year': 'float64', 'Source title': str, 'Document Type': str}
+#The upload is read this many rows at a time, so peak memory does not depend on the size of the file
+CORPUS_CHUNK_ROWS = 20000
+#Columns of the rejects report: the file and row number in the upload (1 = first data row of the file), identifying columns, and why the row was left out
+REJECT_COLUMNS = ['file', 'row', 'EID', 'Title', 'Author(s) ID', 'Author full names', 'reason']
+
+
+
+#AUTHOR ID PARSING
+#'Author(s) ID' lists a document's author IDs separated by ';'. Instead of splitting and converting every row in Python, the column of a whole chunk is
+#split, trimmed, validated and cast with Arrow's string kernels. A row whose IDs cannot all be read is reported instead of raising.
+#Pay close attention to this as Scopus may change their format
+MAX_ID_DIGITS = 18 #longer IDs would overflow int64
+ID_REJECT_REASONS = ['', 'ID too long', 'non-numeric ID', 'empty ID (empty segment or trailing separator)',
+                     'number of IDs does not match the number of author names']
+
+#Parses the 'Author(s) ID' of every row, and checks the number of IDs against the 'Author full names' (when present).
+#Returns the IDs of the valid rows (flat, in row order), the number of IDs of every valid row, and the reason every row is rejected ('' when valid)
+def parse_author_ids (id_values, name_values):
+  id_lists = pc.split_pattern(pa.array(id_values.to_numpy(), type=pa.string()), ';')
+  ids_per_row = pc.list_value_length(id_lists).to_numpy()
+  tokens = pc.utf8_trim_whitespace(pc.list_flatten(id_lists))
+  token_rows = pc.list_parent_indices(id_lists).to_numpy()
+  token_lengths = pc.binary_length(tokens).to_numpy()
+  is_decimal = pc.ascii_is_decimal(tokens).to_numpy(zero_copy_only=False)
+
+  #Reason codes (indices in ID_REJECT_REASONS) of every token, then of every row: the first bad token of a row gives its reason
+  token_reasons = np.zeros(len(tokens), dtype=np.int8)
+  token_reasons[is_decimal & (token_lengths > MAX_ID_DIGITS)] = 1
+  token_reasons[~is_decimal] = 2
+  token_reasons[token_lengths == 0] = 3
+  bad_tokens = np.flatnonzero(token_reasons)
+  first_bad = bad_tokens[np.unique(token_rows[bad_tokens], return_index=True)[1]]
+  row_reasons = np.zeros(len(id_values), dtype=np.int8)
+  row_reasons[token_rows[first_bad]] = token_reasons[first_bad]
+
+  #Number of IDs against the number of author names, for the rows that have names (an empty cell is read as NaN, which becomes a null)
+  names_per_row = pc.count_substring(pa.array(name_values.to_numpy(), type=pa.string(), from_pandas=True), ';').to_numpy(zero_copy_only=False) + 1
+  row_reasons[(row_reasons == 0) & name_values.notna().to_numpy() & (names_per_row != ids_per_row)] = 4
+
+  valid_rows = row_reasons == 0
+  ids = pc.cast(tokens.filter(pa.array(valid_rows[token_rows])), pa.int64()).to_numpy()
+  return ids, ids_per_row[valid_rows].astype(np.int64), np.array(ID_REJECT_REASONS, dtype=object)[row_reasons]
+
+
+
+#Several files (Scopus caps each export at 20,000 records) are read and parsed in a pool of worker threads; the parsing itself runs in pandas' and Arrow's
+#native code. Configurable through an environment variable
+CORPUS_PARSE_WORKERS = int(os.environ.get('AUTHORMETRIX_PARSE_WORKERS', os.cpu_count() or 1))
+#Rows that are the same document: same authors, title, source and year
+DUPLICATE_KEY_COLUMNS = ['Author(s) ID', 'Title', 'Source title', 'Year']
+
+def source_name (source):
+  name = getattr(source, 'name', source)
+  return os.path.basename(name) if isinstance(name, str) else ''
+
+#The chunks of a file, or one empty chunk for a file with a header and no rows (which may give no chunk at all), so that it gives an empty corpus
+def chunks_or_empty (chunks):
+  empty = True
+  for chunk in chunks:
+    empty = False
+    yield chunk
+  if empty:
+    yield pd.DataFrame({column: pd.Series(dtype=CORPUS_DTYPES[column]) for column in CORPUS_COLUMNS})
+
+#Reads and parses one file of the upload, without removing duplicates (done across all files in corpus_preprocess). Returns the parsed documents and
+#their IDs, the rejected rows, the hashed duplicate key and rejected flag of every row with the essential columns (in file order), and the file's counts
+def read_corpus_file (source, chunksize = CORPUS_CHUNK_ROWS):
+  start = time.perf_counter()
+  if hasattr(source, 'seek'):
+    source.seek(0)
+  name = source_name(source)
+  number_of_rows = 0
+  doc_chunks, id_chunks, reject_chunks, key_chunks, rejected_chunks = [], [], [], [], []
+  for chunk in chunks_or_empty(pd.read_csv(source, usecols = CORPUS_COLUMNS, dtype = CORPUS_DTYPES, chunksize = chunksize)):
+    number_of_rows += len(chunk)
+    #1.1  Makes sure essential columns do not have empty cells, and hashes the duplicate key of every row
+    chunk = chunk.dropna(subset = ['Author(s) ID', 'Document Type', 'Year'])
+    key_chunks.append(pd.util.hash_pandas_object(chunk[DUPLICATE_KEY_COLUMNS], index = False).to_numpy())
+    #1.2  Converts "Author_ID" with ";" to a flat array of integer IDs, and sets the rows that cannot be converted aside
+    ids, authorcounts, reasons = parse_author_ids(chunk['Author(s) ID'], chunk['Author full names'])
+    rejected = reasons != ''
+    rejected_chunks.append(rejected)
+    rejects = chunk.loc[rejected, REJECT_COLUMNS[2:-1]].assign(reason = reasons[rejected])
+    rejects.insert(0, 'row', chunk.index[rejected] + 1)
+    rejects.insert(0, 'file', name)
+    reject_chunks.append(rejects)
+    #Renames essential author columns
+    chunk = chunk[~rejected].rename (columns= {'Author(s) ID': 'Authors_ID', 'Document Type': 'Document_Type'})
+    chunk['Year'] = chunk['Year'].astype(np.int64)
+    docs = chunk[['EID', 'Authors', 'Author full names', 'Authors_ID', 'Title', 'Year','Source title', 'Document_Type']].copy()
+    #1.3  Calculates number of authors
+    docs['authorcount'] = authorcounts
+    id_chunks.append(ids)
+    doc_chunks.append(docs)
+  keys = np.concatenate(key_chunks)
+  counts = {'file': name, 'rows': number_of_rows, 'missing_essential_data': number_of_rows - len(keys),
+            'duplicates_within_file': int(pd.Series(keys).duplicated().sum())}
+  return (pd.concat(doc_chunks), np.concatenate(id_chunks), pd.concat(reject_chunks, ignore_index=True), keys, np.concatenate(rejected_chunks), counts,
+          time.perf_counter() - start)
+
+#Function to preprocess the uploaded corpus: one file, or a list of files (a path or file object each) that are merged in order.
+#Returns the corpus and the number of rows in the upload. Duplicates are removed across all files, keeping the first copy.
+#Rows whose 'Author(s) ID' cannot be parsed are left out, and listed (with the reason) in corpus.rejects; corpus.sources has the counts and timings of every file
+def corpus_preprocess (df, chunksize = CORPUS_CHUNK_ROWS, workers = CORPUS_PARSE_WORKERS):
+  sources = list(df) if isinstance(df, (list, tuple)) else [df]
+  if len(sources) > 1 and workers > 1:
+    with ThreadPoolExecutor(max_workers=min(workers, len(sources))) as executor:
+      parsed_files = list(executor.map(lambda source: read_corpus_file(source, chunksize), sources))
+  else:
+    parsed_files = [read_corpus_file(source, chunksize) for source in sources]
+  doc_files, id_files, reject_files, key_files, rejected_files, file_counts, file_seconds = zip(*parsed_files)
+  number_of_raw_docs = sum(counts['rows'] for counts in file_counts)
+
+  #1.4  Removes duplicates, within and across files, from the documents and the rejected rows alike
+  is_duplicate = pd.Series(np.concatenate(key_files)).duplicated().to_numpy()
+  doc_chunks, id_chunks, reject_chunks, source_rows = [], [], [], []
+  file_starts = np.cumsum([0] + [len(keys) for keys in key_files])
+  for k, (docs, ids, rejects, rejected) in enumerate(zip(doc_files, id_files, reject_files, rejected_files)):
+    duplicate = is_duplicate[file_starts[k]:file_starts[k+1]]
+    keep_docs = ~duplicate[~rejected]
+    doc_chunks.append(docs[keep_docs])
+    id_chunks.append(ids[np.repeat(keep_docs, docs['authorcount'].to_numpy())])
+    reject_chunks.append(rejects[~duplicate[rejected]])
+    source_rows.append({**file_counts[k], 'duplicates_of_earlier_files': int(duplicate.sum()) - file_counts[k]['duplicates_within_file'],
+                        'rejected': int(np.count_nonzero(~duplicate[rejected])),
+                        'documents': int(keep_docs.sum()), 'seconds': round(file_seconds[k], 3)})
+
+  docs = pd.concat(doc_chunks)
+  author_ids = np.concatenate(id_chunks)
+  #Where each document's authors start in the flat array
+  authorcounts = docs['authorcount'].to_numpy()
+  doc_offsets = np.concatenate(([0], np.cumsum(authorcounts))).astype(np.int64)
+  position = (np.arange(doc_offsets[-1]) - np.repeat(doc_offsets[:-1], authorcounts) + 1).astype(np.int32)
+  #1.5  Creates a column for the first author ID
+  docs['first_author'] = author_ids[doc_offsets[:-1]]
+  #1.6  Creates a column for the last author ID, which applies only to non-single-author publications. Last author is last element of each document's authors
+  docs['last_author'] = np.where(authorcounts != 1, author_ids[doc_offsets[1:] - 1], 0)
+
+  #1.7  Encodes the author IDs as dense codes; the int64 IDs are not kept per authorship
+  scids, author_codes = np.unique(author_ids, return_inverse=True)
+
+  rejects = pd.concat(reject_chunks, ignore_index=True)
+  corpus = Corpus(docs = docs, doc_offsets = doc_offsets, scids = scids, author_codes = author_codes.astype(np.int32), position = position, rejects = rejects,
+                  sources = pd.DataFrame(source_rows))
+  return corpus, number_of_raw_docs
+
+
+
+#Documents of the given types and within the given (start, end) publication years; None leaves that filter out
+def document_mask (corpus, doc_types = None, years = None):
+  mask = np.ones(len(corpus), dtype=bool)
+  if doc_types is not None:
+    mask &= corpus.docs['Document_Type'].isin(doc_types).to_numpy()
+  if years is not None:
+    mask &= corpus.docs['Year'].between(years[0], years[1]).to_numpy()
+  return mask
+
+#STEP 2 selection outside the app: keeps the documents of the given types and publication years (both optional)
+def select_documents (corpus, doc_types = None, years = None):
+  return corpus.select(document_mask(corpus, doc_types or None, years or None))
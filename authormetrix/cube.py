@@ -0,0 +1,156 @@
+#Year x document-type cube of the additive per-author metrics, so that STEP 2 filter changes are answered without re-running the pipeline
+import pandas as pd
+import numpy as np
+from dataclasses import dataclass
+
+from .corpus import Corpus, UNKNOWN_AUTHOR, document_mask
+from .registry import CREDIT_COLUMN_PAIRS
+from .metrics import (AuthorIndex, build_author_index, find_unique_coauthors, count_all_unique_coauthors, unique_scids_table,
+                      metric_table_from_sums)
+from .shards import count_all_unique_coauthors_sharded
+from .instrumentation import pipeline_stage, run_stage
+
+
+
+#CREDIT CUBE
+#Every metric of the STEP 3 table except the number of unique co-authors is a sum over documents: counts, schema credit sums, and the two sums behind the
+#collaboration index (authorcount of the author's multi-author documents, and their number). These sums are kept per (author, document type, year) cell
+#for the non-empty cells only, sorted by cell key. Within each (author, document type) row the values are prefix sums over years, so a year range is
+#the difference of two entries, and a set of document types is a sum of rows. The unique co-authors are not additive; they are answered from the
+#author index of the full corpus, restricted to the selected documents
+
+@dataclass
+class CreditCube:
+  corpus: Corpus
+  author_index: AuthorIndex
+  years: np.ndarray #distinct publication years, sorted
+  doc_types: np.ndarray #distinct document types, sorted
+  scids: np.ndarray #the corpus' ID dictionary; an author's code is its position here
+  cell_keys: np.ndarray #(author code * number of doc types + doc type code) * number of years + year code, of every non-empty cell, sorted
+  prefix_sums: dict #metric -> prefix sums over years within each (author, doc type) row, parallel to cell_keys
+
+  #Number of non-empty cells
+  def __len__ (self):
+    return len(self.cell_keys)
+
+  #Per-author sums of every cube metric over the selected document types and years (both optional), for the given author IDs
+  def query (self, scids, doc_types = None, years = None):
+    scids = np.asarray(scids)
+    sums = {metric: np.zeros(len(scids), dtype=self.prefix_sums[metric].dtype) for metric in self.prefix_sums}
+    type_codes = np.arange(len(self.doc_types)) if doc_types is None else np.flatnonzero(np.isin(self.doc_types, list(doc_types)))
+    first_year = 0 if years is None else np.searchsorted(self.years, years[0], 'left')
+    last_year = len(self.years) - 1 if years is None else np.searchsorted(self.years, years[1], 'right') - 1
+    author_codes = self.corpus.encode_author_ids(scids).astype(np.int64)
+    known = author_codes != UNKNOWN_AUTHOR
+    if not known.any() or len(type_codes) == 0 or last_year < first_year:
+      return pd.DataFrame(sums, index=scids)
+
+    #One (author, doc type) row per requested author and selected type; its year range spans cell_keys[start:end]
+    number_of_years = len(self.years)
+    rows = (author_codes[known][:, None] * len(self.doc_types) + type_codes[None, :]).ravel()
+    start = np.searchsorted(self.cell_keys, rows * number_of_years + first_year, 'left')
+    end = np.searchsorted(self.cell_keys, rows * number_of_years + last_year, 'right')
+    in_range = end > start
+    row_start = np.searchsorted(self.cell_keys, rows * number_of_years, 'left')
+    has_earlier = in_range & (start > row_start)
+    requested = np.repeat(np.flatnonzero(known), len(type_codes))
+    for metric, prefix_sum in self.prefix_sums.items():
+      row_sums = np.zeros(len(rows), dtype=prefix_sum.dtype)
+      row_sums[in_range] = prefix_sum[end[in_range] - 1]
+      row_sums[has_earlier] -= prefix_sum[start[has_earlier] - 1]
+      sums[metric] = np.bincount(requested, weights=row_sums, minlength=len(scids)).astype(prefix_sum.dtype)
+    return pd.DataFrame(sums, index=scids)
+
+def build_credit_cube (corpus, author_index = None):
+  if author_index is None:
+    author_index = run_stage(build_author_index, corpus)
+  docs = corpus.docs
+  years, year_codes = np.unique(docs['Year'].to_numpy(), return_inverse=True)
+  doc_types, type_codes = np.unique(docs['Document_Type'].to_numpy().astype(str), return_inverse=True)
+  scids = corpus.scids
+  authorcounts = docs['authorcount'].to_numpy()
+  #Cell of every document, without the author part of the key
+  doc_cells = type_codes.astype(np.int64) * len(years) + year_codes
+  def cell_key (author_codes, doc_rows):
+    return author_codes.astype(np.int64) * (len(doc_types) * len(years)) + doc_cells[doc_rows]
+
+  #Three kinds of records: authorships; distinct (author, multi-author document) pairs, from the author index; and the first/last author of each document
+  doc_index = corpus.doc_index()
+  index_authors = np.repeat(np.arange(len(scids)), np.diff(author_index.offsets))
+  multi_author = authorcounts[author_index.doc_rows] > 1
+  has_last_author = authorcounts != 1
+  doc_rows = np.arange(len(docs))
+  record_keys = [cell_key(corpus.author_codes, doc_index),
+                 cell_key(index_authors[multi_author], author_index.doc_rows[multi_author]),
+                 cell_key(corpus.first_author_codes(), doc_rows),
+                 cell_key(corpus.last_author_codes(), doc_rows[has_last_author])]
+  cell_keys, cells = np.unique(np.concatenate(record_keys), return_inverse=True)
+  authorship_cells, multi_author_cells, first_author_cells, last_author_cells = np.split(cells, np.cumsum([len(keys) for keys in record_keys])[:-1])
+
+  cell_sums = {
+    'whole_fullcount': np.bincount(authorship_cells, minlength=len(cell_keys)),
+    'straight_firstauthor': np.bincount(first_author_cells, minlength=len(cell_keys)),
+    'straight_lastauthor': np.bincount(last_author_cells, minlength=len(cell_keys)),
+    'single_author_publications': np.bincount(first_author_cells[authorcounts == 1], minlength=len(cell_keys)),
+    'multi_author_documents': np.bincount(multi_author_cells, minlength=len(cell_keys)),
+    'multi_author_authorcounts': np.bincount(multi_author_cells, weights=authorcounts[author_index.doc_rows[multi_author]], minlength=len(cell_keys)).astype(np.int64)}
+  for allocation_col, sum_col in CREDIT_COLUMN_PAIRS:
+    cell_sums[sum_col] = np.bincount(authorship_cells, weights=corpus.credits[allocation_col], minlength=len(cell_keys))
+
+  #Prefix sums restart at every (author, doc type) row. A row has at most one cell per year, so the running sums are built year slot by year slot:
+  #the cells that are k-th in their row add the (k-1)-th cell's sum, which keeps the floating-point sums as accurate as a sequential cumsum per row
+  rows = cell_keys // max(len(years), 1)
+  row_starts = np.flatnonzero(np.diff(rows, prepend=-1))
+  within_row = np.arange(len(rows)) - np.repeat(row_starts, np.diff(np.append(row_starts, len(rows))))
+  slots = np.split(np.argsort(within_row, kind='stable'), np.cumsum(np.bincount(within_row))[:-1]) if len(rows) else []
+  prefix_sums = {}
+  for metric, values in cell_sums.items():
+    prefix_sum = values.copy()
+    for cells_in_slot in slots[1:]:
+      prefix_sum[cells_in_slot] += prefix_sum[cells_in_slot - 1]
+    prefix_sums[metric] = prefix_sum
+  return CreditCube(corpus = corpus, author_index = author_index, years = years, doc_types = doc_types, scids = scids, cell_keys = cell_keys,
+                    prefix_sums = prefix_sums)
+
+
+
+#Every column of the STEP 3 table except the unique co-authors, for the IDs in the first column of scids_df, answered from the cube
+def cube_metric_table (cube, scids_df, doc_types = None, years = None):
+  scids_df = unique_scids_table(scids_df)
+  sums = cube.query(scids_df['scids'].to_numpy(), doc_types, years)
+  return metric_table_from_sums(scids_df, {metric: sums[metric].to_numpy() for metric in sums})
+
+#The STEP 3 metric table (same columns as compute_author_metrics on the selected documents), answered from the cube
+def compute_author_metrics_from_cube (cube, scids_df, doc_types = None, years = None):
+  with pipeline_stage('cube_metric_table', len(cube.corpus)) as stage:
+    scids_df = cube_metric_table (cube, scids_df, doc_types, years)
+    stage['output_rows'] = len(scids_df)
+  doc_mask = None if doc_types is None and years is None else document_mask(cube.corpus, doc_types, years)
+  scids_df = run_stage (find_unique_coauthors, cube.corpus, scids_df, cube.author_index, doc_mask)
+  return scids_df
+
+
+
+#ALL AUTHORS
+#The STEP 3 table for every author with at least one selected document, for benchmarking (percentiles, ranks). The unique co-authors of all authors
+#come from one pass over the corpus instead of one lookup per ID; with workers > 1, shard by shard in that many processes
+def compute_all_author_metrics (cube, doc_types = None, years = None, workers = 1):
+  doc_mask = None if doc_types is None and years is None else document_mask(cube.corpus, doc_types, years)
+  with pipeline_stage('cube_metric_table', len(cube.corpus)) as stage:
+    scids_df = cube_metric_table (cube, pd.DataFrame({'scids': cube.scids}), doc_types, years)
+    stage['output_rows'] = len(scids_df)
+  if workers > 1:
+    scids_df['number_of_unique_COauthors'] = run_stage (count_all_unique_coauthors_sharded, cube.corpus, cube.author_index, doc_mask, workers)
+  else:
+    scids_df['number_of_unique_COauthors'] = run_stage (count_all_unique_coauthors, cube.corpus, cube.author_index, doc_mask)
+  return scids_df[scids_df['whole_fullcount'] > 0].reset_index(drop=True)
+
+#Top-K view of the all-authors table for display: authors with at least min_documents (whole count), ranked by one metric (1 = highest),
+#with that metric's percentile among the same authors
+def top_authors (all_authors_df, sort_by = 'fractional_equal', top_k = 100, min_documents = 1):
+  view = all_authors_df[all_authors_df['whole_fullcount'] >= min_documents]
+  ranks = view[sort_by].rank(ascending=False, method='min')
+  percentiles = view[sort_by].rank(pct=True) * 100
+  view = view.assign(rank = ranks, percentile = percentiles)
+  view = view.sort_values(['rank', 'scids']).head(top_k)
+  return view[['rank', 'percentile'] + list(all_authors_df.columns)].reset_index(drop=True)
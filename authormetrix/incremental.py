@@ -0,0 +1,248 @@
+#Incremental corpus updates: per-author accumulators kept on disk and updated with each new Scopus export, so that a monthly refresh costs in
+#proportion to the new papers instead of re-running the pipeline over the full history
+#Usage: python -m authormetrix.incremental --store faculty_store --add 2024_11.csv --ids faculty.csv --output faculty_metrics.csv
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from dataclasses import dataclass
+
+import pandas as pd
+import numpy as np
+import pyarrow as pa
+
+from .corpus import UNKNOWN_AUTHOR, corpus_preprocess
+from .registry import CREDIT_COLUMN_PAIRS
+from .schemas import expand_credit_schemes
+from .metrics import (ADDITIVE_METRICS, LONG_BYLINE_AUTHORS, build_author_index, coauthor_pair_keys, long_byline_masks, long_byline_union_sizes,
+                      count_short_byline_coauthors, unique_scids_table, metric_table_from_sums, values_of_codes, concatenated_ranges)
+from .cache import write_arrow_file
+
+
+
+#INCREMENTAL STORE
+#Authors get a code in order of first appearance, and keep it for the life of the store, so the accumulators only ever grow at the end.
+#'sums' holds the additive STEP 3 sums of every author (ADDITIVE_METRICS, as in the cube, over all documents seen so far).
+#The co-author sets are kept as in count_all_unique_coauthors: the distinct (author, co-author) pairs of the short-byline documents, sorted as
+#(code << 32 | co-author code), and the bylines of the few hyperauthored documents (CSR: long_offsets, long_authors), which would expand into billions of
+#pairs. 'long_union_sizes' holds the size of every author's union of long bylines, which only changes when the author is on a new long-byline document;
+#'unique_coauthors' holds every author's count, recounted for the affected authors at each update.
+#Documents are deduplicated across updates by EID ('eids' is sorted); within one export, corpus_preprocess removes duplicates as usual
+@dataclass
+class IncrementalStore:
+  scids: np.ndarray
+  sums: dict
+  unique_coauthors: np.ndarray
+  long_union_sizes: np.ndarray
+  coauthor_pairs: np.ndarray
+  long_offsets: np.ndarray
+  long_authors: np.ndarray
+  eids: np.ndarray
+  updates: pd.DataFrame #one row per applied export: file(s), new and already-seen documents, affected and new authors, seconds
+
+  def __len__ (self):
+    return len(self.eids)
+
+  #Codes of the given author IDs; IDs that are not in the store get UNKNOWN_AUTHOR
+  def encode_author_ids (self, ids):
+    ids = np.asarray(ids)
+    order = np.argsort(self.scids, kind='stable')
+    k = np.searchsorted(self.scids, ids, sorter=order)
+    known = k < len(order)
+    known[known] = self.scids[order[k[known]]] == ids[known]
+    codes = np.full(len(ids), UNKNOWN_AUTHOR, dtype=np.int64)
+    codes[known] = order[k[known]]
+    return codes
+
+  def has_eids (self, eids):
+    k = np.searchsorted(self.eids, eids)
+    seen = k < len(self.eids)
+    seen[seen] = self.eids[k[seen]] == eids[seen]
+    return seen
+
+def empty_incremental_store ():
+  sums = {metric: np.zeros(0, dtype=np.float64 if metric in dict(CREDIT_COLUMN_PAIRS).values() else np.int64) for metric in ADDITIVE_METRICS}
+  return IncrementalStore(scids = np.zeros(0, dtype=np.int64), sums = sums, unique_coauthors = np.zeros(0, dtype=np.int64),
+                          long_union_sizes = np.zeros(0, dtype=np.int64),
+                          coauthor_pairs = np.zeros(0, dtype=np.int64), long_offsets = np.zeros(1, dtype=np.int64),
+                          long_authors = np.zeros(0, dtype=np.int64), eids = np.zeros(0, dtype=object), updates = pd.DataFrame())
+
+#Additive sums of every author of a (new) corpus, indexed by the corpus' own codes
+def corpus_author_sums (corpus):
+  number_of_authors = len(corpus.scids)
+  authorcounts = np.diff(corpus.doc_offsets)
+  author_index = build_author_index(corpus)
+  index_codes = np.repeat(np.arange(number_of_authors), np.diff(author_index.offsets))
+  multi_author = authorcounts[author_index.doc_rows] > 1
+  first_author_codes = corpus.first_author_codes()
+  sums = {
+    'whole_fullcount': np.bincount(corpus.author_codes, minlength=number_of_authors),
+    'straight_firstauthor': np.bincount(first_author_codes, minlength=number_of_authors),
+    'straight_lastauthor': np.bincount(corpus.last_author_codes(), minlength=number_of_authors),
+    'single_author_publications': np.bincount(first_author_codes[authorcounts == 1], minlength=number_of_authors),
+    'multi_author_documents': np.bincount(index_codes[multi_author], minlength=number_of_authors),
+    'multi_author_authorcounts': np.bincount(index_codes[multi_author], weights=authorcounts[author_index.doc_rows[multi_author]],
+                                             minlength=number_of_authors).astype(np.int64)}
+  for allocation_col, sum_col in CREDIT_COLUMN_PAIRS:
+    sums[sum_col] = np.bincount(corpus.author_codes, weights=corpus.credits[allocation_col], minlength=number_of_authors)
+  return sums
+
+#Recounts the unique co-authors of the given authors (store codes) from their short-byline pairs and every long-byline document any of them is on.
+#The long-byline unions are only recomputed for long_byline_authors (the authors of the new long-byline documents); the others keep theirs
+def recount_unique_coauthors (store, authors, long_byline_authors):
+  long_numbers = np.repeat(np.arange(len(store.long_offsets) - 1), np.diff(store.long_offsets))
+  long_docs = np.unique(long_numbers[np.isin(store.long_authors, authors)])
+  long_codes = store.long_authors[concatenated_ranges(store.long_offsets[long_docs], store.long_offsets[long_docs + 1])]
+  long_numbers = np.repeat(np.arange(len(long_docs)), np.diff(store.long_offsets)[long_docs])
+  long_masks = long_byline_masks(len(store.scids), long_codes, long_numbers)
+  union_sizes = long_byline_union_sizes(long_codes, long_numbers, long_masks, long_byline_authors)
+  store.long_union_sizes[long_byline_authors] = union_sizes[long_byline_authors]
+  pair_keys = store.coauthor_pairs[concatenated_ranges(np.searchsorted(store.coauthor_pairs, authors << 32),
+                                                       np.searchsorted(store.coauthor_pairs, (authors + 1) << 32))]
+  short_byline_coauthors = count_short_byline_coauthors(pair_keys, long_masks)
+  store.unique_coauthors[authors] = np.maximum(store.long_union_sizes[authors] + short_byline_coauthors[authors] - 1, 0)
+
+#Adds a new Scopus export (one file or a list of files) to the store, in place. Documents whose EID is already in the store are skipped; only the
+#authors of the new documents are touched. Returns the store
+def apply_corpus_update (store, source):
+  start = time.perf_counter()
+  corpus, number_of_raw_docs = corpus_preprocess(source)
+  eids = corpus.docs['EID'].to_numpy().astype(str).astype(object)
+  already_seen = store.has_eids(eids)
+  corpus = expand_credit_schemes(corpus.select(~already_seen))
+  eids = eids[~already_seen]
+
+  #The affected authors are those on the new documents (the selection keeps the export's whole ID dictionary). Their store codes; authors seen for
+  #the first time are appended
+  affected = np.flatnonzero(np.bincount(corpus.author_codes, minlength=len(corpus.scids)))
+  store_codes = np.full(len(corpus.scids), UNKNOWN_AUTHOR, dtype=np.int64)
+  store_codes[affected] = store.encode_author_ids(corpus.scids[affected])
+  new_authors = affected[store_codes[affected] == UNKNOWN_AUTHOR]
+  store_codes[new_authors] = len(store.scids) + np.arange(len(new_authors))
+  store.scids = np.concatenate((store.scids, corpus.scids[new_authors]))
+  store.unique_coauthors = np.concatenate((store.unique_coauthors, np.zeros(len(new_authors), dtype=np.int64)))
+  store.long_union_sizes = np.concatenate((store.long_union_sizes, np.zeros(len(new_authors), dtype=np.int64)))
+  for metric, values in corpus_author_sums(corpus).items():
+    store.sums[metric] = np.concatenate((store.sums[metric], np.zeros(len(new_authors), dtype=store.sums[metric].dtype)))
+    store.sums[metric][store_codes[affected]] += values[affected].astype(store.sums[metric].dtype)
+
+  #Co-author pairs of the new short-byline documents, in store codes, inserted into the sorted pair array when not there yet; the new long bylines are appended
+  authorcounts = np.diff(corpus.doc_offsets)
+  long_byline = authorcounts > LONG_BYLINE_AUTHORS
+  pairs = coauthor_pair_keys(corpus, np.flatnonzero(~long_byline))
+  pairs = np.unique((store_codes[pairs >> 32] << 32) | store_codes[pairs & 0xFFFFFFFF])
+  positions = np.searchsorted(store.coauthor_pairs, pairs)
+  is_new_pair = np.ones(len(pairs), dtype=bool)
+  in_range = positions < len(store.coauthor_pairs)
+  is_new_pair[in_range] = store.coauthor_pairs[positions[in_range]] != pairs[in_range]
+  store.coauthor_pairs = np.insert(store.coauthor_pairs, positions[is_new_pair], pairs[is_new_pair])
+  long_docs = np.flatnonzero(long_byline)
+  new_long_authors = store_codes[corpus.author_codes[corpus.authorships_of(long_docs)]]
+  store.long_authors = np.concatenate((store.long_authors, new_long_authors))
+  store.long_offsets = np.concatenate((store.long_offsets, store.long_offsets[-1] + np.cumsum(authorcounts[long_docs])))
+  recount_unique_coauthors(store, store_codes[affected], np.unique(new_long_authors))
+
+  eids = np.unique(eids)
+  store.eids = np.insert(store.eids, np.searchsorted(store.eids, eids), eids)
+  update = {'files': ', '.join(corpus.sources['file']), 'rows': number_of_raw_docs, 'new_documents': len(corpus),
+            'already_seen_documents': int(already_seen.sum()), 'rejected_rows': len(corpus.rejects), 'affected_authors': len(affected),
+            'new_authors': len(new_authors), 'seconds': round(time.perf_counter() - start, 3)}
+  store.updates = pd.concat([store.updates, pd.DataFrame([update])], ignore_index=True)
+  return store
+
+
+
+#STEP 3 table (without document type and year filters) for the IDs in the first column of scids_df, or for every author of the store if scids_df is None
+def incremental_author_metrics (store, scids_df = None):
+  if scids_df is None:
+    scids_df = pd.DataFrame({'scids': np.sort(store.scids)})
+  scids_df = unique_scids_table(scids_df)
+  codes = store.encode_author_ids(scids_df['scids'].to_numpy())
+  sums = {metric: values_of_codes(values, codes) for metric, values in store.sums.items()}
+  scids_df = metric_table_from_sums(scids_df, sums)
+  scids_df['number_of_unique_COauthors'] = values_of_codes(store.unique_coauthors, codes)
+  return scids_df
+
+
+
+#PERSISTENCE
+#A store is a directory of Arrow files (authors and their sums, short-byline co-author pairs, long bylines, EIDs) and the update log as Parquet. It is written to a temporary
+#directory first and then swapped in, so that an interrupted update never leaves a half-written store behind
+def save_incremental_store (path, store):
+  path = os.path.abspath(path)
+  parent = os.path.dirname(path)
+  os.makedirs(parent, exist_ok=True)
+  temp_path = tempfile.mkdtemp(dir=parent)
+  try:
+    write_arrow_file(os.path.join(temp_path, 'authors.arrow'),
+                     pa.table({'scids': store.scids, 'unique_coauthors': store.unique_coauthors,
+                                                                     'long_union_sizes': store.long_union_sizes, **store.sums}))
+    write_arrow_file(os.path.join(temp_path, 'coauthor_pairs.arrow'), pa.table({'pair': store.coauthor_pairs}))
+    write_arrow_file(os.path.join(temp_path, 'long_offsets.arrow'), pa.table({'offset': store.long_offsets}))
+    write_arrow_file(os.path.join(temp_path, 'long_authors.arrow'), pa.table({'author': store.long_authors}))
+    write_arrow_file(os.path.join(temp_path, 'eids.arrow'), pa.table({'EID': pa.array(store.eids, type=pa.string())}))
+    store.updates.to_parquet(os.path.join(temp_path, 'updates.parquet'))
+    old_path = None
+    if os.path.isdir(path):
+      old_path = tempfile.mkdtemp(dir=parent)
+      os.replace(path, os.path.join(old_path, 'store'))
+    os.replace(temp_path, path)
+    if old_path:
+      shutil.rmtree(old_path, ignore_errors=True)
+  except OSError:
+    shutil.rmtree(temp_path, ignore_errors=True)
+    raise
+
+def load_incremental_store (path):
+  if not os.path.isdir(path):
+    return empty_incremental_store()
+  def read_table (name):
+    return pa.ipc.open_file(pa.memory_map(os.path.join(path, name))).read_all()
+  #Copies of the per-author arrays, as they are updated in place
+  authors = read_table('authors.arrow')
+  columns = {name: np.array(authors.column(name).combine_chunks().to_numpy(zero_copy_only=False)) for name in authors.column_names}
+  def read_array (name, column):
+    return read_table(name).column(column).combine_chunks().to_numpy()
+  return IncrementalStore(scids = columns.pop('scids'),
+                          unique_coauthors = columns.pop('unique_coauthors'),
+                          long_union_sizes = columns.pop('long_union_sizes'),
+                          sums = columns,
+                          coauthor_pairs = read_array('coauthor_pairs.arrow', 'pair'),
+                          long_offsets = read_array('long_offsets.arrow', 'offset'),
+                          long_authors = read_array('long_authors.arrow', 'author'),
+                          eids = read_table('eids.arrow').column('EID').to_numpy().astype(object),
+                          updates = pd.read_parquet(os.path.join(path, 'updates.parquet')))
+
+
+
+def parse_args (argv = None):
+  parser = argparse.ArgumentParser(prog='python -m authormetrix.incremental', description='Adds new Scopus exports to a stored set of per-author accumulators, and writes the metrics.')
+  parser.add_argument('--store', required=True, help='directory of the store (created by the first update)')
+  parser.add_argument('--add', nargs='+', default=[], help='Scopus export(s) (.csv) with the new documents, added as one update')
+  parser.add_argument('--ids', help='csv file with the Scopus IDs in the first column (default: every author in the store)')
+  parser.add_argument('--output', help='csv or parquet file for the metric table')
+  args = parser.parse_args(argv)
+  for path in args.add + ([args.ids] if args.ids else []):
+    if not os.path.isfile(path):
+      parser.error(f'file not found: {path}')
+  return args
+
+def main (argv = None):
+  args = parse_args(argv)
+  store = load_incremental_store(args.store)
+  if args.add:
+    store = apply_corpus_update(store, args.add)
+    save_incremental_store(args.store, store)
+  print(store.updates.to_string(index=False) if len(store.updates) else 'The store is empty')
+  print(f'{len(store)} documents and {len(store.scids)} authors in the store')
+  if args.output:
+    scids_df = incremental_author_metrics(store, pd.read_csv(args.ids) if args.ids else None)
+    if args.output.endswith('.parquet'):
+      scids_df.to_parquet(args.output, index=False)
+    else:
+      scids_df.to_csv(args.output, index=False)
+  return 0
+
+if __name__ == '__main__':
+  raise SystemExit(main())
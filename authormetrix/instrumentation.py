@@ -0,0 +1,144 @@
+#Per-stage instrumentation of the pipeline: wall time, peak memory, input and output rows of every stage. Each stage is emitted as one JSON log line
+#(logger 'authormetrix.stages'), and the stages of a run are also collected in a table, e.g. for the app's "Performance" expander
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import pandas as pd
+
+
+
+#input_rows are the documents of the corpus a stage reads, output_rows the rows of its result (documents of a corpus, authors of a metric table, cells of
+#the cube); None where that does not apply
+STAGE_COLUMNS = ['stage', 'seconds', 'peak_memory_mb', 'input_rows', 'output_rows']
+
+#File the JSON lines are appended to ('-' for standard error); '' leaves the logger unconfigured, for the embedding application to handle
+STAGE_LOG = os.environ.get('AUTHORMETRIX_STAGE_LOG', '')
+stage_logger = logging.getLogger('authormetrix.stages')
+
+def configure_stage_logging (destination = STAGE_LOG):
+  if not destination or any(getattr(handler, 'authormetrix_stages', False) for handler in stage_logger.handlers):
+    return
+  handler = logging.StreamHandler(sys.stderr) if destination == '-' else logging.FileHandler(destination)
+  handler.setFormatter(logging.Formatter('%(message)s'))
+  handler.authormetrix_stages = True
+  stage_logger.addHandler(handler)
+  stage_logger.setLevel(logging.INFO)
+
+configure_stage_logging()
+
+
+
+#PEAK MEMORY
+#Peak resident memory of the whole process during a stage. On Linux the high-water mark (VmHWM) is reset at the start of a stage (one small write to
+#/proc), which is cheap enough to leave on; elsewhere it is not measured (None). The mark and its reset are process-wide, and stages overlap in the app
+#(background jobs, concurrent sessions), so a stage only resets it when no other stage of the process is open: it never lowers the peak another stage
+#is measuring. A stage's peak_memory_mb is thus the process peak since the earliest stage still open started: exact for a stage that runs alone, an
+#upper bound for nested or overlapping stages, and it includes what other sessions allocated meanwhile
+def reset_peak_memory ():
+  try:
+    with open('/proc/self/clear_refs', 'w') as f:
+      f.write('5')
+    return True
+  except OSError:
+    return False
+
+#VmHWM (peak) or VmRSS (current) resident memory of the process, in MB
+def read_status_memory_mb (field):
+  try:
+    with open('/proc/self/status') as f:
+      for line in f:
+        if line.startswith(field + ':'):
+          return int(line.split()[1]) / 1024
+  except OSError:
+    pass
+  return None
+
+def read_peak_memory_mb ():
+  return read_status_memory_mb('VmHWM')
+
+def read_resident_memory_mb ():
+  return read_status_memory_mb('VmRSS')
+
+PEAK_MEMORY_AVAILABLE = reset_peak_memory() and read_peak_memory_mb() is not None
+#Stages open in this process, in any thread. A forked worker process (e.g. of a shard pool) has its own memory, and starts with none open
+open_stage_count = 0
+open_stage_lock = threading.Lock()
+
+def forget_open_stages ():
+  global open_stage_count, open_stage_lock
+  open_stage_count, open_stage_lock = 0, threading.Lock()
+
+if hasattr(os, 'register_at_fork'):
+  os.register_at_fork(after_in_child=forget_open_stages)
+
+
+
+#STAGES
+#The stage records of the current run (see record_stages) and its label
+current_stage_records = ContextVar('current_stage_records', default=None)
+current_run = ContextVar('current_run', default=None)
+
+#The background job (see jobs.py) the stages of this thread run for, if any. It is told when a stage starts and ends, and long loops report their rows
+#to it through report_rows; both raise JobCancelled once the job has been cancelled, which stops the computation there
+current_job = ContextVar('current_job', default=None)
+#Loops over authors report every ROWS_PER_REPORT authors
+ROWS_PER_REPORT = 256
+
+def report_rows (rows_done, rows_total):
+  job = current_job.get()
+  if job is not None:
+    job.rows_progress(rows_done, rows_total)
+
+#Starts collecting the stages of a run (in this thread or task) into a new list, which is returned; run labels the log lines
+def record_stages (run = None):
+  records = []
+  current_stage_records.set(records)
+  current_run.set(run)
+  return records
+
+def stage_table (records):
+  return pd.DataFrame(records, columns=STAGE_COLUMNS).astype({'input_rows': 'Int64', 'output_rows': 'Int64'})
+
+#Times the enclosed block as one stage; the yielded record can be given its output_rows (and input_rows, if only known at the end)
+@contextmanager
+def pipeline_stage (name, input_rows = None):
+  global open_stage_count
+  record = {'stage': name, 'seconds': None, 'peak_memory_mb': None, 'input_rows': input_rows, 'output_rows': None}
+  job = current_job.get()
+  if job is not None:
+    job.stage_started(name)
+  with open_stage_lock:
+    if open_stage_count == 0 and PEAK_MEMORY_AVAILABLE:
+      reset_peak_memory()
+    open_stage_count += 1
+  start = time.perf_counter()
+  try:
+    yield record
+  finally:
+    record['seconds'] = round(time.perf_counter() - start, 6)
+    #Read before the stage counts as closed, so that no other stage resets the mark in between
+    peak_memory_mb = read_peak_memory_mb() if PEAK_MEMORY_AVAILABLE else None
+    with open_stage_lock:
+      open_stage_count -= 1
+    record['peak_memory_mb'] = None if peak_memory_mb is None else round(peak_memory_mb, 1)
+    if job is not None:
+      job.stage_finished(name)
+    records = current_stage_records.get()
+    if records is not None:
+      records.append(record)
+    if stage_logger.isEnabledFor(logging.INFO):
+      stage_logger.info(json.dumps({'event': 'pipeline_stage', 'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'), 'run': current_run.get(), 'pid': os.getpid(),
+                                    **record}))
+
+#Runs function(corpus, *args) as a stage named after the function; output_rows is the length of the result, where it has one
+def run_stage (function, corpus, *args):
+  with pipeline_stage(function.__name__, len(corpus)) as stage:
+    result = function(corpus, *args)
+    stage['output_rows'] = len(result) if hasattr(result, '__len__') else None
+  return result
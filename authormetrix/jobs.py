@@ -0,0 +1,164 @@
+#Background jobs for the long computations of the Main page. A job runs in a thread of a pool shared by all sessions of the app and is keyed by its inputs
+#(the pipeline cache key of its result): a widget rerun, or another session asking for the same result, finds the job already running and follows its
+#progress instead of starting it again, and the page itself never blocks. Progress comes from the pipeline stages and from the rows that long loops
+#report (see instrumentation.current_job). A session that cancels a job stops following it; the job itself stops (at its next stage or row report) only
+#when no other session follows it any more
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import Context
+
+from .instrumentation import current_job, record_stages
+
+
+
+#Number of jobs computed at the same time, across all sessions; the others wait in the queue. Each job may still use PIPELINE_WORKERS processes
+JOB_WORKERS = int(os.environ.get('AUTHORMETRIX_JOB_WORKERS', 2))
+#Finished jobs kept until a session collects their result (the oldest are dropped beyond that)
+JOB_HISTORY = 32
+#A session that has not polled a job for this long (e.g. its browser tab was closed) no longer counts as following it
+JOB_FOLLOWER_SECONDS = 10
+
+JOB_STATUSES = ['queued', 'running', 'done', 'failed', 'cancelled']
+
+class JobCancelled(Exception):
+  pass
+
+#One computation and its progress. The worker thread writes the progress fields and the page reads them, one attribute at a time
+class PipelineJob:
+  def __init__ (self, key, label = None, expected_stages = None):
+    self.key = key
+    self.label = label
+    self.expected_stages = expected_stages #for the progress fraction; the stages nested in others count as well
+    self.status = 'queued'
+    self.result = None
+    self.error = None
+    self.stage_records = [] #the job's stages, as collected by record_stages
+    self.open_stages = [] #names of the stages running, innermost last
+    self.stages_done = 0
+    self.rows_done, self.rows_total = 0, None
+    self.submitted, self.started, self.finished = time.time(), None, None
+    self.cancel_requested = threading.Event()
+    self.finished_event = threading.Event()
+    self.followers = {} #session id -> time of its last poll
+    self.followers_lock = threading.Lock()
+
+  def follow (self, follower):
+    with self.followers_lock:
+      self.followers[follower] = time.time()
+
+  #Without a follower, stops the job. With one, only that session stops following it, and the job stops if no other session has polled it within
+  #JOB_FOLLOWER_SECONDS; returns whether the job was stopped
+  def cancel (self, follower = None):
+    with self.followers_lock:
+      self.followers.pop(follower, None)
+      if follower is not None and any(time.time() - polled < JOB_FOLLOWER_SECONDS for polled in self.followers.values()):
+        return False
+    self.cancel_requested.set()
+    return True
+
+  def check_cancelled (self):
+    if self.cancel_requested.is_set():
+      raise JobCancelled(f'{self.label or "job"} cancelled')
+
+  #Hooks of instrumentation.pipeline_stage and instrumentation.report_rows, called in the worker thread
+  def stage_started (self, name):
+    self.check_cancelled()
+    self.open_stages = self.open_stages + [name]
+    self.rows_done, self.rows_total = 0, None
+
+  def stage_finished (self, name):
+    self.open_stages = self.open_stages[:-1]
+    self.stages_done += 1
+    self.rows_done, self.rows_total = 0, None
+
+  def rows_progress (self, rows_done, rows_total):
+    self.check_cancelled()
+    self.rows_done, self.rows_total = rows_done, rows_total
+
+  @property
+  def is_finished (self):
+    return self.status in ('done', 'failed', 'cancelled')
+
+  #Waits at most timeout seconds for the job to finish; True if it has
+  def wait (self, timeout = None):
+    return self.finished_event.wait(timeout)
+
+  #Fraction done: the finished stages out of the expected ones, with the rows of the running stage as part of the next one. Never 1 before the end,
+  #as a job may run more stages than expected (e.g. preprocessing on a disk cache miss)
+  def progress (self):
+    if self.status == 'done':
+      return 1.0
+    if not self.expected_stages:
+      return self.rows_done / self.rows_total if self.rows_total else 0.0
+    rows_fraction = self.rows_done / self.rows_total if self.rows_total else 0.0
+    return min((self.stages_done + rows_fraction) / self.expected_stages, 0.99)
+
+  def describe (self):
+    if self.status == 'queued':
+      return f'{self.label}: waiting for a free worker'
+    seconds = (self.finished or time.time()) - self.started
+    if self.status != 'running':
+      return f'{self.label}: {self.status} after {seconds:.0f} s'
+    text = f'{self.label}: {self.open_stages[-1] if self.open_stages else "starting"}'
+    if self.rows_total:
+      text += f' ({self.rows_done:,} of {self.rows_total:,} authors)'
+    return f'{text}, {seconds:.0f} s'
+
+  #Runs compute() in the worker thread, in a context of its own: the thread's earlier jobs do not leak their stage records or job into this one
+  def run (self, compute):
+    self.started = time.time()
+    try:
+      self.check_cancelled()
+      self.status = 'running'
+      self.stage_records = record_stages(run=self.label)
+      current_job.set(self)
+      self.result = compute()
+      self.status = 'done'
+    except JobCancelled:
+      self.status = 'cancelled'
+    except Exception as error:
+      self.error = error
+      self.status = 'failed'
+    finally:
+      self.finished = time.time()
+      self.finished_event.set()
+
+
+
+#JOB RUNNER
+#Pool of job threads and the jobs by key, shared by all sessions (the app keeps one runner per server process)
+class JobRunner:
+  def __init__ (self, workers = JOB_WORKERS, history = JOB_HISTORY):
+    self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='authormetrix-job')
+    self.history = history
+    self.jobs = OrderedDict() #key -> PipelineJob, oldest first
+    self.lock = threading.Lock()
+
+  def get (self, key):
+    with self.lock:
+      return self.jobs.get(key)
+
+  #The job for key: the existing one whatever its status (a cancelled or failed job is only started again with restart), or a new job computing compute()
+  def submit (self, key, compute, label = None, expected_stages = None, restart = False):
+    with self.lock:
+      job = self.jobs.get(key)
+      if job is not None and not (restart and job.status in ('failed', 'cancelled')):
+        return job
+      job = PipelineJob(key, label, expected_stages)
+      self.jobs.pop(key, None)
+      self.jobs[key] = job
+      finished = [finished_key for finished_key, finished_job in self.jobs.items() if finished_job.is_finished]
+      for finished_key in finished[:max(len(finished) - self.history, 0)]:
+        del self.jobs[finished_key]
+    self.executor.submit(Context().run, job.run, compute)
+    return job
+
+  #Forgets a finished job once its result has been collected (it is in the pipeline cache), so that the runner does not hold on to results
+  def discard (self, key):
+    with self.lock:
+      job = self.jobs.get(key)
+      if job is not None and job.is_finished:
+        del self.jobs[key]
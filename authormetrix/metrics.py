@@ -0,0 +1,321 @@
+#Per-author output and collaboration metrics for a list of Scopus IDs
+import pandas as pd
+import numpy as np
+from dataclasses import dataclass
+
+from .corpus import UNKNOWN_AUTHOR
+from .registry import CREDIT_COLUMN_PAIRS
+from .instrumentation import ROWS_PER_REPORT, report_rows, run_stage
+
+
+
+#AGGREGATION ENGINE
+#Sums every requested credit column per author in one grouped pass over the flat authorship arrays: the authorships already carry dense author codes,
+#so each schema is a single bincount into an array indexed by code. 'whole_fullcount' (the number of authorships of each author) comes out of the same pass.
+#Row k of the result is the author with code k (corpus.scids[k])
+def aggregate_author_credits (corpus, column_pairs = ()):
+  number_of_authors = len(corpus.scids)
+  author_credits = pd.DataFrame({'scids': corpus.scids, 'whole_fullcount': np.bincount(corpus.author_codes, minlength=number_of_authors)})
+  for allocation_col, sum_col in column_pairs:
+    author_credits[sum_col] = np.bincount(corpus.author_codes, weights=corpus.credits[allocation_col], minlength=number_of_authors)
+  return author_credits
+
+#Values of a per-author array (indexed by code) for the given codes, with fill for UNKNOWN_AUTHOR
+def values_of_codes (values, codes, fill = 0):
+  known = codes != UNKNOWN_AUTHOR
+  result = np.full(len(codes), fill, dtype=np.result_type(values, fill))
+  result[known] = values[codes[known]]
+  return result
+
+#Positions of every value of the [starts, ends) ranges, concatenated
+def concatenated_ranges (starts, ends):
+  lengths = ends - starts
+  return np.repeat(starts, lengths) + np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+
+
+
+#AUTHOR INDEX
+#Inverted index from author code to the documents (row numbers in corpus.docs) the author appears on, built once per corpus.
+#Same CSR layout as the corpus itself: the documents of the author with code k are doc_rows[offsets[k]:offsets[k+1]], so a lookup costs only that author's own paper count.
+#scids is the corpus' ID dictionary; authors of the dictionary without documents (in a selection) have an empty range
+@dataclass
+class AuthorIndex:
+  scids: np.ndarray
+  offsets: np.ndarray
+  doc_rows: np.ndarray
+
+  def documents_of_code (self, code):
+    if code == UNKNOWN_AUTHOR:
+      return self.doc_rows[:0]
+    return self.doc_rows[self.offsets[code]:self.offsets[code+1]]
+
+  def documents (self, scid):
+    k = np.searchsorted(self.scids, scid)
+    if k == len(self.scids) or self.scids[k] != scid:
+      return self.doc_rows[:0]
+    return self.doc_rows[self.offsets[k]:self.offsets[k+1]]
+
+def build_author_index (corpus):
+  doc_index = corpus.doc_index()
+  #The authorships are in document order, so a stable sort by code alone gives (code, document) order
+  order = np.argsort(corpus.author_codes, kind='stable')
+  sorted_codes, sorted_docs = corpus.author_codes[order], doc_index[order]
+  #An ID listed twice on the same byline still counts that document only once
+  keep = np.ones(len(order), dtype=bool)
+  keep[1:] = (sorted_codes[1:] != sorted_codes[:-1]) | (sorted_docs[1:] != sorted_docs[:-1])
+  sorted_codes, sorted_docs = sorted_codes[keep], sorted_docs[keep]
+  offsets = np.concatenate(([0], np.cumsum(np.bincount(sorted_codes, minlength=len(corpus.scids))))).astype(np.int64)
+  return AuthorIndex(scids = corpus.scids, offsets = offsets, doc_rows = sorted_docs)
+
+
+
+#SCID FUNCTION 1
+#author_credits is the output of aggregate_author_credits; it is computed here if not supplied
+def extract_whole_and_straight_counts(corpus, scids_df, author_credits = None):
+  #S1.1
+  #Instruction would have the Scopus IDs to be in the first column; so I rename whatever the first column is to 'scids'
+  scids_df = scids_df.rename(columns={scids_df.columns[0]: 'scids'}).reset_index(drop=True)
+  
+  #S1.2
+  #Extracts whole counts; the number of appearances (authorships) of each scid
+  #The IDs are translated to codes once, and every count is then read from the aggregation engine's per-code arrays; scids that are not found get zeros
+  if author_credits is None:
+    author_credits = aggregate_author_credits(corpus)
+  codes = corpus.encode_author_ids(scids_df['scids'].to_numpy())
+  scids_df['whole_fullcount'] = values_of_codes(author_credits['whole_fullcount'].to_numpy(), codes)
+  #Missing values of the uploaded columns are filled with zeros as well
+  scids_df = scids_df.fillna(0)
+  scids_df['whole_fullcount'] = scids_df['whole_fullcount'].astype(int)
+
+  #S1.3
+  #Extract straight credits for first and last authors
+  #One bincount over the codes of the first authors and one over those of the last authors
+  number_of_authors = len(corpus.scids)
+  scids_df['straight_firstauthor'] = values_of_codes(np.bincount(corpus.first_author_codes(), minlength=number_of_authors), codes).astype(int)
+  scids_df['straight_lastauthor'] = values_of_codes(np.bincount(corpus.last_author_codes(), minlength=number_of_authors), codes).astype(int)
+  return scids_df
+
+def extract_fractional_standard(corpus, scids_df):
+    return extract_allocation_sum(corpus, scids_df, 'fractional_credit_EQ', 'fractional_equal')
+
+
+
+def extract_allocation_sum(corpus, scids_df, allocation_col, sum_col):
+    return Multiplex_extract_allocation_sum(corpus, scids_df, [(allocation_col, sum_col)])
+
+#Adds one summed column per (allocation column, sum column) pair, all from a single run of the aggregation engine
+def Multiplex_extract_allocation_sum(corpus, scids_df, column_pairs, author_credits = None):
+    if author_credits is None:
+        author_credits = aggregate_author_credits(corpus, column_pairs)
+    scids_df = scids_df.reset_index(drop=True)
+    codes = corpus.encode_author_ids(scids_df['scids'].to_numpy())
+
+    # Reads the summed allocations of each scid by code, with 0 for scids that are not found
+    for _, sum_col in column_pairs:
+        scids_df[sum_col] = values_of_codes(author_credits[sum_col].to_numpy(), codes, 0.0)
+
+    return scids_df
+
+
+#Collaboration Functions
+def count_one_author_publications (corpus, scids_df):
+  #Filter the corpus to only single-author documents, i.e when authorcount ==1; the single author is then the first author
+  #One bincount over the codes of the single authors, read by code for the scids
+  single_author = np.diff(corpus.doc_offsets) == 1
+  one_author_pubs = np.bincount(corpus.first_author_codes()[single_author], minlength=len(corpus.scids))
+  scids_df['single_author_publications'] = values_of_codes(one_author_pubs, corpus.encode_author_ids(scids_df['scids'].to_numpy())).astype(int)
+  return scids_df
+
+
+
+#The remaining collaboration functions answer each scid from the author index; it is built here if not supplied
+
+
+
+def calculate_collaborations_DC_CI_CC (corpus, scids_df, author_index = None):
+  if author_index is None:
+    author_index = build_author_index(corpus)
+  #DC - from scids_df only
+  scids_df['degree_of_collaboration'] = ((scids_df['whole_fullcount'] - scids_df['single_author_publications'])/scids_df['whole_fullcount'])#.fillna(0)
+  #CI - i.e average NAPD of multi_author publications only (from both dataframes)
+  #scids_df['scids'] = scids_df['scids'].astype(int) scids are already integer froms
+  #The authorcounts of every author's distinct multi-author documents are summed and counted per code, in two bincounts over the author index
+  authorcounts = corpus.docs['authorcount'].to_numpy()
+  index_codes = np.repeat(np.arange(len(author_index.scids)), np.diff(author_index.offsets))
+  index_authorcounts = authorcounts[author_index.doc_rows]
+  multi_author = index_authorcounts > 1
+  multi_author_documents = np.bincount(index_codes[multi_author], minlength=len(author_index.scids))
+  multi_author_authorcounts = np.bincount(index_codes[multi_author], weights=index_authorcounts[multi_author], minlength=len(author_index.scids))
+  codes = corpus.encode_author_ids(scids_df['scids'].to_numpy())
+  person_documents = values_of_codes(multi_author_documents, codes)
+  with np.errstate(invalid='ignore', divide='ignore'):
+    scids_df['collaboration_index'] = np.where(person_documents > 0, values_of_codes(multi_author_authorcounts, codes) / person_documents, np.nan)
+  scids_df['collaboration_coefficient'] = (1 - (scids_df['fractional_equal']/scids_df['whole_fullcount']))#.fillna(0)
+  #Is it better for these metrics to be just NaN rather than 0, for individuals who have zero publications? NaN seems reasonable as there is no collaboration when there is no publication.
+  return scids_df
+
+
+#doc_mask (optional) restricts the count to the co-authors on a selection of the corpus' documents, without rebuilding the index
+def find_unique_coauthors (corpus, scids_df, author_index = None, doc_mask = None):
+  if author_index is None:
+    author_index = build_author_index(corpus)
+  #scids_df['scids'] = scids_df['scids'].astype(int)
+  #Each person's co-authors are flagged in one boolean array over all authors of the corpus, counted, and unflagged; this avoids sorting every co-author list
+  is_coauthor = np.zeros(len(author_index.scids), dtype=bool)
+  number_of_unique_COauthors = []
+  codes = corpus.encode_author_ids(scids_df['scids'].to_numpy())
+  for row, code in enumerate(codes):
+    if row % ROWS_PER_REPORT == 0:
+      report_rows(row, len(codes))
+    documents = author_index.documents_of_code(code)
+    if doc_mask is not None:
+      documents = documents[doc_mask[documents]]
+    coauthor_codes = corpus.author_codes[corpus.authorships_of(documents)]
+    is_coauthor[coauthor_codes] = True
+    unique_coauthors = np.count_nonzero(is_coauthor)
+    is_coauthor[coauthor_codes] = False
+    #The person is part of the unique set, hence the -1; the max() avoids negative values for authors with no publications
+    number_of_unique_COauthors.append(max(unique_coauthors - 1, 0))
+  scids_df['number_of_unique_COauthors'] = number_of_unique_COauthors
+  return scids_df
+
+
+#Number of unique co-authors of every author of the index (aligned with author_index.scids) in one pass, for the "all authors" mode.
+#Documents with short bylines are expanded into (author, co-author) pairs, which are de-duplicated with one sort. Expanding the few hyperauthored
+#documents would create billions of pairs, so for those each author gets the set of long documents they are on (a bitmask); the union of the
+#bylines is counted once per distinct set, and a short-byline co-author already in that union is not counted again
+LONG_BYLINE_AUTHORS = 100
+#Number of set bits of every 16-bit value, and the memory used for the union bitsets at a time
+BIT_COUNTS = np.array([bin(value).count('1') for value in range(65536)], dtype=np.uint8)
+UNION_BLOCK_BYTES = 64 * 1024**2
+
+def count_all_unique_coauthors (corpus, author_index, doc_mask = None):
+  number_of_authors = len(author_index.scids)
+  authorcounts = np.diff(corpus.doc_offsets)
+  selected = np.ones(len(corpus), dtype=bool) if doc_mask is None else np.asarray(doc_mask, dtype=bool)
+  long_byline = authorcounts > LONG_BYLINE_AUTHORS
+  long_docs = np.flatnonzero(long_byline & selected)
+  long_codes = corpus.author_codes[corpus.authorships_of(long_docs)]
+  long_numbers = np.repeat(np.arange(len(long_docs)), authorcounts[long_docs])
+  long_masks = long_byline_masks(number_of_authors, long_codes, long_numbers)
+  long_byline_coauthors = long_byline_union_sizes(long_codes, long_numbers, long_masks)
+  short_byline_coauthors = count_short_byline_coauthors(coauthor_pair_keys(corpus, np.flatnonzero(~long_byline & selected)), long_masks)
+  #The author is part of the unique set, hence the -1; authors without a selected document get 0
+  return np.maximum(long_byline_coauthors + short_byline_coauthors - 1, 0)
+
+#Distinct (author, co-author) pairs of the given documents, the author itself included, as sorted keys (code << 32 | co-author code)
+def coauthor_pair_keys (corpus, doc_rows):
+  authorcounts = np.diff(corpus.doc_offsets)
+  authorship_docs = np.repeat(doc_rows, authorcounts[doc_rows])
+  partners = corpus.author_codes[corpus.authorships_of(authorship_docs)]
+  owners = np.repeat(corpus.author_codes[corpus.authorships_of(doc_rows)], authorcounts[authorship_docs])
+  return np.unique((owners.astype(np.int64) << 32) | partners)
+
+#Long-byline documents each author is on, from the authors of the long-byline documents (long_codes) and the document number of each (long_numbers):
+#the distinct authors, the row of each authorship among them, their sets of documents as rows of 64-bit words, and the row of every author code (-1 if none)
+def long_byline_masks (number_of_authors, long_codes, long_numbers):
+  number_of_long_docs = int(long_numbers[-1]) + 1 if len(long_numbers) else 0
+  long_authors, mask_rows = np.unique(long_codes, return_inverse=True)
+  masks = np.zeros((len(long_authors), (number_of_long_docs + 63) // 64), dtype=np.uint64)
+  np.bitwise_or.at(masks, (mask_rows, long_numbers // 64), np.left_shift(np.uint64(1), (long_numbers % 64).astype(np.uint64)))
+  mask_row_of = np.full(number_of_authors, -1, dtype=np.int64)
+  mask_row_of[long_authors] = np.arange(len(long_authors))
+  return long_authors, mask_rows, masks, mask_row_of
+
+#Size of the union of the long bylines of every author, once per distinct set of long documents. Each long document's byline is a bitset over the authors
+#of long documents, so a union is an OR of bitset rows and its size a bit count; distinct sets are processed in blocks, one long document at a time.
+#authors (optional) limits the unions to the sets of those authors; the others get 0
+def long_byline_union_sizes (long_codes, long_numbers, long_masks, authors = None):
+  long_authors, mask_rows, masks, mask_row_of = long_masks
+  union_sizes_of_authors = np.zeros(len(mask_row_of), dtype=np.int64)
+  counted_rows = np.arange(len(long_authors)) if authors is None else mask_row_of[authors][mask_row_of[authors] >= 0]
+  if len(counted_rows) == 0:
+    return union_sizes_of_authors
+  number_of_long_docs = masks.shape[1] * 64
+  bylines = np.zeros((number_of_long_docs, (len(long_authors) + 63) // 64 * 64), dtype=bool)
+  bylines[long_numbers, mask_rows] = True
+  bylines = np.packbits(bylines, axis=1).view(np.uint64)
+  distinct_masks, set_of_author = np.unique(masks[counted_rows], axis=0, return_inverse=True)
+  has_doc = np.unpackbits(distinct_masks.view(np.uint8), axis=1, bitorder='little').astype(bool)
+  union_sizes = np.zeros(len(distinct_masks), dtype=np.int64)
+  block = max(1, UNION_BLOCK_BYTES // bylines[0].nbytes)
+  for first in range(0, len(distinct_masks), block):
+    block_has_doc = has_doc[first:first + block]
+    unions = np.zeros((len(block_has_doc), bylines.shape[1]), dtype=np.uint64)
+    for doc in np.flatnonzero(block_has_doc.any(axis=0)):
+      unions[block_has_doc[:, doc]] |= bylines[doc]
+    union_sizes[first:first + block] = BIT_COUNTS[unions.view(np.uint16)].sum(axis=1)
+  union_sizes_of_authors[long_authors[counted_rows]] = union_sizes[set_of_author.ravel()]
+  return union_sizes_of_authors
+
+#Number of short-byline co-authors (pair_keys, as from coauthor_pair_keys) of every author that are not already in the author's long-byline union:
+#a pair is counted there when both authors share a long document
+def count_short_byline_coauthors (pair_keys, long_masks):
+  _, _, masks, mask_row_of = long_masks
+  owners, partners = pair_keys >> 32, pair_keys & 0xFFFFFFFF
+  both_long = (mask_row_of[owners] >= 0) & (mask_row_of[partners] >= 0)
+  shared = np.zeros(len(pair_keys), dtype=bool)
+  if both_long.any():
+    shared[both_long] = (masks[mask_row_of[owners[both_long]]] & masks[mask_row_of[partners[both_long]]]).any(axis=1)
+  return np.bincount(owners[~shared], minlength=len(mask_row_of))
+
+
+
+#STEP 3 TABLE FROM PER-AUTHOR SUMS
+#The cube and the incremental store keep the same additive sums per author; every column of the STEP 3 table except the unique co-authors derives from them.
+#The sums of the collaboration index are over the author's distinct multi-author documents
+ADDITIVE_METRICS = (['whole_fullcount', 'straight_firstauthor', 'straight_lastauthor', 'single_author_publications', 'multi_author_documents',
+                     'multi_author_authorcounts'] + [sum_col for _, sum_col in CREDIT_COLUMN_PAIRS])
+
+#The uploaded IDs (first column) renamed to 'scids', without duplicates
+def unique_scids_table (scids_df):
+  first_column = scids_df.columns[0]
+  scids_df = scids_df.rename(columns={first_column: 'ID'})
+  scids_df = scids_df.drop_duplicates(subset =['ID'], keep='first')
+  return scids_df.rename(columns={'ID': 'scids'}).reset_index(drop=True)
+
+#sums: metric -> array aligned with the rows of scids_df
+def metric_table_from_sums (scids_df, sums):
+  for metric in ['whole_fullcount', 'straight_firstauthor', 'straight_lastauthor']:
+    scids_df[metric] = sums[metric].astype(int)
+  #As in extract_whole_and_straight_counts, missing values of the uploaded columns are filled with zeros
+  scids_df = scids_df.fillna(0)
+  for _, metric in CREDIT_COLUMN_PAIRS:
+    scids_df[metric] = sums[metric]
+  scids_df['first_last_author_proportion'] = (scids_df['straight_firstauthor'] + scids_df['straight_lastauthor'])/scids_df['whole_fullcount']
+
+  #COLLABORATION STUFF
+  scids_df['single_author_publications'] = sums['single_author_publications'].astype(int)
+  scids_df['degree_of_collaboration'] = ((scids_df['whole_fullcount'] - scids_df['single_author_publications'])/scids_df['whole_fullcount'])
+  multi_author_documents = sums['multi_author_documents']
+  with np.errstate(invalid='ignore', divide='ignore'):
+    scids_df['collaboration_index'] = np.where(multi_author_documents > 0, sums['multi_author_authorcounts'] / multi_author_documents, np.nan)
+  scids_df['collaboration_coefficient'] = (1 - (scids_df['fractional_equal']/scids_df['whole_fullcount']))
+  return scids_df
+
+
+
+#Full STEP 3 metric table for the uploaded list of Scopus IDs (a dataframe with the IDs in the first column), from a corpus with its credit schemas expanded
+def compute_author_metrics (corpus, scids_df):
+  #We need to rename the first column to 'ID' from whatever the user labelled it
+  first_column = scids_df.columns[0]
+  scids_df = scids_df.rename(columns={first_column: 'ID'})
+  #we also need to remove duplicates as I have found that this messes with results if an ID shows up more than once.
+  scids_df = scids_df.drop_duplicates(subset =['ID'], keep='first')
+
+  #Whole counts and all schema sums come out of one pass of the aggregation engine. Every step is timed as a pipeline stage
+  author_credits = run_stage (aggregate_author_credits, corpus, CREDIT_COLUMN_PAIRS)
+  scids_df = run_stage (extract_whole_and_straight_counts, corpus, scids_df, author_credits)
+  scids_df = run_stage (Multiplex_extract_allocation_sum, corpus, scids_df, CREDIT_COLUMN_PAIRS, author_credits)
+
+  #Calculate first and last author proportion. This is the percentage of publications where the author is the first author or last author relative to the total number of publications
+  scids_df['first_last_author_proportion'] = (scids_df['straight_firstauthor'] + scids_df['straight_lastauthor'])/scids_df['whole_fullcount']
+
+
+  #COLLABORATION STUFF
+  scids_df = run_stage (count_one_author_publications, corpus, scids_df)
+  #The author index is built once and shared by the collaboration functions
+  author_index = run_stage (build_author_index, corpus)
+  scids_df = run_stage (calculate_collaborations_DC_CI_CC, corpus, scids_df, author_index)
+  scids_df = run_stage (find_unique_coauthors, corpus, scids_df, author_index)
+  return scids_df
@@ -0,0 +1,165 @@
+#Co-authorship graph of a corpus and the network metrics of a list of authors: co-authors, joint papers, internal vs external collaboration within the
+#list, and ego-network sizes
+from dataclasses import dataclass
+
+import pandas as pd
+import numpy as np
+
+from .corpus import UNKNOWN_AUTHOR
+from .metrics import LONG_BYLINE_AUTHORS, concatenated_ranges, unique_scids_table
+from .instrumentation import ROWS_PER_REPORT, report_rows
+
+
+
+#CO-AUTHORSHIP GRAPH
+#Built once per corpus (or selection of documents), over the dense author codes. The ties from documents with short bylines are stored as a sparse
+#adjacency in CSR layout, with the number of joint papers of every tie: the co-authors of the author with code k are indices[indptr[k]:indptr[k+1]]
+#(sorted), with joint_papers[indptr[k]:indptr[k+1]]. A hyperauthored document would add a tie for every pair of its thousands of authors, so the
+#documents with more than LONG_BYLINE_AUTHORS distinct authors only contribute through the author-document incidence, also in CSR layout both ways:
+#the documents of author k are author_docs[author_doc_offsets[k]:author_doc_offsets[k+1]], and the distinct authors of document j (a row of
+#corpus.docs) are byline_codes[byline_offsets[j]:byline_offsets[j+1]]. Memory is proportional to the short-byline ties plus the authorships
+@dataclass
+class CoauthorshipGraph:
+  scids: np.ndarray #the corpus' ID dictionary; an author's code is its position here
+  indptr: np.ndarray
+  indices: np.ndarray
+  joint_papers: np.ndarray
+  author_doc_offsets: np.ndarray
+  author_docs: np.ndarray
+  byline_offsets: np.ndarray
+  byline_codes: np.ndarray
+
+  #Number of stored ties and authorships
+  def __len__ (self):
+    return len(self.indices) + len(self.byline_codes)
+
+  #Codes of the given author IDs (UNKNOWN_AUTHOR for IDs without documents in the corpus), as Corpus.encode_author_ids
+  def encode_author_ids (self, ids):
+    ids = np.asarray(ids)
+    codes = np.searchsorted(self.scids, ids).astype(np.int64)
+    known = codes < len(self.scids)
+    known[known] = self.scids[codes[known]] == ids[known]
+    codes[~known] = UNKNOWN_AUTHOR
+    return codes
+
+  #Authors of the given documents (rows of corpus.docs), concatenated
+  def authors_of_documents (self, doc_rows):
+    return self.byline_codes[concatenated_ranges(self.byline_offsets[doc_rows], self.byline_offsets[doc_rows + 1])]
+
+  #Co-authors of one author (sorted codes) and the number of papers they share with the author
+  def coauthors_of_code (self, code):
+    if code == UNKNOWN_AUTHOR:
+      return self.indices[:0], self.joint_papers[:0]
+    coauthors = self.indices[self.indptr[code]:self.indptr[code+1]]
+    joint_papers = self.joint_papers[self.indptr[code]:self.indptr[code+1]]
+    docs = self.author_docs[self.author_doc_offsets[code]:self.author_doc_offsets[code+1]]
+    long_docs = docs[self.byline_offsets[docs + 1] - self.byline_offsets[docs] > LONG_BYLINE_AUTHORS]
+    if len(long_docs) == 0:
+      return coauthors, joint_papers
+    #The ties of the long documents are counted per author code, in one array over all authors
+    papers = np.bincount(self.authors_of_documents(long_docs), minlength=len(self.scids)).astype(joint_papers.dtype)
+    papers[code] = 0
+    papers[coauthors] += joint_papers
+    coauthors = np.flatnonzero(papers).astype(coauthors.dtype)
+    return coauthors, papers[coauthors]
+
+  #Every author of a document of one of the given authors, as flags over all authors. Going through the distinct documents counts a document shared by
+  #many of the authors once, where their rows of co-authors would repeat it
+  def authors_of_documents_of (self, codes):
+    is_document = np.zeros(len(self.byline_offsets) - 1, dtype=bool)
+    is_document[self.author_docs[positions_of_rows(self.author_doc_offsets, codes)]] = True
+    is_reached = np.zeros(len(self.scids), dtype=bool)
+    is_reached[self.byline_codes[positions_of_rows(self.byline_offsets, np.flatnonzero(is_document))]] = True
+    return is_reached
+
+#Positions of the values of the given rows of a CSR layout: their ranges concatenated, or, when the rows hold a large part of all the values, a boolean
+#mask over the values (one pass over the offsets instead of building every position)
+def positions_of_rows (offsets, rows):
+  if (offsets[rows + 1] - offsets[rows]).sum() * 4 < offsets[-1]:
+    return concatenated_ranges(offsets[rows], offsets[rows + 1])
+  is_row = np.zeros(len(offsets) - 1, dtype=bool)
+  is_row[rows] = True
+  return np.repeat(is_row, np.diff(offsets))
+
+#Graph of the documents selected by doc_mask (all documents if None). An ID listed twice on the same byline is one author of that document
+def build_coauthorship_graph (corpus, doc_mask = None):
+  number_of_authors = len(corpus.scids)
+  doc_index = corpus.doc_index()
+  codes = corpus.author_codes
+  if doc_mask is not None:
+    selected = np.asarray(doc_mask, dtype=bool)[doc_index]
+    doc_index, codes = doc_index[selected], codes[selected]
+  #Distinct authors of every document, in (document, code) order
+  authorship_keys = np.unique(doc_index.astype(np.int64) * max(number_of_authors, 1) + codes)
+  doc_index, codes = authorship_keys // max(number_of_authors, 1), (authorship_keys % max(number_of_authors, 1)).astype(np.int32)
+  byline_sizes = np.bincount(doc_index, minlength=len(corpus))
+  offsets = np.concatenate(([0], np.cumsum(byline_sizes))).astype(np.int64)
+
+  #Short bylines: every ordered pair of distinct authors of a document is one joint paper of that tie
+  short_docs = np.flatnonzero((byline_sizes > 1) & (byline_sizes <= LONG_BYLINE_AUTHORS))
+  owner_positions = concatenated_ranges(offsets[short_docs], offsets[short_docs + 1])
+  partner_counts = np.repeat(byline_sizes[short_docs], byline_sizes[short_docs])
+  owners = np.repeat(codes[owner_positions].astype(np.int64), partner_counts)
+  partners = codes[concatenated_ranges(np.repeat(offsets[short_docs], byline_sizes[short_docs]), np.repeat(offsets[short_docs + 1], byline_sizes[short_docs]))]
+  not_self = owners != partners
+  tie_keys, joint_papers = np.unique((owners[not_self] << 32) | partners[not_self], return_counts=True)
+  del owners, partners, not_self
+  indptr = np.concatenate(([0], np.cumsum(np.bincount(tie_keys >> 32, minlength=number_of_authors)))).astype(np.int64)
+
+  #The documents of every author, in (author, document) order
+  author_order = np.argsort(codes, kind='stable')
+  author_doc_offsets = np.concatenate(([0], np.cumsum(np.bincount(codes, minlength=number_of_authors)))).astype(np.int64)
+  return CoauthorshipGraph(scids = corpus.scids, indptr = indptr, indices = (tie_keys & 0xFFFFFFFF).astype(np.int32),
+                           joint_papers = joint_papers.astype(np.int32), author_doc_offsets = author_doc_offsets,
+                           author_docs = doc_index[author_order].astype(np.int32), byline_offsets = offsets, byline_codes = codes)
+
+
+
+#NETWORK METRICS
+#Per author of the list (first column of scids_df): degree (unique co-authors, as number_of_unique_COauthors in STEP 3), joint_papers (the co-authorship
+#frequency: papers shared with each co-author, summed over the co-authors), max_joint_papers (the strongest tie), repeat_coauthors (co-authors with 2+
+#joint papers), internal_coauthors and internal_joint_papers (co-authors that are in the list themselves), external_coauthors (the others), and
+#ego_network_size (the authors within two co-authorship steps, the author excluded). Sets of authors are flagged in boolean arrays over all authors
+#and counted, as in find_unique_coauthors, instead of being sorted
+NETWORK_COLUMNS = ['degree', 'joint_papers', 'max_joint_papers', 'repeat_coauthors', 'internal_coauthors', 'external_coauthors', 'internal_joint_papers',
+                   'ego_network_size']
+
+def coauthorship_metrics (graph, scids_df):
+  scids_df = unique_scids_table(scids_df)
+  codes = graph.encode_author_ids(scids_df['scids'].to_numpy())
+  is_listed = np.zeros(len(graph.scids), dtype=bool)
+  is_listed[codes[codes != UNKNOWN_AUTHOR]] = True
+  metrics = np.zeros((len(codes), len(NETWORK_COLUMNS)), dtype=np.int64)
+  for row, code in enumerate(codes):
+    if row % ROWS_PER_REPORT == 0:
+      report_rows(row, len(codes))
+    coauthors, joint_papers = graph.coauthors_of_code(code)
+    if len(coauthors) == 0:
+      continue
+    internal = is_listed[coauthors]
+    #The two-step neighbourhood is every author of the documents of the co-authors, the author included
+    ego_network_size = np.count_nonzero(graph.authors_of_documents_of(coauthors)) - 1
+    metrics[row] = [len(coauthors), joint_papers.sum(), joint_papers.max(), np.count_nonzero(joint_papers > 1), np.count_nonzero(internal),
+                    np.count_nonzero(~internal), joint_papers[internal].sum(), ego_network_size]
+  return pd.concat([scids_df[['scids']], pd.DataFrame(metrics, columns=NETWORK_COLUMNS)], axis=1)
+
+#Every tie of the authors of the list: author, co-author, number of joint papers, and whether the co-author is in the list (internal_only keeps those
+#ties only: the collaboration network within the list)
+def coauthor_pairs (graph, scids_df, internal_only = False):
+  scids_df = unique_scids_table(scids_df)
+  codes = graph.encode_author_ids(scids_df['scids'].to_numpy())
+  codes = codes[codes != UNKNOWN_AUTHOR]
+  is_listed = np.zeros(len(graph.scids), dtype=bool)
+  is_listed[codes] = True
+  authors, coauthors, joint_papers = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=graph.joint_papers.dtype)]
+  for code in codes:
+    code_coauthors, code_joint_papers = graph.coauthors_of_code(code)
+    if internal_only:
+      internal = is_listed[code_coauthors]
+      code_coauthors, code_joint_papers = code_coauthors[internal], code_joint_papers[internal]
+    authors.append(np.full(len(code_coauthors), code))
+    coauthors.append(code_coauthors)
+    joint_papers.append(code_joint_papers)
+  coauthors = np.concatenate(coauthors)
+  return pd.DataFrame({'scids': graph.scids[np.concatenate(authors)], 'coauthor_scids': graph.scids[coauthors], 'joint_papers': np.concatenate(joint_papers),
+                       'internal': is_listed[coauthors]})
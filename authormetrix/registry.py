@@ -0,0 +1,195 @@
+#Schema registry: the 13 credit-allocation schemas (as vectorized kernels), their names, and a cached table of their credits shared by all pages
+import numpy as np
+import pandas as pd
+import os
+import threading
+from collections import OrderedDict
+
+
+
+#SCHEMA KERNELS
+#Each schema is a vectorized NumPy kernel giving the credit of every byline position (1..n) of a document with n authors, as a float64 array.
+#Powers are taken in closed form or in log space, so a paper with thousands of authors costs a few array operations (the pure-Python versions used
+#big integers for the geometric schema). The kernels match the earlier pure-Python formulas to within 1e-12 relative error wherever those give a normal
+#float (see tests/test_registry.py, n = 1..5000). Below ~2.2e-308 (subnormal floats, e.g. geometric_standard from position 1022 of a paper with 1,022+
+#authors) both round differently by up to 5e-324: position 1075 of geometric_standard is 5e-324 with the earlier formula and 0 with its kernel
+def author_positions (n):
+  return np.arange(1, n + 1, dtype=np.float64)
+
+#1.1  Equal fractional credit
+def calculate_fractional_equal (n):
+  return np.full(n, 1/n)
+
+#1.2  Last author emphasis (LAE) then equal credits for all preceding authors
+def calculate_fractional_LAE (n):
+  if n == 1:
+    return np.ones(1)
+  credits = np.full(n, 0.5/(n-1))
+  credits[-1] = 0.5
+  return credits
+
+#1.3  First author emphasis (FAE) then equal credits thereafter
+def calculate_fractional_FAE (n):
+  if n == 1:
+    return np.ones(1)
+  credits = np.full(n, 0.5/(n-1))
+  credits[0] = 0.5
+  return credits
+
+#1.4  First and last authors emphasis (FLAE) then equal credits thereafter; first and last author get at least 0.4 credits
+#This is exactly consistent with Credit13_Abramo et al 2013 from Xu et al., 2016
+def calculate_fractional_FLAE (n):
+  if n <= 2:
+    return np.full(n, 1/n)
+  credits = np.full(n, 0.2/(n-2))
+  credits[[0, -1]] = 0.4
+  return credits
+
+#2.1  Arithmetic credit alocation: Credit03_proportional schema in Xu et al., 2016
+def calculate_arithmetic (n):
+  i = author_positions(n)
+  return 2 * (1 - i/(n+1)) / n
+
+#2.2  Called Arithmetic_V because this formular (originally from Aziz and Rozing, 2013) named harmonic parabolic by Sundling, 2023 turns out to be neither harmonic nor parabolic.
+def calculate_arithmetic_V (n):
+  i = author_positions(n)
+  #n*(1-(1/(2*n))) in the odd denominator is simply n - 0.5
+  denominator = 0.5*n**2 + n if n % 2 == 0 else 0.5*n**2 + n - 0.5
+  return (1 + np.abs(n + 1 - 2*i)) / denominator
+
+#3.1  Based on the golden number. It somewhat prioritizes the first author (never less than 0.62); Assimakis & Adam 2010 eq #28;
+# another simpler formula(which I initially used) is available in Xu et al., J. Infor Sci. 2022 eq#11)
+def calculate_golden_share (n):
+  if n == 1:
+    return np.ones(1)
+  exponents = 2*author_positions(n) - 1
+  exponents[-1] = 2*n - 2
+  return 0.618 ** exponents
+
+#3.2  Geometric credit alocation: Credit05_Geometric schema in Xu et al., 2016
+#2**(n-i)/(2**n - 1) is rewritten as 2**-i/(1 - 2**-n), which never needs a number larger than 1
+def calculate_geometric (n):
+  return np.exp2(-author_positions(n)) / (1 - 2.0**-n)
+
+#3.3  Geometric with i:i+1 ratio adaptivity (2 in standard geometric regardless of total author number): Liu and Fang, 2023
+#(n**(1/(n-1))-1) * n**((n-i)/(n-1)) / (n**(n/(n-1))-1), in log space; expm1 keeps the two "-1" terms accurate when n is large and the ratio is close to 1
+def calculate_geometric_adaptive (n):
+  if n == 1:
+    return np.ones(1)
+  log_n = np.log(n)
+  return np.expm1(log_n/(n-1)) * np.exp(log_n*(n - author_positions(n))/(n-1)) / np.expm1(log_n*n/(n-1))
+
+#4.1  Harmonic credit alocation based on the standard schema: 1/r for each position, normalized by 1/1 + 1/2 + 1/3 +...1/N
+def calculate_harmonic_standard (n):
+  credits = 1 / author_positions(n)
+  return credits / credits.sum()
+
+#4.2  TRUE Harmonic parabolic credit alocation based on the correct formula for the harmonic parabolic schema that I came up with since Sundlin 2023 is neither harmonic nor parabolic.
+def calculate_harmonic_parabolic (n):
+  i = author_positions(n)
+  credits = 1 / np.minimum(i, n + 1 - i)
+  return credits / credits.sum()
+
+#4.3  Harmonic credit alocation with first and last author emphasis.
+#This is different from parabolic which is symmetric around the middle; here, first and last authors get more credits than in harmonic_parabolic. Normalization necessary; makes the formula simpler
+def calculate_harmonic_FLAE (n):
+  if n == 1:
+    return np.ones(1)
+  i = author_positions(n)
+  FLAE_denominator = (1 / i).sum()
+  #middle authors (positions 2..n-1) get 1/(position+1)
+  credits = 1 / (i + 1) / FLAE_denominator
+  credits[[0, -1]] = 1.5 / (2*FLAE_denominator)
+  return credits
+
+#4.4  Harmonic with last author bump (LAB): harmonic credits for all but the last author, whose un-normalized credit is the penultimate one scaled up with the author count
+def calculate_harmonic_LAB (n):
+  if n == 1:
+    return np.ones(1)
+  elif n == 2:
+    return np.array([0.5659, 0.4341])
+  credits = 1 / author_positions(n)
+  credits[-1] = credits[-2] * (((n-2)*0.5226)+0.5643)
+  return credits / credits.sum()
+
+
+
+
+#REGISTRY
+#(schema name, corpus credit column, kernel), in the order of the metric table and of the calculator pages
+SCHEMA_REGISTRY = [
+  ('fractional_equal', 'fractional_credit_EQ', calculate_fractional_equal),
+  ('fractional_LAE', 'fractional_credit_LAE', calculate_fractional_LAE),
+  ('fractional_FAE', 'fractional_credit_FAE', calculate_fractional_FAE),
+  ('fractional_FLAE', 'fractional_credit_FLAE', calculate_fractional_FLAE),
+  ('arithmetic_standard', 'arithmetic_credit', calculate_arithmetic),
+  ('arithmetic_V', 'arithmetic_credit_V', calculate_arithmetic_V),
+  ('golden_share', 'golden_share_credit', calculate_golden_share),
+  ('geometric_standard', 'geometric_credit', calculate_geometric),
+  ('geometric_adaptive', 'geometric_credit_adaptive', calculate_geometric_adaptive),
+  ('harmonic_standard', 'harmonic_credit_STD', calculate_harmonic_standard),
+  ('harmonic_FLAE', 'harmonic_credit_FLAE', calculate_harmonic_FLAE),
+  ('harmonic_parabolic', 'harmonic_credit_PAR', calculate_harmonic_parabolic),
+  ('harmonic_LAB', 'harmonic_lab_credit', calculate_harmonic_LAB)
+  ]
+SCHEMA_NAMES = [name for name, _, _ in SCHEMA_REGISTRY]
+SCHEMA_KERNELS = {name: kernel for name, _, kernel in SCHEMA_REGISTRY}
+
+#(corpus credit column, scids_df sum column) for every allocation schema
+CREDIT_COLUMN_PAIRS = [(credit_column, name) for name, credit_column, _ in SCHEMA_REGISTRY]
+
+
+
+#CREDIT TABLE
+#The credits of a schema for an author count, computed on first use and shared by the calculator pages and the corpus pipeline, which read them instead of
+#re-running the formulas. Any author count, hyperauthored papers included, takes the same path, and a corpus only has a few hundred distinct counts. The
+#least recently used vectors are dropped beyond CREDIT_TABLE_MAX_MB per process (every shard worker has its own table): e.g. the 13 schemas of every count
+#1..1000 take 52 MB, and those of one paper of 5,000 authors 0.5 MB
+CREDIT_TABLE_MAX_MB = float(os.environ.get('AUTHORMETRIX_CREDIT_TABLE_MAX_MB', 64))
+#Largest author count of the calculator pages
+CALCULATOR_MAX_AUTHORS = int(os.environ.get('AUTHORMETRIX_CALCULATOR_MAX_AUTHORS', 1000))
+
+class CreditTable:
+  def __init__ (self, max_bytes = CREDIT_TABLE_MAX_MB * 1024**2):
+    self.max_bytes = max_bytes
+    self.entries = OrderedDict() #(schema name, author count) -> credits, least recently used first
+    self.total_bytes = 0
+    self.lock = threading.Lock() #the table is shared by all sessions and job threads
+
+  #The credits of positions 1..n under the schema; the array is shared with the other callers, so it is read-only
+  def credits (self, schema_name, n):
+    key = (schema_name, int(n))
+    if key[1] < 1:
+      raise ValueError(f'author count {n} is not positive')
+    with self.lock:
+      if key in self.entries:
+        self.entries.move_to_end(key)
+        return self.entries[key]
+    credits = SCHEMA_KERNELS[schema_name](key[1])
+    credits.flags.writeable = False
+    with self.lock:
+      if key not in self.entries:
+        self.entries[key] = credits
+        self.total_bytes += credits.nbytes
+        #The vector just added is kept even when it is larger than the whole cap
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+          _, evicted = self.entries.popitem(last=False)
+          self.total_bytes -= evicted.nbytes
+      return self.entries[key]
+
+  #Credits of all schemas for author count n, one column per schema
+  def allocations (self, n, schema_names = SCHEMA_NAMES):
+    df = pd.DataFrame ({'author': np.arange(1, n + 1)})
+    for schema_name in schema_names:
+      df[schema_name] = self.credits(schema_name, n)
+    return df
+
+credit_table = None
+credit_table_lock = threading.Lock()
+
+def get_credit_table ():
+  global credit_table
+  with credit_table_lock:
+    if credit_table is None:
+      credit_table = CreditTable()
+  return credit_table
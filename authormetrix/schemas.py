@@ -0,0 +1,84 @@
+#The non-inflationary credit-allocation schemas, expanded onto the authorships of a corpus
+import numpy as np
+
+from .registry import SCHEMA_REGISTRY, get_credit_table
+from .instrumentation import run_stage
+
+
+
+#SCHEMA WEIGHT TABLE
+#A schema's credit vector depends only on the number of authors, and a corpus has only a few hundred distinct author counts. The vectors are read from
+#the registry's credit table (computed once per author count, hyperauthored papers included); every authorship's credit is then looked up by offset
+def schema_weight_table (schema_name, authorcounts):
+  credit_table = get_credit_table()
+  return {n: credit_table.credits(schema_name, n) for n in authorcounts}
+
+#Lays the weight table out as one flat array (vectors of the distinct author counts back to back), then picks each authorship's credit by offset + position
+def map_schema_weights (corpus, schema_name):
+  authorcounts = np.unique(corpus.docs['authorcount'].to_numpy())
+  if len(authorcounts) == 0:
+    return np.zeros(0, dtype=np.float64)
+  weight_table = schema_weight_table(schema_name, authorcounts)
+  flat_table = np.concatenate([weight_table[n] for n in authorcounts])
+  table_offsets = np.cumsum(authorcounts) - authorcounts
+  authorship_count = np.repeat(corpus.docs['authorcount'].to_numpy(), corpus.docs['authorcount'].to_numpy())
+  return flat_table[table_offsets[np.searchsorted(authorcounts, authorship_count)] + corpus.position - 1]
+
+
+
+#CORPUS FUNCTION 2: FRACTIONAL CREDIT SCHEMAS
+#Adds the 4 types of fractional credit allocation schema to the corpus
+def calculate_3_fractional_credit_schemes (corpus):
+  corpus.credits['fractional_credit_EQ'] = map_schema_weights(corpus, 'fractional_equal')
+  corpus.credits['fractional_credit_LAE'] = map_schema_weights(corpus, 'fractional_LAE')
+  corpus.credits['fractional_credit_FAE'] = map_schema_weights(corpus, 'fractional_FAE')
+  corpus.credits['fractional_credit_FLAE'] = map_schema_weights(corpus, 'fractional_FLAE')
+  return corpus
+
+#CORPUS FUNCTION 3 : HARMONIC CREDIT SCHEMAS
+#Adds the 3 types of harmonic credit allocation schema, and arithmetic_V, to the corpus
+def calculate_3_harmonic_credit_schemes (corpus):
+  corpus.credits['harmonic_credit_STD'] = map_schema_weights(corpus, 'harmonic_standard')
+  corpus.credits['harmonic_credit_PAR'] = map_schema_weights(corpus, 'harmonic_parabolic')
+  corpus.credits['arithmetic_credit_V'] = map_schema_weights(corpus, 'arithmetic_V')
+  corpus.credits['harmonic_credit_FLAE'] = map_schema_weights(corpus, 'harmonic_FLAE')
+  return corpus
+
+#CORPUS FUNCTION 4 : ARITHMETIC AND GEOMETRIC CREDIT SCHEMAS (and harmonic_LAB)
+def calculate_arithmetic_and_geometric_credit_schemes (corpus):
+  corpus.credits['arithmetic_credit'] = map_schema_weights(corpus, 'arithmetic_standard')
+  corpus.credits['golden_share_credit'] = map_schema_weights(corpus, 'golden_share')
+  corpus.credits['geometric_credit'] = map_schema_weights(corpus, 'geometric_standard')
+  corpus.credits['geometric_credit_adaptive'] = map_schema_weights(corpus, 'geometric_adaptive')
+  corpus.credits['harmonic_lab_credit'] = map_schema_weights(corpus, 'harmonic_LAB')
+  return corpus
+
+
+
+#CORPUS FUNCTION 5 : AUTHOR IDS REPEATED ON A BYLINE
+#An ID listed twice on the same byline gets a credit at each of its positions. As in the original pipeline, the whole count and fractional_equal count
+#every occurrence, while the other schemas credit the author once per document, with the credit of their last position on the byline (the original
+#summed a dict of ID -> credit per document): the credits of the earlier occurrences are set to 0
+SCHEMAS_COUNTING_REPEATED_IDS = ['fractional_equal']
+
+def drop_repeated_author_credits (corpus):
+  keys = corpus.doc_index().astype(np.int64) * max(len(corpus.scids), 1) + corpus.author_codes
+  #The last occurrence of every (document, author) is the first one in reverse order
+  last_occurrences = len(keys) - 1 - np.unique(keys[::-1], return_index=True)[1]
+  is_repeated = np.ones(len(keys), dtype=bool)
+  is_repeated[last_occurrences] = False
+  if is_repeated.any():
+    for schema_name, credit_column, _ in SCHEMA_REGISTRY:
+      if schema_name not in SCHEMAS_COUNTING_REPEATED_IDS:
+        corpus.credits[credit_column] = np.where(is_repeated, 0.0, corpus.credits[credit_column])
+  return corpus
+
+
+
+#Final processing of the corpus with the 3 compound functions and the repeated IDs, each timed as a pipeline stage
+def expand_credit_schemes (corpus):
+  corpus = run_stage (calculate_arithmetic_and_geometric_credit_schemes, corpus)
+  corpus = run_stage (calculate_3_fractional_credit_schemes, corpus)
+  corpus = run_stage (calculate_3_harmonic_credit_schemes, corpus)
+  corpus = run_stage (drop_repeated_author_credits, corpus)
+  return corpus
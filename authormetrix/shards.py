@@ -0,0 +1,185 @@
+#Sharded map-reduce execution of the STEP 3 metrics across CPU cores
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+import pandas as pd
+import numpy as np
+
+from .corpus import Corpus, UNKNOWN_AUTHOR
+from .registry import CREDIT_COLUMN_PAIRS
+from .metrics import (AuthorIndex, LONG_BYLINE_AUTHORS, build_author_index, values_of_codes, concatenated_ranges, long_byline_masks, long_byline_union_sizes,
+                      count_short_byline_coauthors, unique_scids_table, metric_table_from_sums)
+from .instrumentation import report_rows
+
+
+
+#SHARDS
+#The authors are split into shards of consecutive codes, of about equal work. Each shard is mapped in a worker process to the partial results of its
+#authors: the additive sums (counts, schema sums, team-size sums) and the unique co-authors. The reduce step concatenates the shards and builds the table.
+#Every author belongs to exactly one shard, and within a shard the author's authorships are summed in document order, as in the serial bincounts, so
+#the floating-point sums (and the whole table) are identical to the serial path. Row-range or year shards would instead have to add partial sums in
+#another order, and to ship and merge the co-author sets of every author.
+#Number of worker processes (1 runs the serial path in this process), and shards per worker so that uneven shards still keep every worker busy
+PIPELINE_WORKERS = int(os.environ.get('AUTHORMETRIX_PIPELINE_WORKERS', 1))
+SHARDS_PER_WORKER = 4
+
+#What the map tasks read: the corpus, its author index, and its authorships in (author code, document) order (the authorships of the author with code
+#k are authorship_order[authorship_offsets[k]:authorship_offsets[k+1]]). doc_mask (optional) restricts the co-author counts to a selection of documents
+@dataclass
+class ShardInputs:
+  corpus: Corpus
+  author_index: AuthorIndex
+  authorship_order: np.ndarray
+  authorship_offsets: np.ndarray
+  doc_mask: np.ndarray = None
+
+def build_shard_inputs (corpus, author_index = None, doc_mask = None):
+  if author_index is None:
+    author_index = build_author_index(corpus)
+  authorship_order = np.argsort(corpus.author_codes, kind='stable')
+  authorship_offsets = np.concatenate(([0], np.cumsum(np.bincount(corpus.author_codes, minlength=len(corpus.scids))))).astype(np.int64)
+  return ShardInputs(corpus = corpus, author_index = author_index, authorship_order = authorship_order, authorship_offsets = authorship_offsets,
+                     doc_mask = doc_mask)
+
+#Splits the (sorted) author codes into at most number_of_shards runs of consecutive codes, of about equal total weight
+def author_shards (codes, weights, number_of_shards):
+  if len(codes) == 0 or number_of_shards <= 1:
+    return [codes]
+  cumulative = np.cumsum(weights)
+  bounds = np.unique(np.searchsorted(cumulative, cumulative[-1] * np.arange(1, number_of_shards) / number_of_shards, 'right'))
+  return [shard for shard in np.split(codes, bounds) if len(shard)]
+
+
+
+#MAP
+#Additive sums of the authors of one shard (sorted codes), aligned with the codes
+def shard_author_sums (inputs, codes):
+  corpus, author_index = inputs.corpus, inputs.author_index
+  authorcounts = np.diff(corpus.doc_offsets)
+  authorships = inputs.authorship_order[concatenated_ranges(inputs.authorship_offsets[codes], inputs.authorship_offsets[codes + 1])]
+  owners = np.repeat(np.arange(len(codes)), inputs.authorship_offsets[codes + 1] - inputs.authorship_offsets[codes])
+  docs = np.searchsorted(corpus.doc_offsets, authorships, 'right') - 1
+  is_first = authorships == corpus.doc_offsets[docs]
+  is_last = (authorships == corpus.doc_offsets[docs + 1] - 1) & (authorcounts[docs] != 1)
+  sums = {'whole_fullcount': np.bincount(owners, minlength=len(codes)),
+          'straight_firstauthor': np.bincount(owners[is_first], minlength=len(codes)),
+          'straight_lastauthor': np.bincount(owners[is_last], minlength=len(codes)),
+          'single_author_publications': np.bincount(owners[is_first & (authorcounts[docs] == 1)], minlength=len(codes))}
+  #Weighted bincounts of an empty shard come out as integers; the casts keep the float columns of the serial path
+  for allocation_col, sum_col in CREDIT_COLUMN_PAIRS:
+    sums[sum_col] = np.bincount(owners, weights=corpus.credits[allocation_col][authorships], minlength=len(codes)).astype(np.float64, copy=False)
+
+  #The collaboration index sums are over the author's distinct multi-author documents, from the author index
+  index_docs = author_index.doc_rows[concatenated_ranges(author_index.offsets[codes], author_index.offsets[codes + 1])]
+  index_owners = np.repeat(np.arange(len(codes)), author_index.offsets[codes + 1] - author_index.offsets[codes])
+  multi_author = authorcounts[index_docs] > 1
+  sums['multi_author_documents'] = np.bincount(index_owners[multi_author], minlength=len(codes))
+  sums['multi_author_authorcounts'] = np.bincount(index_owners[multi_author], weights=authorcounts[index_docs[multi_author]],
+                                                  minlength=len(codes)).astype(np.float64, copy=False)
+  return sums
+
+#Unique co-authors of the authors of one shard, as in count_all_unique_coauthors but from the shard's own documents only: the (author, co-author)
+#pairs of its short-byline documents, and the long-byline documents its authors are on
+def shard_unique_coauthors (inputs, codes):
+  corpus, author_index = inputs.corpus, inputs.author_index
+  authorcounts = np.diff(corpus.doc_offsets)
+  index_docs = author_index.doc_rows[concatenated_ranges(author_index.offsets[codes], author_index.offsets[codes + 1])]
+  index_owners = np.repeat(codes.astype(np.int64), author_index.offsets[codes + 1] - author_index.offsets[codes])
+  if inputs.doc_mask is not None:
+    selected = inputs.doc_mask[index_docs]
+    index_docs, index_owners = index_docs[selected], index_owners[selected]
+  long_byline = authorcounts[index_docs] > LONG_BYLINE_AUTHORS
+  long_docs = np.unique(index_docs[long_byline])
+  long_codes = corpus.author_codes[corpus.authorships_of(long_docs)]
+  long_numbers = np.repeat(np.arange(len(long_docs)), authorcounts[long_docs])
+  long_masks = long_byline_masks(len(corpus.scids), long_codes, long_numbers)
+  long_byline_coauthors = long_byline_union_sizes(long_codes, long_numbers, long_masks, codes)
+  short_docs, short_owners = index_docs[~long_byline], index_owners[~long_byline]
+  partners = corpus.author_codes[corpus.authorships_of(short_docs)]
+  pair_keys = np.unique((np.repeat(short_owners, authorcounts[short_docs]) << 32) | partners)
+  short_byline_coauthors = count_short_byline_coauthors(pair_keys, long_masks)
+  #The author is part of the unique set, hence the -1
+  return {'number_of_unique_COauthors': np.maximum(long_byline_coauthors[codes] + short_byline_coauthors[codes] - 1, 0)}
+
+SHARD_MAPS = {'sums': shard_author_sums, 'coauthors': shard_unique_coauthors}
+
+#Inputs of the map tasks in a worker process, set once per pool by its initializer (inherited without a copy where processes are forked)
+worker_inputs = {}
+
+def set_worker_inputs (inputs):
+  worker_inputs['inputs'] = inputs
+
+def map_author_shard (codes, parts, inputs = None):
+  inputs = inputs or worker_inputs['inputs']
+  results = {}
+  for part in parts:
+    results.update(SHARD_MAPS[part](inputs, codes))
+  return results
+
+
+
+#REDUCE
+#Runs the map over the shards of the given (sorted) author codes, in worker processes or, with workers <= 1, in this process, and concatenates the
+#shards' results: metric -> array aligned with codes
+def run_author_shards (inputs, codes, parts, workers = PIPELINE_WORKERS, number_of_shards = None):
+  codes = np.asarray(codes, dtype=np.int64)
+  if number_of_shards is None:
+    number_of_shards = workers * SHARDS_PER_WORKER if workers > 1 else 1
+  weights = inputs.authorship_offsets[codes + 1] - inputs.authorship_offsets[codes] + 1
+  shards = author_shards(codes, weights, number_of_shards)
+  if workers > 1 and len(shards) > 1:
+    with ProcessPoolExecutor(max_workers=min(workers, len(shards)), initializer=set_worker_inputs, initargs=(inputs,)) as executor:
+      try:
+        results = report_shards(executor.map(map_author_shard, shards, [parts] * len(shards)), shards)
+      except BaseException:
+        #A cancelled job (see instrumentation.report_rows) does not wait for the shards that have not started
+        executor.shutdown(cancel_futures=True)
+        raise
+  else:
+    results = report_shards((map_author_shard(shard, parts, inputs) for shard in shards), shards)
+  return {metric: np.concatenate([result[metric] for result in results]) for metric in results[0]}
+
+#Collects the results of the shards in order, reporting the authors done after each shard
+def report_shards (results, shards):
+  collected, rows_done, rows_total = [], 0, sum(len(shard) for shard in shards)
+  report_rows(rows_done, rows_total)
+  for result, shard in zip(results, shards):
+    collected.append(result)
+    rows_done += len(shard)
+    report_rows(rows_done, rows_total)
+  return collected
+
+#Results of the map for any author codes (unsorted, repeated, or UNKNOWN_AUTHOR, which gets zeros), aligned with codes
+def author_results (inputs, codes, parts, workers = PIPELINE_WORKERS, number_of_shards = None):
+  known = codes != UNKNOWN_AUTHOR
+  shard_codes = np.unique(codes[known])
+  results = run_author_shards(inputs, shard_codes, parts, workers, number_of_shards)
+  rows = np.full(len(codes), UNKNOWN_AUTHOR, dtype=np.int64)
+  rows[known] = np.searchsorted(shard_codes, codes[known])
+  return {metric: values_of_codes(values, rows) for metric, values in results.items()}
+
+#Full STEP 3 metric table for the IDs in the first column of scids_df (or for every author of the corpus if scids_df is None), computed shard by shard.
+#Same table as compute_author_metrics (or compute_all_author_metrics), from a corpus with its credit schemas expanded
+def compute_author_metrics_sharded (corpus, scids_df = None, workers = PIPELINE_WORKERS, number_of_shards = None):
+  inputs = build_shard_inputs(corpus)
+  if scids_df is None:
+    scids_df = pd.DataFrame({'scids': corpus.scids[np.diff(inputs.authorship_offsets) > 0]})
+  scids_df = unique_scids_table(scids_df)
+  #IDs that are not in the corpus get zeros
+  codes = corpus.encode_author_ids(scids_df['scids'].to_numpy()).astype(np.int64)
+  results = author_results(inputs, codes, ('sums', 'coauthors'), workers, number_of_shards)
+  number_of_unique_COauthors = results.pop('number_of_unique_COauthors')
+  scids_df = metric_table_from_sums(scids_df, results)
+  scids_df['number_of_unique_COauthors'] = number_of_unique_COauthors
+  return scids_df
+
+#Unique co-authors of every author of the index (aligned with author_index.scids) on the selected documents, computed shard by shard; same result as
+#count_all_unique_coauthors
+def count_all_unique_coauthors_sharded (corpus, author_index, doc_mask = None, workers = PIPELINE_WORKERS, number_of_shards = None):
+  inputs = build_shard_inputs(corpus, author_index, doc_mask)
+  codes = np.flatnonzero(np.diff(author_index.offsets))
+  results = run_author_shards(inputs, codes, ('coauthors',), workers, number_of_shards)
+  number_of_unique_COauthors = np.zeros(len(author_index.scids), dtype=np.int64)
+  number_of_unique_COauthors[codes] = results['number_of_unique_COauthors']
+  return number_of_unique_COauthors
@@ -0,0 +1,87 @@
+#Author x year metric tables: the yearly trajectory of every schema, with the yearly straight counts and collaboration metrics, optionally over a
+#trailing window of years
+from dataclasses import replace
+
+import pandas as pd
+import numpy as np
+
+from .corpus import Corpus, UNKNOWN_AUTHOR
+from .metrics import unique_scids_table, metric_table_from_sums
+from .shards import PIPELINE_WORKERS, SHARDS_PER_WORKER, build_shard_inputs, author_results
+
+
+
+#AUTHOR-YEAR CELLS
+#Every authorship is re-coded by its (author, publication year) cell, and the STEP 3 sums and unique co-authors are computed per cell by the map
+#functions of the sharded pipeline: one grouped aggregation over the flat authorship arrays instead of one filtered run per year. Co-authors are always
+#on the same document, hence in the same cell year, so the unique co-authors of a cell are exact as well. The cells are numbered year by year, so that
+#the shards of consecutive cells cover one or two years each, and the long-byline bitsets of a shard only span the documents of those years
+
+#Copy of the corpus in which every document counts in the `window` years starting with its publication year (up to last_year), so that grouping by
+#year gives trailing-window totals; a window of 1 returns the corpus itself
+def windowed_corpus (corpus, window, last_year):
+  if window <= 1:
+    return corpus
+  years = corpus.docs['Year'].to_numpy()
+  doc_rows = np.repeat(np.arange(len(corpus)), window)
+  lags = np.tile(np.arange(window), len(corpus))
+  keep = years[doc_rows] + lags <= last_year
+  doc_rows, lags = doc_rows[keep], lags[keep]
+  authorcounts = np.diff(corpus.doc_offsets)[doc_rows]
+  authorships = corpus.authorships_of(doc_rows)
+  return Corpus(docs = pd.DataFrame({'Year': years[doc_rows] + lags, 'authorcount': authorcounts}),
+                doc_offsets = np.concatenate(([0], np.cumsum(authorcounts))).astype(np.int64),
+                scids = corpus.scids,
+                author_codes = corpus.author_codes[authorships],
+                position = corpus.position[authorships],
+                credits = {column: credit[authorships] for column, credit in corpus.credits.items()})
+
+#The corpus with every authorship coded by its (author, year) cell; its 'scids' are the keys ((year - first_year) * number of authors + author code) of
+#the non-empty cells, sorted
+def author_year_corpus (corpus, first_year):
+  year_offsets = corpus.docs['Year'].to_numpy().astype(np.int64) - first_year
+  keys = np.repeat(year_offsets, np.diff(corpus.doc_offsets)) * len(corpus.scids) + corpus.author_codes
+  cell_keys, cell_codes = np.unique(keys, return_inverse=True)
+  return replace(corpus, scids = cell_keys, author_codes = cell_codes.astype(np.int32))
+
+#Author x year STEP 3 table for the IDs in the first column of scids_df (or every author of the corpus if scids_df is None), from a corpus with its
+#credit schemas expanded and restricted to the selected document types and years. Each row covers the documents of one year, or with window > 1 those
+#of that year and the window - 1 years before it (fewer at the start of the corpus). With all_years, every author gets a row for every year from the
+#first to the last year of the corpus, zeros included; otherwise only the (author, year) rows with documents are listed
+def compute_author_year_metrics (corpus, scids_df = None, window = 1, all_years = True, workers = PIPELINE_WORKERS):
+  if scids_df is None:
+    scids_df = pd.DataFrame({'scids': corpus.scids[np.bincount(corpus.author_codes, minlength=len(corpus.scids)) > 0]})
+  scids_df = unique_scids_table(scids_df)
+  years = corpus.docs['Year'].to_numpy()
+  first_year, last_year = (int(years.min()), int(years.max())) if len(years) else (0, 0)
+  number_of_years, number_of_authors = last_year - first_year + 1, max(len(corpus.scids), 1)
+  year_corpus = author_year_corpus(windowed_corpus(corpus, window, last_year), first_year)
+  codes = corpus.encode_author_ids(scids_df['scids'].to_numpy()).astype(np.int64)
+
+  #Requested author (row of scids_df) and year of every row of the table, and the code of its cell (UNKNOWN_AUTHOR for empty cells)
+  if all_years:
+    rows = np.repeat(np.arange(len(scids_df)), number_of_years)
+    row_years = np.tile(np.arange(number_of_years), len(scids_df))
+    cell_codes = year_corpus.encode_author_ids(row_years * number_of_authors + codes[rows]).astype(np.int64)
+    cell_codes[codes[rows] == UNKNOWN_AUTHOR] = UNKNOWN_AUTHOR
+  else:
+    known = codes != UNKNOWN_AUTHOR
+    row_of_code = np.full(number_of_authors, -1, dtype=np.int64)
+    row_of_code[codes[known]] = np.flatnonzero(known)
+    cell_rows = row_of_code[year_corpus.scids % number_of_authors]
+    cell_codes = np.flatnonzero(cell_rows >= 0)
+    cell_codes = cell_codes[np.argsort(cell_rows[cell_codes], kind='stable')]
+    rows = cell_rows[cell_codes]
+    row_years = year_corpus.scids[cell_codes] // number_of_authors
+
+  table = scids_df.iloc[rows].reset_index(drop=True)
+  table.insert(1, 'Year', first_year + row_years)
+  if window > 1:
+    table.insert(1, 'window_start', np.maximum(table['Year'] - window + 1, first_year))
+  #At least one shard per year (see above), also when the shards run in this process
+  results = author_results(build_shard_inputs(year_corpus), cell_codes, ('sums', 'coauthors'), workers,
+                           max(number_of_years, workers * SHARDS_PER_WORKER))
+  number_of_unique_COauthors = results.pop('number_of_unique_COauthors')
+  table = metric_table_from_sums(table, results)
+  table['number_of_unique_COauthors'] = number_of_unique_COauthors
+  return table
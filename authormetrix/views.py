@@ -0,0 +1,34 @@
+#Server-side views of the result tables: sorting and pagination, so that the app only sends one page of rows to the browser whatever the size of a table,
+#and the download files of a table, serialized once per result (the app keeps them in the pipeline cache)
+import io
+
+import numpy as np
+
+
+
+#PAGES
+VIEW_PAGE_SIZES = [25, 100, 500]
+
+#Row positions of the table sorted by one column (stable, missing values last), or in its own order if column is None
+def sorted_rows (table, column = None, ascending = True):
+  if column is None:
+    return np.arange(len(table))
+  return table[column].reset_index(drop=True).sort_values(ascending=ascending, kind='stable', na_position='last').index.to_numpy()
+
+def number_of_pages (number_of_rows, page_size):
+  return max(1, -(-number_of_rows // page_size))
+
+#Positions of the rows of one page (page 1 is the first), from the sorted row positions
+def page_rows (rows, page, page_size):
+  return rows[(page - 1) * page_size:page * page_size]
+
+
+
+#DOWNLOADS
+def table_csv (table):
+  return table.to_csv(index=False).encode('utf-8')
+
+def table_parquet (table):
+  buffer = io.BytesIO()
+  table.to_parquet(buffer, index=False)
+  return buffer.getvalue()
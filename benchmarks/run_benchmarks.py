@@ -0,0 +1,113 @@
+#Stage-level benchmarks of the metric pipeline: wall time and peak memory of every stage, written as JSON so that versions can be compared
+#Usage: python -m benchmarks.run_benchmarks --rows 1000 10000 100000 --output bench_results.json
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import authormetrix as am
+from authormetrix.instrumentation import reset_peak_memory, read_peak_memory_mb, read_resident_memory_mb
+from .synthetic_corpus import generate_corpus, generate_scopus_ids
+
+
+
+#Each stage is (name, function of the shared state); a stage's output is stored in the state for the following stages
+def pipeline_stages (corpus_path, scids_df):
+  return [
+    ('corpus_preprocess', lambda state: am.corpus_preprocess(corpus_path)[0]),
+    ('calculate_arithmetic_and_geometric_credit_schemes', lambda state: am.calculate_arithmetic_and_geometric_credit_schemes(state['corpus'])),
+    ('calculate_3_fractional_credit_schemes', lambda state: am.calculate_3_fractional_credit_schemes(state['corpus'])),
+    ('calculate_3_harmonic_credit_schemes', lambda state: am.calculate_3_harmonic_credit_schemes(state['corpus'])),
+    ('drop_repeated_author_credits', lambda state: am.drop_repeated_author_credits(state['corpus'])),
+    ('extract_whole_and_straight_counts', lambda state: am.extract_whole_and_straight_counts(state['corpus'], scids_df.rename(columns={scids_df.columns[0]: 'ID'}))),
+    ('Multiplex_extract_allocation_sum', lambda state: am.Multiplex_extract_allocation_sum(state['corpus'], state['scids_df'], am.CREDIT_COLUMN_PAIRS)),
+    ('count_one_author_publications', lambda state: am.count_one_author_publications(state['corpus'], state['scids_df'].copy())),
+    ('build_author_index', lambda state: am.build_author_index(state['corpus'])),
+    ('calculate_collaborations_DC_CI_CC', lambda state: am.calculate_collaborations_DC_CI_CC(state['corpus'], state['scids_df'].copy(), state['author_index'])),
+    ('find_unique_coauthors', lambda state: am.find_unique_coauthors(state['corpus'], state['scids_df'].copy(), state['author_index'])),
+    ('build_credit_cube', lambda state: am.build_credit_cube(state['corpus'], state['author_index'])),
+    ('compute_author_metrics_from_cube', lambda state: am.compute_author_metrics_from_cube(state['cube'], scids_df)),
+    ('compute_all_author_metrics', lambda state: am.compute_all_author_metrics(state['cube'])),
+    ('build_coauthorship_graph', lambda state: am.build_coauthorship_graph(state['corpus'])),
+    ('coauthorship_metrics', lambda state: am.coauthorship_metrics(state['graph'], scids_df)),
+  ]
+
+#Which state entry a stage's output replaces
+STAGE_OUTPUTS = {'corpus_preprocess': 'corpus', 'calculate_arithmetic_and_geometric_credit_schemes': 'corpus', 'calculate_3_fractional_credit_schemes': 'corpus',
+                 'calculate_3_harmonic_credit_schemes': 'corpus', 'drop_repeated_author_credits': 'corpus', 'extract_whole_and_straight_counts': 'scids_df', 'Multiplex_extract_allocation_sum': 'scids_df',
+                 'count_one_author_publications': 'scids_df', 'build_author_index': 'author_index', 'calculate_collaborations_DC_CI_CC': 'scids_df',
+                 'build_credit_cube': 'cube', 'build_coauthorship_graph': 'graph'}
+
+def output_rows (value):
+  return len(value) if hasattr(value, '__len__') else len(value.scids)
+
+def benchmark_stages (corpus_path, scids_df, repeat = 3):
+  results = {}
+  state = {}
+  for name, stage in pipeline_stages(corpus_path, scids_df):
+    input_rows = len(state['corpus']) if 'corpus' in state else None
+    #Wall time is the best of `repeat` runs. Peak memory is the resident memory (VmHWM, as in the pipeline's stage records) of the process during the
+    #first run, so it includes the NumPy and Arrow buffers that Python's allocator tracing does not see; memory_increase_mb is that peak over the
+    #resident memory before the stage. Both are None where /proc is not available
+    seconds, peak_mb, increase_mb = [], None, None
+    for run in range(repeat):
+      resident_mb = read_resident_memory_mb() if run == 0 and reset_peak_memory() else None
+      start = time.perf_counter()
+      output = stage(state)
+      seconds.append(time.perf_counter() - start)
+      if resident_mb is not None:
+        peak_mb = read_peak_memory_mb()
+        increase_mb = round(peak_mb - resident_mb, 1)
+        peak_mb = round(peak_mb, 1)
+    results[name] = {'seconds': round(min(seconds), 6), 'peak_memory_mb': peak_mb, 'memory_increase_mb': increase_mb, 'input_rows': input_rows,
+                     'output_rows': output_rows(output)}
+    if name in STAGE_OUTPUTS:
+      state[STAGE_OUTPUTS[name]] = output
+  return results
+
+def format_mb (value, sign = ''):
+  return f'{"n/a":>10} MB' if value is None else f'{value:>{sign}10.1f} MB'
+
+def git_revision ():
+  try:
+    return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+  except (OSError, subprocess.CalledProcessError):
+    return None
+
+
+
+def main (argv = None):
+  parser = argparse.ArgumentParser(prog='python -m benchmarks.run_benchmarks', description='Times every pipeline stage on synthetic Scopus corpora of the given sizes.')
+  parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 100000], help='corpus sizes (distinct documents) to benchmark')
+  parser.add_argument('--ids', type=int, default=2000, help='number of Scopus IDs analysed')
+  parser.add_argument('--repeat', type=int, default=3, help='timed runs per stage (the best one is reported)')
+  parser.add_argument('--seed', type=int, default=0)
+  parser.add_argument('--output', default='bench_results.json')
+  args = parser.parse_args(argv)
+
+  report = {'revision': git_revision(), 'python': platform.python_version(), 'numpy': np.__version__, 'pandas': pd.__version__,
+            'ids': args.ids, 'repeat': args.repeat, 'runs': []}
+  with tempfile.TemporaryDirectory() as temp_dir:
+    for rows in args.rows:
+      corpus, pool = generate_corpus(rows, seed=args.seed)
+      corpus_path = os.path.join(temp_dir, f'corpus_{rows}.csv')
+      corpus.to_csv(corpus_path, index=False)
+      scids_df = generate_scopus_ids(pool, args.ids, seed=args.seed)
+      stages = benchmark_stages(corpus_path, scids_df, args.repeat)
+      report['runs'].append({'rows': rows, 'csv_rows': len(corpus), 'stages': stages})
+      for name, result in stages.items():
+        print(f"{rows:>9} rows  {name:<52} {result['seconds']:>10.4f} s {format_mb(result['peak_memory_mb'])} peak {format_mb(result['memory_increase_mb'], '+')}")
+
+  with open(args.output, 'w') as f:
+    json.dump(report, f, indent=2)
+  print(f'Results written to {args.output}')
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,95 @@
+#Synthetic Scopus-format corpus (and list of Scopus IDs) for benchmarking the pipeline
+#Usage: python -m benchmarks.synthetic_corpus --rows 100000 --output corpus_100k.csv
+import argparse
+
+import numpy as np
+import pandas as pd
+
+
+
+DOCUMENT_TYPES = ['Article', 'Review', 'Letter', 'Editorial', 'Conference Paper', 'Note']
+DOCUMENT_TYPE_SHARES = [0.70, 0.12, 0.06, 0.05, 0.05, 0.02]
+
+#Author counts: most papers have a handful of authors (lognormal body), with a small share of hyperauthored papers (consortia, particle physics) of 1,000+ authors
+def sample_authorcounts (rng, rows, hyperauthored_share = 0.001):
+  authorcounts = np.maximum(1, np.round(rng.lognormal(mean=1.5, sigma=0.7, size=rows))).astype(np.int64)
+  hyperauthored = rng.random(rows) < hyperauthored_share
+  authorcounts[hyperauthored] = rng.integers(1000, 5001, size=hyperauthored.sum())
+  return authorcounts
+
+#Scopus-like author IDs, with a skewed (Zipf-like) productivity so that some authors appear on many papers. The authors of a document are distinct, as on a
+#real byline: a draw that repeats an ID of its document is drawn again, until no document has a repeated ID (pool_size must exceed every author count)
+def sample_author_ids (rng, authorcounts, pool_size):
+  pool = rng.permutation(np.unique(rng.integers(7000000000, 58000000000, size=pool_size + pool_size // 100 + 10)))[:pool_size]
+  weights = 1 / np.arange(1, len(pool) + 1) ** 0.8
+  weights /= weights.sum()
+  doc_of = np.repeat(np.arange(len(authorcounts), dtype=np.int64), authorcounts)
+  draws = rng.choice(len(pool), size=len(doc_of), p=weights)
+  #Only the documents that still have a repeated ID are checked again
+  positions = np.arange(len(draws))
+  while len(positions):
+    keys = doc_of[positions] * len(pool) + draws[positions]
+    order = np.argsort(keys, kind='stable')
+    is_repeat = np.zeros(len(positions), dtype=bool)
+    is_repeat[order[1:]] = keys[order[1:]] == keys[order[:-1]]
+    draws[positions[is_repeat]] = rng.choice(len(pool), size=int(is_repeat.sum()), p=weights)
+    positions = positions[np.isin(doc_of[positions], doc_of[positions[is_repeat]])]
+  return pool[draws], pool
+
+def generate_corpus (rows, seed = 0, duplicate_share = 0.02, missing_id_share = 0.01, hyperauthored_share = 0.001, with_abstracts = False,
+                     missing_names_share = 0.005):
+  rng = np.random.default_rng(seed)
+  authorcounts = sample_authorcounts(rng, rows, hyperauthored_share)
+  author_ids, pool = sample_author_ids(rng, authorcounts, pool_size=max(1000, rows * 2, int(authorcounts.max()) * 2))
+  id_lists = np.split(author_ids.astype(str), np.cumsum(authorcounts)[:-1])
+
+  corpus = pd.DataFrame({
+    'Authors': ['; '.join(f'Author{ID[-6:]} A.' for ID in ids) for ids in id_lists],
+    'Author full names': ['; '.join(f'Author{ID[-6:]}, A. ({ID})' for ID in ids) for ids in id_lists],
+    'Author(s) ID': ['; '.join(ids) for ids in id_lists],
+    'Title': [f'Synthetic document {i}' for i in range(rows)],
+    'Year': rng.integers(2005, 2025, size=rows),
+    'Source title': [f'Journal {j}' for j in rng.integers(0, max(10, rows // 200), size=rows)],
+    'Cited by': rng.poisson(10, size=rows),
+    'Document Type': rng.choice(DOCUMENT_TYPES, size=rows, p=DOCUMENT_TYPE_SHARES),
+    'EID': [f'2-s2.0-{85000000000 + i}' for i in range(rows)],
+  })
+  if with_abstracts:
+    corpus['Abstract'] = 'Synthetic abstract. ' * 60
+    corpus['References'] = 'Synthetic reference; ' * 40
+
+  #Exact duplicate records (as when overlapping exports are combined), then records without Author(s) ID, and records without Author full names (which
+  #are kept, without the check of their number of IDs)
+  duplicates = corpus.iloc[rng.choice(rows, size=int(rows * duplicate_share), replace=False)]
+  corpus = pd.concat([corpus, duplicates]).sample(frac=1, random_state=seed).reset_index(drop=True)
+  corpus.loc[rng.random(len(corpus)) < missing_id_share, 'Author(s) ID'] = np.nan
+  corpus.loc[rng.random(len(corpus)) < missing_names_share, 'Author full names'] = np.nan
+  return corpus, pool
+
+#IDs to analyse: mostly authors from the corpus, plus a few IDs that do not appear in it
+def generate_scopus_ids (pool, number_of_ids, seed = 0, unknown_share = 0.05):
+  rng = np.random.default_rng(seed)
+  known = rng.choice(pool[:max(number_of_ids * 4, 1)], size=min(number_of_ids, len(pool)), replace=False)
+  unknown = rng.integers(1000000, 2000000, size=int(number_of_ids * unknown_share))
+  return pd.DataFrame({'Scopus ID': np.concatenate([known, unknown])})
+
+
+
+def main (argv = None):
+  parser = argparse.ArgumentParser(prog='python -m benchmarks.synthetic_corpus', description='Writes a synthetic Scopus-format corpus and a matching list of Scopus IDs.')
+  parser.add_argument('--rows', type=int, default=10000, help='number of distinct documents (1k to 1M)')
+  parser.add_argument('--output', default='synthetic_corpus.csv', help='corpus csv; the ID list is written next to it with an _ids suffix')
+  parser.add_argument('--ids', type=int, default=2000, help='number of Scopus IDs in the ID list')
+  parser.add_argument('--seed', type=int, default=0)
+  parser.add_argument('--with-abstracts', action='store_true', help='add long Abstract and References columns, as in full Scopus exports')
+  args = parser.parse_args(argv)
+
+  corpus, pool = generate_corpus(args.rows, seed=args.seed, with_abstracts=args.with_abstracts)
+  corpus.to_csv(args.output, index=False)
+  ids_path = args.output[:-4] + '_ids.csv' if args.output.endswith('.csv') else args.output + '_ids.csv'
+  generate_scopus_ids(pool, args.ids, seed=args.seed).to_csv(ids_path, index=False)
+  print(f'{len(corpus)} rows written to {args.output}, {args.ids} IDs to {ids_path}')
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,136 @@
+#The schema kernels of authormetrix/registry.py against the per-document formulas they replaced (copied from the Features/Main.py of AuthormetriX v1),
+#for every author count 1..MAX_AUTHORS. Credits are compared to within 1e-12 relative error; ATOL only covers the subnormal floats (below ~2.2e-308),
+#which the two round differently by up to 5e-324
+import numpy as np
+import pytest
+
+from authormetrix.registry import SCHEMA_KERNELS, SCHEMA_NAMES, CreditTable
+
+
+
+MAX_AUTHORS = 5000
+RTOL = 1e-12
+ATOL = 1e-300
+
+def original_fractional_equal (n):
+  return [1/n] * n
+
+def original_fractional_LAE (n):
+  if n == 1:
+    return [1.0]
+  return [(0.5)/(n-1) for _ in range(n-1)] + [0.5]
+
+def original_fractional_FAE (n):
+  if n == 1:
+    return [1.0]
+  return [0.5] + [(0.5)/(n-1) for _ in range(n-1)]
+
+def original_fractional_FLAE (n):
+  if n == 1:
+    return [1.0]
+  elif n == 2:
+    return [0.5, 0.5]
+  return [0.4] + [(0.2)/(n-2) for _ in range(n-2)] + [0.4]
+
+def original_arithmetic (n):
+  return [(2 * (1-((i + 1)/(n+1))))/n for i in range(n)]
+
+def original_arithmetic_V (n):
+  h_par_denominator_even = (0.5*(n**2)) + (n)
+  h_par_denominator_odd = (0.5*(n**2)) + (n*(1-(1/(2*n))))
+  if n % 2 == 0:
+    return [(1 + abs(n+1-(2*(i+1))))/h_par_denominator_even for i in range (n)]
+  return [(1 + abs(n+1-(2*(i+1))))/h_par_denominator_odd for i in range (n)]
+
+def original_golden_share (n):
+  if n == 1:
+    return [1]
+  return [0.618**(2*(i+1)-1) for i in range(n-1)] + [0.618**(2*(n)-2)]
+
+#2**(n-i)/(2**n - 1) in big integers, the costliest of the formulas; from position GEOMETRIC_POSITIONS on it is below half the smallest subnormal
+#(2**-1075), so exactly 0, and only the first positions are evaluated
+GEOMETRIC_POSITIONS = 1100
+
+def original_geometric (n):
+  denominator = (2**n) - 1
+  return [(2 ** (n-(i+1)))/denominator for i in range(min(n, GEOMETRIC_POSITIONS))] + [0.0] * max(n - GEOMETRIC_POSITIONS, 0)
+
+def original_geometric_adaptive (n):
+  if n == 1:
+    return [1.0]
+  adaptive_denominator = (n**(n/(n-1)))-1
+  return [(n**(1/(n-1))-1)*n**((n-(i+1))/(n-1))/adaptive_denominator for i in range(n)]
+
+def original_harmonic_standard (n):
+  credits_std = [1 / (i + 1) for i in range(n)]
+  total_credits_std = sum(credits_std)
+  return [credit / total_credits_std for credit in credits_std]
+
+def original_harmonic_FLAE (n):
+  if n == 1:
+    return [1.0]
+  FLAE_denominator = sum([1 / (i + 1) for i in range(n)])
+  middle_FLAE = [(1 / (i + 2))/FLAE_denominator for i in range(1, n - 1)]
+  return [1.5/(2*FLAE_denominator)] + middle_FLAE + [1.5/(2*FLAE_denominator)]
+
+def original_harmonic_parabolic (n):
+  symetrical_harmonic_credits = [1 / min((i + 1), (n+1-(i+1))) for i in range(n)]
+  total_symetrical_harmonic_credits = sum(symetrical_harmonic_credits)
+  return [credit / total_symetrical_harmonic_credits for credit in symetrical_harmonic_credits]
+
+def original_harmonic_LAB (n):
+  if n == 1:
+    return [1.0]
+  elif n == 2:
+    return [0.5659, 0.4341]
+  credits = [1 / i for i in range(1, n)]
+  credits.append(credits[-1] * (((n-2)*0.5226)+0.5643))
+  total = sum(credits)
+  return [cred / total for cred in credits]
+
+ORIGINAL_FORMULAS = {
+  'fractional_equal': original_fractional_equal,
+  'fractional_LAE': original_fractional_LAE,
+  'fractional_FAE': original_fractional_FAE,
+  'fractional_FLAE': original_fractional_FLAE,
+  'arithmetic_standard': original_arithmetic,
+  'arithmetic_V': original_arithmetic_V,
+  'golden_share': original_golden_share,
+  'geometric_standard': original_geometric,
+  'geometric_adaptive': original_geometric_adaptive,
+  'harmonic_standard': original_harmonic_standard,
+  'harmonic_FLAE': original_harmonic_FLAE,
+  'harmonic_parabolic': original_harmonic_parabolic,
+  'harmonic_LAB': original_harmonic_LAB
+  }
+
+
+
+def test_every_schema_has_its_original_formula ():
+  assert sorted(ORIGINAL_FORMULAS) == sorted(SCHEMA_NAMES)
+
+@pytest.mark.parametrize('schema_name', SCHEMA_NAMES)
+def test_kernel_matches_original_formula (schema_name):
+  kernel, original = SCHEMA_KERNELS[schema_name], ORIGINAL_FORMULAS[schema_name]
+  for n in range(1, MAX_AUTHORS + 1):
+    credits = kernel(n)
+    assert credits.dtype == np.float64 and credits.shape == (n,)
+    np.testing.assert_allclose(credits, original(n), rtol=RTOL, atol=ATOL, err_msg=f'{schema_name}, {n} authors')
+
+def test_credit_table_gives_the_kernels ():
+  credit_table = CreditTable()
+  for n in list(range(1, 51)) + [1000, 5000]:
+    for schema_name in SCHEMA_NAMES:
+      np.testing.assert_array_equal(credit_table.credits(schema_name, n), SCHEMA_KERNELS[schema_name](n))
+  assert not credit_table.credits(SCHEMA_NAMES[0], 3).flags.writeable
+  with pytest.raises(ValueError):
+    credit_table.credits(SCHEMA_NAMES[0], 0)
+
+#The least recently used vectors are dropped beyond the memory cap, keeping at least the last one
+def test_credit_table_memory_cap ():
+  credit_table = CreditTable(max_bytes = 250 * 8)
+  for n in [100, 120, 100, 130]:
+    credit_table.credits('harmonic_standard', n)
+  assert list(credit_table.entries) == [('harmonic_standard', 100), ('harmonic_standard', 130)] and credit_table.total_bytes == 230 * 8
+  credit_table.credits('geometric_standard', 5000)
+  assert list(credit_table.entries) == [('geometric_standard', 5000)]
@@ -0,0 +1,38 @@
+#The sharded STEP 3 metrics (authormetrix/shards.py) against the serial pipeline, on a synthetic corpus: the tables must be identical bit for bit, whatever
+#the number of shards and of worker processes
+import numpy as np
+import pandas as pd
+import pytest
+
+from authormetrix import (corpus_preprocess, expand_credit_schemes, compute_author_metrics, compute_author_metrics_sharded, build_author_index,
+                          document_mask, count_all_unique_coauthors, count_all_unique_coauthors_sharded)
+from benchmarks.synthetic_corpus import generate_corpus, generate_scopus_ids
+
+
+
+#(workers, number of shards); one worker runs the shards in the calling process
+SHARDINGS = [(1, None), (1, 7), (2, None), (3, 11)]
+
+@pytest.fixture(scope='module')
+def corpus_and_ids (tmp_path_factory):
+  raw_corpus, pool = generate_corpus(2000, seed=1)
+  path = tmp_path_factory.mktemp('corpus') / 'corpus.csv'
+  raw_corpus.to_csv(path, index=False)
+  corpus, _ = corpus_preprocess(str(path))
+  return expand_credit_schemes(corpus), generate_scopus_ids(pool, 300, seed=1)
+
+@pytest.mark.parametrize('workers, number_of_shards', SHARDINGS)
+def test_sharded_metrics_equal_serial (corpus_and_ids, workers, number_of_shards):
+  corpus, scids_df = corpus_and_ids
+  serial = compute_author_metrics(corpus, scids_df.copy()).reset_index(drop=True)
+  sharded = compute_author_metrics_sharded(corpus, scids_df.copy(), workers, number_of_shards)
+  pd.testing.assert_frame_equal(sharded, serial, check_exact=True)
+
+@pytest.mark.parametrize('workers, number_of_shards', SHARDINGS)
+def test_sharded_unique_coauthors_equal_serial (corpus_and_ids, workers, number_of_shards):
+  corpus, _ = corpus_and_ids
+  author_index = build_author_index(corpus)
+  for doc_mask in [None, document_mask(corpus, None, (2010, 2018))]:
+    serial = count_all_unique_coauthors(corpus, author_index, doc_mask)
+    sharded = count_all_unique_coauthors_sharded(corpus, author_index, doc_mask, workers, number_of_shards)
+    np.testing.assert_array_equal(sharded, serial)